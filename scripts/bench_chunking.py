@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for ``MarkdownAwareChunker`` on large documents.
+
+Chunks synthetic Markdown (or a given file) of increasing size and reports
+wall time, throughput and peak traced memory, so non-linear growth in either
+shows up as the size doubles.
+
+    python scripts/bench_chunking.py --sizes 1 5 20 50
+    python scripts/bench_chunking.py --file ~/kb/index/big_export.md
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from kb_agent.chunking import MarkdownAwareChunker  # noqa: E402
+
+_WORDS = ("index", "vector", "chunk", "query", "配置", "文档", "检索", "retry", "timeout", "service",
+          "deploy", "error", "用户", "接口", "cache", "token", "latency", "schema", "table", "field")
+
+
+def synthetic_markdown(size_mb: float, seed: int = 0) -> str:
+    """Sections with mostly short paragraphs, some very long ones, and a few huge header-less stretches."""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    parts = []
+    total = 0
+    while total < target:
+        roll = rng.random()
+        if roll < 0.05:
+            part = f"{'#' * rng.randint(1, 3)} {' '.join(rng.choice(_WORDS) for _ in range(4))}"
+        else:
+            words = rng.randint(10, 80) if roll < 0.9 else rng.randint(300, 1500)
+            part = " ".join(rng.choice(_WORDS) for _ in range(words))
+        parts.append(part)
+        total += len(part) + 2
+    return "\n\n".join(parts)
+
+
+def run(chunker: MarkdownAwareChunker, text: str, meta: dict):
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = chunker.chunk(text, meta)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, len(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MarkdownAwareChunker on large documents")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5, 20], help="Synthetic document sizes in MB")
+    parser.add_argument("--file", type=Path, help="Chunk this file instead of synthetic documents")
+    parser.add_argument("--max-chars", type=int, default=800)
+    parser.add_argument("--overlap-chars", type=int, default=200)
+    args = parser.parse_args()
+
+    chunker = MarkdownAwareChunker(max_chars=args.max_chars, overlap_chars=args.overlap_chars, max_tokens=0)
+    meta = {"document_title": "Benchmark", "document_summary": "Synthetic export used to time chunking."}
+
+    docs = [(str(args.file), args.file.read_text(encoding="utf-8", errors="ignore"))] if args.file else [
+        (f"{size:g} MB", synthetic_markdown(size)) for size in args.sizes
+    ]
+    for label, text in docs:
+        elapsed, peak, n = run(chunker, text, meta)
+        mb = len(text) / (1024 * 1024)
+        print(f"{label:>10}: {n:8d} chunks  {elapsed:7.2f}s  {mb / elapsed:6.1f} MB/s  peak {peak / 1024 / 1024:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
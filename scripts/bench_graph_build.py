@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Benchmark ``GraphBuilder.build_graph`` on a large source tree.
+
+Writes synthetic Jira-style Markdown files to a temp directory (or uses
+``--source``), then times a full build, a no-op rebuild (every file skipped
+by the stat pre-check) and a rebuild after editing a fraction of the files.
+
+    python scripts/bench_graph_build.py --files 100000
+    python scripts/bench_graph_build.py --files 20000 --workers 1
+    python scripts/bench_graph_build.py --source ~/kb/source
+"""
+
+import argparse
+import logging
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from kb_agent.graph.graph_builder import GraphBuilder  # noqa: E402
+
+
+def write_tree(root: Path, n: int, seed: int = 0):
+    rng = random.Random(seed)
+    for i in range(n):
+        folder = root / f"project{i % 20}" / f"batch{i // 1000}"
+        folder.mkdir(parents=True, exist_ok=True)
+        mentions = " ".join(f"[FSR-{rng.randint(1, n)}]" for _ in range(rng.randint(1, 8)))
+        (folder / f"FSR-{i}.md").write_text(
+            f"# FSR-{i}\n\nParent: [FSR-{rng.randint(1, n)}]\n\nRelated: {mentions}\n"
+            f"See [design](project{rng.randint(0, 19)}/design.md).\n" + "Lorem ipsum dolor sit amet. " * 40,
+            encoding="utf-8",
+        )
+
+
+def timed(label: str, builder: GraphBuilder):
+    start = time.perf_counter()
+    builder.build_graph()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>16}: {elapsed:7.2f}s  ({builder.store.number_of_nodes()} nodes, "
+          f"{builder.store.number_of_edges()} edges)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark knowledge graph builds")
+    parser.add_argument("--files", type=int, default=100_000, help="Synthetic Markdown files to generate")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: graph_build_workers)")
+    parser.add_argument("--edit-fraction", type=float, default=0.01, help="Share of files edited before the last rebuild")
+    parser.add_argument("--source", type=Path, help="Build from this directory instead of a synthetic tree")
+    args = parser.parse_args()
+    logging.getLogger("kb_agent").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source = args.source
+        if source is None:
+            source = tmp / "source"
+            start = time.perf_counter()
+            write_tree(source, args.files)
+            print(f"wrote {args.files} files in {time.perf_counter() - start:.1f}s")
+        index = tmp / "index"
+        index.mkdir()
+
+        timed("full build", GraphBuilder(source, index, workers=args.workers))
+        timed("no-op rebuild", GraphBuilder(source, index, workers=args.workers))
+
+        if args.source is None:
+            files = sorted(source.rglob("*.md"))
+            for path in random.Random(1).sample(files, max(1, int(len(files) * args.edit_fraction))):
+                path.write_text(path.read_text(encoding="utf-8") + "\nUpdated: [FSR-1]\n", encoding="utf-8")
+            timed("after edits", GraphBuilder(source, index, workers=args.workers))
+
+
+if __name__ == "__main__":
+    main()
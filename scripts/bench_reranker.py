@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmark the cross-encoder reranker backends: chunks/sec versus batch size.
+
+For llama.cpp, batch size 1 is the one-pair-per-evaluation loop; larger sizes
+pack several query–chunk pairs into a single evaluation (one sequence each).
+For ONNX, each batch is one padded ``InferenceSession.run``.  Scores at every
+batch size are compared with that backend's batch size 1.
+
+    python scripts/bench_reranker.py --model models/bge-reranker-v2-m3-Q4_K_M.gguf
+    python scripts/bench_reranker.py --onnx-dir models/bge-reranker-v2-m3-onnx
+    python scripts/bench_reranker.py --model ... --onnx-dir ... --chunks 40 --batch-sizes 1 4 8 16
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from kb_agent.tools.reranker import ONNXCrossEncoder, RerankClient, llama_kwargs  # noqa: E402
+
+_SENTENCES = [
+    "The payment service retries failed settlements three times before raising ERR-1042.",
+    "连接池的最大连接数由 db.pool.max_size 控制，默认值为 50。",
+    "Deployments are promoted from staging to production after the smoke tests pass.",
+    "The nightly export job writes CSV files to the archive directory.",
+    "用户登录失败超过五次后账户会被锁定三十分钟。",
+    "Cache entries expire after the configured TTL or when the source document changes.",
+]
+
+
+def make_chunks(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [{"content": " ".join(rng.choice(_SENTENCES) for _ in range(rng.randint(2, 12)))} for _ in range(n)]
+
+
+def _load_llama(model: str, batch_size: int, threads):
+    from llama_cpp import Llama
+
+    kwargs = llama_kwargs(batch_size)
+    if threads:
+        kwargs["n_threads"] = threads
+    client = RerankClient()
+    client.llm = Llama(model_path=model, **kwargs)
+    return client
+
+
+def _load_onnx(model_dir: str, batch_size: int, threads):
+    client = RerankClient()
+    client.cross_encoder = ONNXCrossEncoder(model_dir)
+    return client
+
+
+def bench(name: str, load, query: str, chunks: list, batch_sizes: list, repeat: int):
+    baseline = None
+    print(f"\n[{name}] {len(chunks)} chunks per call, {repeat} calls per batch size")
+    print(f"{'batch':>6} {'chunks/s':>10} {'ms/call':>9} {'max |Δscore|':>13}")
+    for batch_size in batch_sizes:
+        client = load(batch_size)
+        client.score(query, chunks[:2], batch_size=batch_size)  # warm up
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            scores = client.score(query, chunks, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        client.close()
+
+        if baseline is None:
+            baseline = scores
+        diff = max(abs(a - b) for a, b in zip(scores, baseline))
+        note = "" if client._batching or batch_size == 1 else "  (batching unsupported, fell back)"
+        print(f"{batch_size:>6} {len(chunks) * repeat / elapsed:>10.1f} {elapsed / repeat * 1000:>9.0f} {diff:>13.4f}{note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched reranker scoring")
+    parser.add_argument("--model", help="Path to the GGUF reranker model (llama.cpp backend)")
+    parser.add_argument("--onnx-dir", help="Directory with model.onnx + tokenizer.json (ONNX backend)")
+    parser.add_argument("--query", default="How many database connections does the payment service use?")
+    parser.add_argument("--chunks", type=int, default=20, help="Chunks per rerank call (vector_search fetches 20)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None, help="llama.cpp CPU threads")
+    args = parser.parse_args()
+    if not args.model and not args.onnx_dir:
+        parser.error("pass --model and/or --onnx-dir")
+
+    chunks = make_chunks(args.chunks)
+    if args.model:
+        bench("llama.cpp", lambda b: _load_llama(args.model, b, args.threads), args.query, chunks, args.batch_sizes, args.repeat)
+    if args.onnx_dir:
+        bench("onnx", lambda b: _load_onnx(args.onnx_dir, b, args.threads), args.query, chunks, args.batch_sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Benchmark streaming spreadsheet ingestion (CSV and XLSX → row-group Markdown).
+
+Writes a synthetic sheet of the requested size to a temp directory (or uses
+``--file``), converts it with ``LocalFileConnector.read_document(stream=True)``
+-- what indexing actually runs, consuming one row group at a time -- and reports
+rows/s and the process's peak RSS, which should stay flat as the row count
+grows.  ``--joined`` builds the whole sheet as one Markdown string instead
+(``read_document`` without streaming), whose RSS grows with the output size.
+
+    python scripts/bench_spreadsheet.py --rows 1000000
+    python scripts/bench_spreadsheet.py --rows 200000 --xlsx
+    python scripts/bench_spreadsheet.py --rows 1000000 --joined
+    python scripts/bench_spreadsheet.py --file ~/exports/transactions.csv
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from kb_agent.connectors.local_file import LocalFileConnector  # noqa: E402
+
+_HEADER = ["txn_id", "account", "date", "amount", "currency", "channel", "memo"]
+
+
+def _rows(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    for i in range(n):
+        yield [f"T{i:09d}", f"ACC{rng.randint(1, 50000):06d}", f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+               round(rng.uniform(1, 50000), 2), rng.choice(["CNY", "USD", "HKD"]), rng.choice(["ATM", "POS", "WEB"]),
+               rng.choice(["salary", "transfer", "refund", "fee", ""])]
+
+
+def write_csv(path: Path, n: int):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(_HEADER) + "\n")
+        for row in _rows(n):
+            f.write(",".join(str(v) for v in row) + "\n")
+
+
+def write_xlsx(path: Path, n: int):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Transactions")
+    ws.append(_HEADER)
+    for row in _rows(n):
+        ws.append(row)
+    wb.save(path)
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming XLSX/CSV ingestion")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows in the synthetic sheet")
+    parser.add_argument("--xlsx", action="store_true", help="Benchmark an .xlsx sheet instead of a CSV")
+    parser.add_argument("--file", type=Path, help="Convert this .csv/.xlsx instead of a synthetic one")
+    parser.add_argument("--joined", action="store_true",
+                        help="Build the whole sheet as one string instead of streaming row groups")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.file:
+            path = args.file
+        else:
+            path = Path(tmp) / ("bench.xlsx" if args.xlsx else "bench.csv")
+            start = time.perf_counter()
+            (write_xlsx if args.xlsx else write_csv)(path, args.rows)
+            print(f"wrote {args.rows} rows to {path.name} ({path.stat().st_size / 1024 / 1024:.1f} MB) "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        connector = LocalFileConnector(path.parent)
+        if args.joined:
+            content = connector.read_document(path)["content"]
+            groups = content.count("\n## ") + content.startswith("## ")
+            rows = content.count("\n| ") - 2 * groups
+            out_chars = len(content)
+        else:
+            groups = rows = out_chars = 0
+            for group in connector.read_document(path, stream=True)["sections"]:
+                groups += 1
+                # Table lines after the heading, minus the header and separator rows
+                rows += group.count("\n| ") - 2
+                out_chars += len(group)
+        elapsed = time.perf_counter() - start
+
+        print(f"{rows} rows in {groups} groups, {out_chars / 1024 / 1024:.1f} MB of Markdown")
+        print(f"time      : {elapsed:.2f}s  ({rows / elapsed:,.0f} rows/s)")
+        print(f"peak RSS  : {peak_rss_mb():.0f} MB (before conversion: {rss_before:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -57,6 +57,12 @@ if /i "%REPLY%"=="y" (
     echo    -^> Removing knowledge graph data...
     del /q /f "%INDEX_PATH%\knowledge_graph.json" 2>nul
 
+    echo    -^> Removing index manifest...
+    del /q /f "%INDEX_PATH%\.index_manifest.db*" 2>nul
+
+    echo    -^> Removing BM25 sparse index...
+    del /q /f "%INDEX_PATH%\.sparse_index.db*" 2>nul
+
     echo ✅ Cleanup complete! Your kb-agent index is now completely fresh.
     echo    You can now run 'kb-agent index' or use the TUI to re-index your documents.
 ) else (
@@ -54,6 +54,14 @@ then
     echo "   -> Removing knowledge graph data..."
     find "$INDEX_PATH" -maxdepth 1 -name "knowledge_graph.json" -type f -delete
 
+    # 4. Delete the incremental index manifest (otherwise unchanged docs are skipped on re-index)
+    echo "   -> Removing index manifest..."
+    find "$INDEX_PATH" -maxdepth 1 -name ".index_manifest.db*" -type f -delete
+
+    # 5. Delete the BM25 sparse index used by hybrid_search
+    echo "   -> Removing sparse index..."
+    find "$INDEX_PATH" -maxdepth 1 -name ".sparse_index.db*" -type f -delete
+
     echo "✅ Cleanup complete! Your kb-agent index is now completely fresh."
     echo "   You can now run 'kb-agent index' or use the TUI to re-index your documents."
 else
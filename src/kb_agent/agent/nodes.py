@@ -262,7 +262,7 @@ def _is_tool_applicable(tool_name: str, query: str) -> bool:
     """Validate if a tool is applicable to the given query."""
     if tool_name == "jira_fetch":
         return bool(_JIRA_KEY_RE.search(query))
-    if tool_name == "csv_query":
+    if tool_name in ("csv_query", "csv_sql"):
         return bool(re.search(r'\.csv', query, re.IGNORECASE))
     if tool_name == "jira_jql":
         return True
@@ -277,9 +277,9 @@ def _build_tool_args(tool_name: str, query: str) -> dict[str, str] | None:
     """Build tool arguments based on the tool type and query.
     Returns None if the tool should not be called."""
     query_str = query
-    if tool_name in ("grep_search", "vector_search"):
+    if tool_name in ("grep_search", "vector_search", "hybrid_search"):
         return {"query": query_str}
-    if tool_name == "csv_query":
+    if tool_name in ("csv_query", "csv_sql"):
         return None  # csv_query requires structured arguments like filename and query_json_str, so fallback extraction isn't well suited. Let LLM extract it correctly.
     if tool_name == "local_file_qa":
         return {"filename_prefix": query_str}
@@ -287,7 +287,9 @@ def _build_tool_args(tool_name: str, query: str) -> dict[str, str] | None:
     if tool_name == "read_file":
         return {"file_path": query_str}
     if tool_name == "graph_related":
-        return {"entity_id": query_str}
+        # Seed the walk with every ticket key mentioned, falling back to the raw query
+        keys = list(dict.fromkeys(_JIRA_KEY_RE.findall(query_str)))
+        return {"entity_id": ", ".join(keys) if keys else query_str}
     if tool_name == "jira_fetch":
         match = re.search(r'\b([A-Z][A-Z0-9]{1,9}-\d{3,5})\b', query_str)
         if match:
@@ -326,9 +328,9 @@ def _extract_tools_from_text(
     # Valid tool names mapping limit
     valid_tools = [
         # "grep_search", # TEMPORARILY DISABLED
-        "vector_search", "read_file",
+        "vector_search", "hybrid_search", "read_file",
         "graph_related", "jira_fetch", "jira_jql", "confluence_fetch",
-        "web_fetch", "local_file_qa", "csv_query"
+        "web_fetch", "local_file_qa", "csv_query", "csv_sql"
     ]
 
     found: list[dict[str, Any]] = []
@@ -353,7 +355,7 @@ def _extract_tools_from_text(
             
             # If we extracted an argument value AND it wasn't specially parsed by _build_tool_args
             # (e.g. for simple query search tools), update it.
-            if match and tool_name in ("grep_search", "vector_search", "read_file", "graph_related"):
+            if match and tool_name in ("grep_search", "vector_search", "hybrid_search", "read_file", "graph_related"):
                 tool_args_key = list(tool_args.keys())[0] # The key (e.g. 'query' or 'file_path')
                 tool_args = {tool_args_key: match.group(1)}
 
@@ -372,14 +374,16 @@ def _extract_tools_from_text(
 
 TOOL_DESCRIPTIONS = """Available tools:
 1. vector_search(query: str) — Semantic similarity search using ChromaDB embeddings. Best for conceptual/fuzzy queries. Returns JSON array of {id, content, metadata, score}.
+2. hybrid_search(query: str) — Keyword (BM25) + semantic search fused by rank. Best when the question contains exact identifiers: config keys, error codes, class/function names, file names. Returns the same JSON shape as vector_search.
 3. read_file(file_path: str, start_line: int=None, end_line: int=None) — Read the full content of a document, or a specific line range. Use after search tools find relevant files.
-4. graph_related(entity_id: str) — Find related entities in the Knowledge Graph (e.g. parent Jira ticket, linked pages). Input is an entity ID like 'PROJ-123' or 'document.md'.
+4. graph_related(entity_id: str, depth: int = 1, relations: str = "", direction: str = "both", max_per_node: int = 20) — Walk the Knowledge Graph from one or more comma-separated entity IDs (e.g. 'PROJ-123, PROJ-456' or 'document.md') and return the subgraph: parent/child tickets, mentions, linked pages. Use depth 2-3 and optionally relations like 'PARENT_OF,CHILD_OF' to follow a whole chain in ONE call.
 5. jira_fetch(issue_key: str) — Fetch a Jira issue by key (e.g. 'PROJ-123'). Returns issue details.
 6. jira_jql(query: str) — Convert natural language to Jira JQL and search. Use for semantic queries like "my unresolved tasks".
 7. confluence_fetch(page_id: str) — Fetch a Confluence page by its numeric ID (9-10 digits like 1231231233) or search by text. **IMPORTANT**: If the query contains a 9-10 digit number, it is very likely a Confluence page ID — you MUST call this tool with that number.
 8. web_fetch(url: str) — Fetch a specific web page by URL and convert to Markdown. The 'url' parameter MUST be a valid HTTP/HTTPS URL (e.g., 'https://domain.com'). Do NOT use this tool for natural language web searches.
 9. local_file_qa(filename_prefix: str) — Read a local file from the datastore by its exact filename or prefix (e.g. '银行开户指南'). Use when user specifies a filename to answer Q&A.
-10. csv_query(filename: str, query_json_str: str) — Query a CSV file with a Pandas-compatible condition string and desired columns. Provide condition and columns inside query_json_str formatted as JSON."""
+10. csv_query(filename: str, query_json_str: str) — Query a CSV file with a Pandas-compatible condition string and desired columns. Provide condition and columns inside query_json_str formatted as JSON.
+11. csv_sql(sql: str) — Run one read-only SQLite SELECT over all CSV files (each file is a table named after it, e.g. 'Q3 Transactions.csv' -> q3_transactions). Prefer it for GROUP BY/aggregation, joins across files and large CSVs."""
 
 
 # ---------------------------------------------------------------------------
@@ -397,7 +401,10 @@ PLAN_SYSTEM = (
     '{"name": "read_file", "args": {"file_path": "docs/auth.md"}}]\n'
     "3. Start with vector_search for Q&A. If the question is complex or conceptual, YOU MUST issue multiple vector_search queries in parallel.\n"
     "   **CRITICAL EXCEPTION**: ONLY if the user explicitly asks to read or open a SPECIFIC file by using words like 'file', 'read', '打开', '文件' (e.g. '根据文件银行开户指南', '打开文件X'), use local_file_qa. For general 'how to' questions (e.g. 'X如何安装'), ALWAYS use vector_search.\n"
-    "4. If the question mentions a Jira ticket (e.g. PROJ-123), use jira_fetch or graph_related.\n"
+    "   If the question contains exact identifiers (config keys like 'db.pool.max_size', error codes like 'ERR-1042', class names), use hybrid_search instead, keeping the identifier verbatim.\n"
+    "4. If the question mentions a Jira ticket (e.g. PROJ-123), use jira_fetch or graph_related. "
+    "To follow parent/child/mention chains, make ONE graph_related call with all ticket keys and depth 2-3 "
+    "instead of one call per hop.\n"
     "5. After search returns file paths, use read_file to get full content.\n"
     "6. **INDEX RESOLUTION**: When a user refers to a file by index (e.g. 'Summarize 1', 'Tell me about file 2'), you MUST:\n"
     "   a) Look at the PREVIOUS ASSISTANT MESSAGE in the conversation history.\n"
@@ -429,7 +436,9 @@ UNIFIED_ROUTER_SYSTEM = (
     "R4. If the question references a Confluence page ID (5-10 digit number, or 'confluence <id>'), "
     "set route_decision='search' and tool_calls=[{\"name\": \"confluence_fetch\", \"args\": {\"page_id\": \"<id>\"}}].\n"
     "R5. If the question asks to query/analyze a .csv file, "
-    "set route_decision='search' and tool_calls=[{\"name\": \"csv_query\", \"args\": {\"filename\": \"<file>\", \"query_json_str\": \"<json>\"}}].\n"
+    "set route_decision='search' and tool_calls=[{\"name\": \"csv_query\", \"args\": {\"filename\": \"<file>\", \"query_json_str\": \"<json>\"}}]. "
+    "For aggregation (totals, counts, GROUP BY) or joins across CSV files use "
+    "tool_calls=[{\"name\": \"csv_sql\", \"args\": {\"sql\": \"SELECT ...\"}}] instead.\n"
     "R6. If the question asks to READ a specific named file (e.g. '打开文件银行开户指南', 'read file architecture.md'), "
     "set route_decision='search' and tool_calls=[{\"name\": \"local_file_qa\", \"args\": {\"filename_prefix\": \"<name>\"}}].\n"
     "   **CRITICAL LIMITATION**: ONLY use R6 if the user explicitly uses words like 'file', 'read', '打开', '文件', or '文档'. General questions like 'How to install X' or 'X如何安装' MUST default to R7.\n"
@@ -976,7 +985,7 @@ def tool_node(state: AgentState) -> dict[str, Any]:
 def rerank_node(state: AgentState) -> dict[str, Any]:
     """Rerank retrieved evidence using a cross-encoder before grading."""
     from ..config import settings
-    from ..tools.reranker import reranker_client
+    from ..registry import registry
     import re
     
     if not settings or not settings.use_reranker:
@@ -994,17 +1003,47 @@ def rerank_node(state: AgentState) -> dict[str, Any]:
         # Strip out the [SOURCE:...] prefix for the content to be scored, to avoid confounding the model
         content = c
         match = re.search(r'^\[SOURCE:(.+?)\]\s*(.*)', c, flags=re.DOTALL)
+        chunk = {"content": c, "original_str": c}
         if match:
-            content = match.group(2)
-        chunks.append({"content": content, "original_str": c})
+            chunk["content"] = match.group(2)
+            # Retriever similarity from the S tag feeds the cheap first stage
+            score_match = re.search(r':S([0-9.]+)$', match.group(1))
+            if score_match:
+                try:
+                    chunk["score"] = float(score_match.group(1))
+                except ValueError:
+                    pass
+        chunks.append(chunk)
     
     query = state.get("resolved_query", state.get("query", ""))
     
     # We want to return the top N chunks.
     top_n = getattr(settings, "rerank_top_n", 4) 
+    first_stage_k = getattr(settings, "rerank_first_stage_k", 0)
+    margin = getattr(settings, "rerank_early_exit_margin", 0.0)
     
-    # Use the synchronous rerank method to avoid event loop issues when LangGraph invoke() is called synchronously
-    reranked = reranker_client.rerank_sync(query, chunks, top_n=top_n)
+    # Use the synchronous rerank method to avoid event loop issues when LangGraph invoke() is called synchronously.
+    # The registry loads the model on first use unless warmup() already did.
+    reranker = registry.reranker()
+    reranked, cascade_stats = reranker.rerank_cascade_sync(
+        query, chunks, top_n=top_n,
+        first_stage_k=first_stage_k if isinstance(first_stage_k, int) else 0,
+        early_exit_margin=margin if isinstance(margin, (int, float)) else 0.0,
+    )
+    log_audit("rerank_cascade", cascade_stats)
+
+    if cascade_stats.get("first_stage_kept", len(chunks)) < len(chunks):
+        _emit(state, "⚡", f"First stage kept {cascade_stats['first_stage_kept']}/{len(chunks)} chunks"
+                          + (" (cross-encoder skipped: clear margin)" if cascade_stats.get("early_exit") else ""))
+
+    if getattr(settings, "debug_mode", False) and not cascade_stats.get("early_exit"):
+        try:
+            hits, misses = cascade_stats["cache_hits"], cascade_stats["cache_misses"]
+            stats = reranker.score_cache.stats()
+            _emit(state, "🐛", f"Rerank cache: {hits} hit(s), {misses} scored "
+                              f"(session hit rate {stats['hit_rate']:.0%}, {stats['entries']} cached)")
+        except Exception:
+            pass
     
     # Reconstruct the context from the original strings of the top chunks
     new_context = [c["original_str"] for c in reranked]
@@ -1544,15 +1583,14 @@ def unified_router_node(state: AgentState) -> dict[str, Any]:
     # ------------------------------------------------------------------
     if not history:
         from ..config import settings as _cfg
-        from ..tools.vector_tool import VectorTool
+        from .tools import _get_vector
         _grade_threshold = (
             _cfg.grade_auto_approve_threshold
             if _cfg and _cfg.grade_auto_approve_threshold is not None
             else 0.65
         )
         try:
-            _vt = VectorTool()
-            _hits = _vt.search(query, n_results=5)
+            _hits = _get_vector().search(query, n_results=5)
             if _hits and _hits[0].get("score", 0) >= _grade_threshold:
                 _emit(state, "🚀", f"Fast-path: direct vector hit (score {_hits[0]['score']:.2f} >= {_grade_threshold})")
                 log_audit("agent_unified_router_fast_vector", {"score": _hits[0]['score']})
@@ -30,12 +30,15 @@ _confluence: object | None = None
 _web: object | None = None
 _local_qa: object | None = None
 _csv_qa: object | None = None
+_csv_sql: object | None = None
 
 
 def reset_tools_cache():
-    """Clear the cached tool instances so they pick up new settings on next use."""
-    global _grep, _vector, _file, _graph, _jira, _confluence, _web, _local_qa, _csv_qa
-    _grep = _vector = _file = _graph = _jira = _confluence = _web = _local_qa = _csv_qa = None
+    """Clear the cached tool instances, and the agent graph wired to them, so they pick up new settings on next use."""
+    global _grep, _vector, _file, _graph, _jira, _confluence, _web, _local_qa, _csv_qa, _csv_sql
+    _grep = _vector = _file = _graph = _jira = _confluence = _web = _local_qa = _csv_qa = _csv_sql = None
+    from kb_agent.registry import registry
+    registry.discard(("graph",))
 
 
 def _get_grep():
@@ -54,6 +57,21 @@ def _get_vector():
     return _vector
 
 
+def _get_hybrid():
+    """Hybrid retriever over the shared vector tool and the BM25 index next to the index manifest."""
+    from kb_agent.registry import registry
+    from kb_agent.tools.hybrid_search import HybridSearchTool, RRF_K
+    from kb_agent.tools.sparse_index import SparseIndex, default_index_path
+
+    settings = config.settings
+    index_file = default_index_path(settings)
+    sparse = registry.get_or_create(("sparse_index", str(index_file)), lambda: SparseIndex(index_file)) if index_file else None
+    rrf_k = getattr(settings, "hybrid_rrf_k", None) if settings else None
+    if not isinstance(rrf_k, int) or rrf_k <= 0:
+        rrf_k = RRF_K
+    return HybridSearchTool(_get_vector(), sparse, rrf_k=rrf_k)
+
+
 def _get_file():
     global _file
     if _file is None:
@@ -109,10 +127,18 @@ def _get_csv_qa():
     return _csv_qa
 
 
+def _get_csv_sql():
+    global _csv_sql
+    if _csv_sql is None:
+        import kb_agent.tools.csv_sql_tool as csv_sql_tool
+        _csv_sql = csv_sql_tool
+    return _csv_sql
+
+
 def reset_singletons():
     """Reset all lazy singletons — useful for tests."""
-    global _grep, _vector, _file, _graph, _jira, _confluence, _web, _local_qa, _csv_qa
-    _grep = _vector = _file = _graph = _jira = _confluence = _web = _local_qa = _csv_qa = None
+    global _grep, _vector, _file, _graph, _jira, _confluence, _web, _local_qa, _csv_qa, _csv_sql
+    _grep = _vector = _file = _graph = _jira = _confluence = _web = _local_qa = _csv_qa = _csv_sql = None
 
 
 # ---------------------------------------------------------------------------
@@ -133,8 +159,8 @@ def grep_search(query: str) -> str:
     Returns:
         JSON array of matches with file_path, line number, and content.
     """
-    results = _get_grep().search(query)
-    return json.dumps(results[:20], ensure_ascii=False)
+    results = _get_grep().search(query, max_results=20)
+    return json.dumps(results, ensure_ascii=False)
 
 
 @tool
@@ -166,6 +192,34 @@ def vector_search(query: str) -> str:
     return json.dumps(results[:fetch_k], ensure_ascii=False)
 
 
+@tool
+def hybrid_search(query: str) -> str:
+    """Keyword (BM25) + semantic search over indexed documents, fused by rank.
+
+    Use this tool when the question contains exact identifiers such as config
+    keys, error codes, class/function names, ticket numbers or file names,
+    which pure semantic search tends to miss.
+
+    Args:
+        query: The search query; keep identifiers verbatim.
+
+    Returns:
+        JSON array of matches with id, content snippet, metadata, and score.
+    """
+    from kb_agent.config import settings
+
+    # Same pool size as vector_search so the reranker sees a comparable candidate set
+    fetch_k = 20 if settings and settings.use_reranker else 5
+
+    results = _get_hybrid().search(query, n_results=fetch_k)
+    if not results:
+        return json.dumps({
+            "status": "no_results",
+            "message": "No relevant documents found for query"
+        }, ensure_ascii=False)
+    return json.dumps(results, ensure_ascii=False)
+
+
 @tool
 def read_file(file_path: str, start_line: int = None, end_line: int = None) -> str:
     """Read the full content of a document file by its path, or a specific line range.
@@ -189,26 +243,51 @@ def read_file(file_path: str, start_line: int = None, end_line: int = None) -> s
 
 
 @tool
-def graph_related(entity_id: str) -> str:
-    """Find related entities in the Knowledge Graph.
+def graph_related(entity_id: str, depth: int = 1, relations: str = "", direction: str = "both",
+                  max_per_node: int = 20) -> str:
+    """Explore the Knowledge Graph around one or more entities in a single call.
 
-    Use this to navigate relationships between Jira tickets, Confluence pages,
-    and documentation files (e.g. find parent ticket, linked pages).
+    Walks relationships between Jira tickets, Confluence pages, and documentation
+    files breadth-first (parent/child chains, mentions, links) and returns the
+    subgraph found. Prefer ONE call with several seeds and depth 2-3 over
+    repeated calls that follow the chain one hop at a time.
 
     Args:
-        entity_id: The entity identifier (e.g. 'PROJ-123' or 'document.md').
+        entity_id: One or more entity identifiers, comma-separated
+            (e.g. 'PROJ-123' or 'PROJ-123, PROJ-456, document.md').
+        depth: How many hops to follow (1-4, default 1).
+        relations: Optional comma-separated relation types to follow, e.g.
+            'PARENT_OF,CHILD_OF' (others: MENTIONS, REFERENCES, CONTAINS). Empty follows all.
+        direction: 'out', 'in' or 'both' (default).
+        max_per_node: Maximum new neighbours expanded per node (default 20).
 
     Returns:
-        JSON array of related nodes with node id, type, relation, and direction.
+        JSON object with seeds (input id -> matched node), nodes (id, type, depth),
+        edges ([source, relation, target]) and truncated (true if a cap cut the walk short).
     """
-    results = _get_graph().get_related_nodes(entity_id)
-    if not results:
+    seeds = [e.strip() for e in str(entity_id).split(",") if e.strip()]
+    try:
+        depth = int(depth)
+    except (TypeError, ValueError):
+        depth = 1
+    try:
+        max_per_node = max(1, int(max_per_node))
+    except (TypeError, ValueError):
+        max_per_node = 20
+    direction = direction if direction in ("out", "in", "both") else "both"
+    rels = [r for r in str(relations or "").split(",") if r.strip()]
+
+    result = _get_graph().traverse(
+        seeds, max_depth=depth, relations=rels or None, direction=direction, max_fanout=max_per_node,
+    )
+    if not result["edges"]:
         return json.dumps({
             "status": "no_results",
             "tool": "graph_related",
-            "message": f"No related entities found for '{entity_id}'."
+            "message": f"No related entities found for '{entity_id}'.",
+            "seeds": result["seeds"],
         }, ensure_ascii=False)
-    return json.dumps(results[:20], ensure_ascii=False)
+    return json.dumps(result, ensure_ascii=False)
 
 
 @tool
@@ -454,7 +533,8 @@ def rag_query(query: str) -> str:
         A synthesized natural language answer from the knowledge base.
     """
     from kb_agent.agent.graph import compile_graph
-    graph = compile_graph()
+    from kb_agent.registry import registry
+    graph = registry.graph(compile_graph)
     result_state = graph.invoke({"query": query, "messages": [], "status_callback": None})
     return result_state.get("final_answer") or ""
 
@@ -494,12 +574,33 @@ def csv_query(filename: str, query_json_str: str) -> str:
     return _get_csv_qa().csv_query(filename, query_json_str)
 
 
+@tool
+def csv_sql(sql: str) -> str:
+    """Run a read-only SQL query (SQLite dialect) over all CSV files in the datastore.
+
+    Every CSV in archive/ or input/ is a table named after its file name,
+    lowercased with non-alphanumerics replaced by '_' (e.g. 'Q3 Transactions.csv'
+    -> q3_transactions); quote column names containing spaces with double quotes.
+    Prefer this over csv_query for aggregation (GROUP BY, SUM, COUNT), joins
+    across files and large files. Call `csv_info` first to learn the column names.
+    Only a single SELECT statement is allowed; results are capped.
+
+    Args:
+        sql: A single SELECT statement.
+
+    Returns:
+        Markdown table of the query results.
+    """
+    return _get_csv_sql().run_sql(sql)
+
+
 # Convenience list for graph construction
 ALL_TOOLS = [
     # grep_search, # TEMPORARILY DISABLED
     vector_search,
+    hybrid_search,
     read_file,
-    # graph_related,
+    graph_related,
     jira_fetch,
     jira_jql,
     jira_create_ticket,
@@ -509,6 +610,7 @@ ALL_TOOLS = [
     local_file_qa,
     csv_info,
     csv_query,
+    csv_sql,
     rag_query,
     direct_response,
 ]
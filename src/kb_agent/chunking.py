@@ -1,176 +1,357 @@
+import bisect
+import hashlib
+import logging
+import os
 import re
-from typing import List, Dict
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
 import kb_agent.config as config
 
+logger = logging.getLogger("kb_agent")
+
+# [CLS]/[SEP] (or <s>/</s>) added by the embedder around every chunk
+SPECIAL_TOKENS = 2
+
 class Chunk:
     def __init__(self, text: str, metadata: Dict):
         self.text = text
         self.metadata = metadata
 
-def split_by_markdown_headers(text: str) -> List[Chunk]:
-    lines = text.split('\n')
-    chunks = []
-    
+_HEADER_RE = re.compile(r'(#{1,3})\s+(.*)')
+
+
+def iter_markdown_sections(text: str) -> Iterator[Chunk]:
+    """
+    Yield one chunk per ``#``/``##``/``###`` section, walking ``text`` once.
+
+    Sections are sliced straight out of ``text`` instead of collecting lines;
+    empty sections are skipped.
+    """
     current_title = "Introduction"
-    current_text = []
-    
-    header_pattern = re.compile(r'^(#{1,3})\s+(.*)')
-    
-    for line in lines:
-        match = header_pattern.match(line)
+    section_start = 0
+    pos = 0
+    n = len(text)
+    while pos <= n:
+        line_end = text.find('\n', pos)
+        if line_end == -1:
+            line_end = n
+        match = _HEADER_RE.match(text, pos, line_end) if text.startswith('#', pos) else None
         if match:
-            # Save previous chunk if exists
-            if current_text:
-                joined_text = '\n'.join(current_text).strip()
-                if joined_text:
-                    chunks.append(Chunk(text=joined_text, metadata={"section_title": current_title}))
+            # Save previous section if exists
+            if pos > section_start:
+                section_text = text[section_start:pos - 1].strip()
+                if section_text:
+                    yield Chunk(text=section_text, metadata={"section_title": current_title})
             current_title = match.group(2).strip()
-            current_text = [line]
-        else:
-            current_text.append(line)
-            
-    if current_text:
-        joined_text = '\n'.join(current_text).strip()
-        if joined_text:
-            chunks.append(Chunk(text=joined_text, metadata={"section_title": current_title}))
-            
-    return chunks
+            section_start = pos
+        pos = line_end + 1
 
-def split_by_paragraphs(text: str, max_chars: int = None, overlap_chars: int = None) -> List[str]:
-    if max_chars is None:
-        max_chars = config.settings.chunk_max_chars if config.settings and config.settings.chunk_max_chars is not None else 800
-    if overlap_chars is None:
-        overlap_chars = config.settings.chunk_overlap_chars if config.settings and config.settings.chunk_overlap_chars is not None else 200
-        
-    paragraphs = text.split('\n\n')
-    chunks = []
-    
-    current_chunk = []
+    section_text = text[section_start:].strip()
+    if section_text:
+        yield Chunk(text=section_text, metadata={"section_title": current_title})
+
+
+def split_by_markdown_headers(text: str) -> List[Chunk]:
+    return list(iter_markdown_sections(text))
+
+
+def _iter_paragraphs(text: str) -> Iterator[str]:
+    pos = 0
+    while True:
+        end = text.find('\n\n', pos)
+        para = (text[pos:] if end == -1 else text[pos:end]).strip()
+        if para:
+            yield para
+        if end == -1:
+            return
+        pos = end + 2
+
+
+def iter_paragraph_chunks(text: str, max_chars: int, overlap_chars: int) -> Iterator[str]:
+    """
+    Streaming ``split_by_paragraphs``: packs paragraphs up to ``max_chars`` with
+    trailing paragraphs of up to ``overlap_chars`` repeated in the next chunk.
+
+    Chunk lengths are tracked incrementally, so each paragraph is touched a
+    bounded number of times regardless of document size.
+    """
+    current_chunk: List[str] = []
     current_length = 0
-    
-    for para in paragraphs:
-        para = para.strip()
-        if not para:
-            continue
-            
+
+    for para in _iter_paragraphs(text):
         if current_length + len(para) > max_chars and current_chunk:
-            chunks.append('\n\n'.join(current_chunk))
-            
+            yield '\n\n'.join(current_chunk)
+
             # Start next chunk with overlap
             overlap_length = 0
-            overlap_paras = []
+            overlap_paras: Deque[str] = deque()
             for p in reversed(current_chunk):
                 if overlap_length + len(p) <= overlap_chars:
-                    overlap_paras.insert(0, p)
+                    overlap_paras.appendleft(p)
                     overlap_length += len(p) + 2
                 else:
                     break
-            
+
             if not overlap_paras:
-                overlap_paras = [current_chunk[-1]]
-                
-            current_chunk = overlap_paras + [para]
-            current_length = sum(len(p) for p in current_chunk) + (len(current_chunk) - 1) * 2
+                overlap_paras.append(current_chunk[-1])
+                overlap_length = len(current_chunk[-1]) + 2
+
+            overlap_paras.append(para)
+            current_chunk = list(overlap_paras)
+            current_length = overlap_length + len(para)
         else:
             current_chunk.append(para)
             current_length += len(para) + 2
-            
+
     if current_chunk:
-        chunks.append('\n\n'.join(current_chunk))
-        
-    return chunks
+        yield '\n\n'.join(current_chunk)
+
+
+def split_by_paragraphs(text: str, max_chars: int = None, overlap_chars: int = None) -> List[str]:
+    if max_chars is None:
+        max_chars = config.settings.chunk_max_chars if config.settings and config.settings.chunk_max_chars is not None else 800
+    if overlap_chars is None:
+        overlap_chars = config.settings.chunk_overlap_chars if config.settings and config.settings.chunk_overlap_chars is not None else 200
+    return list(iter_paragraph_chunks(text, max_chars, overlap_chars))
+
+def content_chunk_ids(doc_id: str, chunks: List[Chunk], seen: Optional[Dict[str, int]] = None) -> List[str]:
+    """
+    Ids derived from each chunk's section title and exact text.
+
+    Unlike positional ids, a chunk keeps its id when paragraphs are inserted or
+    removed elsewhere in the document, so only chunks whose content changed
+    need embedding.  Any change to the text, whitespace included, changes the
+    id: a kept chunk's stored document is never stale.  Identical chunks in one
+    document get an ordinal suffix;
+    pass the same ``seen`` dict to every call when a document is chunked in parts.
+    """
+    ids = []
+    seen = {} if seen is None else seen
+    for c in chunks:
+        key = f"{c.metadata.get('section_title', '')}\x00{c.text}"
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+        ordinal = seen.get(digest, 0)
+        seen[digest] = ordinal + 1
+        ids.append(f"{doc_id}-chunk-{digest}" + (f"-{ordinal}" if ordinal else ""))
+    return ids
+
+
+def load_embedding_tokenizer(settings=None):
+    """The ``tokenizers`` tokenizer of the local ONNX embedding model, or None if there isn't one."""
+    settings = settings if settings is not None else config.settings
+    if settings and getattr(settings, "embedding_url", None):
+        # Remote embedder: we don't know its tokenizer
+        return None
+    try:
+        from tokenizers import Tokenizer
+        from kb_agent.tools.vector_tool import _local_model_dir
+
+        tokenizer_path = os.path.join(_local_model_dir(settings)[1], "tokenizer.json")
+        if not os.path.exists(tokenizer_path):
+            return None
+        tokenizer = Tokenizer.from_file(tokenizer_path)
+        tokenizer.no_truncation()
+        tokenizer.no_padding()
+        return tokenizer
+    except Exception as e:
+        logger.warning(f"Could not load embedding tokenizer for token-budget chunking: {e}")
+        return None
+
+
+def _paragraph_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) of every non-blank paragraph, stripped, in ``split_by_paragraphs`` terms."""
+    spans = []
+    pos = 0
+    for part in text.split('\n\n'):
+        start = pos + (len(part) - len(part.lstrip()))
+        end = pos + len(part.rstrip())
+        if end > start:
+            spans.append((start, end))
+        pos += len(part) + 2
+    return spans
+
+
+def split_by_token_budget(text: str, offsets: List[Tuple[int, int]], max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Token-budget counterpart of ``split_by_paragraphs``.
+
+    ``offsets`` are the character offsets of ``text``'s tokens (from one
+    ``encode`` call).  Paragraphs are packed while their token count fits in
+    ``max_tokens``; paragraphs that alone exceed it are cut at token
+    boundaries.  Trailing paragraphs of up to ``overlap_tokens`` carry over
+    into the next chunk.
+    """
+    starts = [start for start, end in offsets if end > start]
+
+    def n_tokens(a: int, b: int) -> int:
+        return bisect.bisect_left(starts, b) - bisect.bisect_left(starts, a)
+
+    pieces: List[Tuple[int, int, int]] = []
+    for start, end in _paragraph_spans(text):
+        n = n_tokens(start, end)
+        if n <= max_tokens:
+            pieces.append((start, end, n))
+            continue
+        first = bisect.bisect_left(starts, start)
+        last = bisect.bisect_left(starts, end)
+        for i in range(first, last, max_tokens):
+            a = starts[i] if i > first else start
+            b = starts[i + max_tokens] if i + max_tokens < last else end
+            piece = text[a:b]
+            a, b = a + (len(piece) - len(piece.lstrip())), a + len(piece.rstrip())
+            if b > a:
+                pieces.append((a, b, n_tokens(a, b)))
+
+    chunks: List[List[Tuple[int, int, int]]] = []
+    current: List[Tuple[int, int, int]] = []
+    current_tokens = 0
+    for piece in pieces:
+        if current and current_tokens + piece[2] > max_tokens:
+            chunks.append(current)
+            overlap: List[Tuple[int, int, int]] = []
+            overlap_count = 0
+            for prev in reversed(current):
+                if overlap_count + prev[2] > overlap_tokens:
+                    break
+                overlap.append(prev)
+                overlap_count += prev[2]
+            overlap.reverse()
+            while overlap and overlap_count + piece[2] > max_tokens:
+                overlap_count -= overlap.pop(0)[2]
+            current, current_tokens = overlap, overlap_count
+        current.append(piece)
+        current_tokens += piece[2]
+    if current:
+        chunks.append(current)
+
+    return ['\n\n'.join(text[a:b] for a, b, _ in chunk) for chunk in chunks]
+
+
+def contextual_prefix(doc_title: str, section_title: str, doc_summary: str) -> str:
+    prefix_lines = []
+    if doc_title:
+        prefix_lines.append(f"Document: {doc_title}")
+    if section_title:
+        prefix_lines.append(f"Section: {section_title}")
+    if doc_summary:
+        prefix_lines.append(f"Summary: {doc_summary}")
+    return "\n".join(prefix_lines) + "\n\n" if prefix_lines else ""
+
 
 class MarkdownAwareChunker:
     """
     Hierarchical chunker that splits document into semantic chunks primarily using
     Markdown headers, falling back to overlapping paragraph chunks if a section is too long.
+
+    With ``max_tokens`` (``chunk_max_tokens``) set, sizes are measured in tokens of the
+    embedding model's own tokenizer instead of characters, contextual prefix included.
+    Falls back to character budgets when no local tokenizer is available.
     """
-    def __init__(self, max_chars: int = None, overlap_chars: int = None):
+    def __init__(self, max_chars: int = None, overlap_chars: int = None,
+                 max_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None, tokenizer=None):
         if max_chars is None:
             max_chars = config.settings.chunk_max_chars if config.settings and config.settings.chunk_max_chars is not None else 800
         if overlap_chars is None:
             overlap_chars = config.settings.chunk_overlap_chars if config.settings and config.settings.chunk_overlap_chars is not None else 200
+        if max_tokens is None:
+            max_tokens = getattr(config.settings, "chunk_max_tokens", None) if config.settings else None
+        if overlap_tokens is None:
+            overlap_tokens = getattr(config.settings, "chunk_overlap_tokens", None) if config.settings else None
             
         self.max_chars = max_chars
         self.overlap_chars = overlap_chars
+        self.max_tokens = max_tokens if isinstance(max_tokens, int) and max_tokens > 0 else None
+        self.overlap_tokens = overlap_tokens if isinstance(overlap_tokens, int) and overlap_tokens >= 0 else 64
+        self.tokenizer = None
+        if self.max_tokens:
+            self.tokenizer = tokenizer or load_embedding_tokenizer()
+            if self.tokenizer is None:
+                logger.warning("chunk_max_tokens is set but no local embedding tokenizer was found; chunking by characters.")
+                self.max_tokens = None
         
     def chunk(self, text: str, base_metadata: Dict) -> List[Chunk]:
-        initial_chunks = split_by_markdown_headers(text)
-        
-        final_chunks = []
-        for chunk in initial_chunks:
-            if len(chunk.text) > self.max_chars:
-                sub_texts = split_by_paragraphs(chunk.text, self.max_chars, self.overlap_chars)
-                for sub_text in sub_texts:
-                    meta = base_metadata.copy()
-                    meta.update(chunk.metadata)
-                    final_chunks.append(Chunk(text=sub_text, metadata=meta))
-            else:
-                meta = base_metadata.copy()
-                meta.update(chunk.metadata)
-                final_chunks.append(Chunk(text=chunk.text, metadata=meta))
-                
-        # Inject standard metadata and contextual prefix
-        total = len(final_chunks)
+        if self.max_tokens:
+            return self._chunk_by_tokens(text, base_metadata)
+
+        chunks = list(self.iter_chunks(text, base_metadata))
+        total = len(chunks)
+        for c in chunks:
+            c.metadata["total_chunks"] = total
+        return chunks
+
+    def iter_chunks(self, text: str, base_metadata: Dict) -> Iterator[Chunk]:
+        """
+        Yield prefixed chunks in a single pass over ``text`` (character budgets).
+
+        ``chunk_index`` is set on each chunk; ``total_chunks`` is only known once
+        the generator is exhausted, so ``chunk`` fills it in.
+        """
         doc_title = base_metadata.get("document_title", "")
         doc_summary = base_metadata.get("document_summary", "")
 
-        prefixed_chunks = []
-        for i, c in enumerate(final_chunks):
-            c.metadata["chunk_index"] = i
-            c.metadata["total_chunks"] = total
-            
-            section_title = c.metadata.get("section_title", "")
-            
-            prefix_lines = []
-            if doc_title:
-                prefix_lines.append(f"Document: {doc_title}")
-            if section_title:
-                prefix_lines.append(f"Section: {section_title}")
-            if doc_summary:
-                prefix_lines.append(f"Summary: {doc_summary}")
-                
-            if prefix_lines:
-                prefix = "\n".join(prefix_lines) + "\n\n"
-                c.text = prefix + c.text
-            
-            prefixed_chunks.append(c)
-
-        # --- Post-prefix size validation ---
-        # The contextual prefix is injected after the initial size-based split, so chunks
-        # that were right under max_chars can silently exceed the limit once the prefix
-        # ("Document: …\nSection: …\n\n") is prepended.  Re-split any offending chunks
-        # here, keeping the same prefix on every resulting sub-chunk.
-        validated_chunks: list[Chunk] = []
-        global_idx = 0
-        for c in prefixed_chunks:
-            if len(c.text) <= self.max_chars:
-                c.metadata["chunk_index"] = global_idx
-                validated_chunks.append(c)
-                global_idx += 1
-                continue
-
-            # Find where the prefix ends (first blank line after the header block)
-            sep = "\n\n"
-            sep_pos = c.text.find(sep)
-            if sep_pos != -1:
-                prefix = c.text[: sep_pos + len(sep)]
-                content = c.text[sep_pos + len(sep) :]
+        index = 0
+        for section in iter_markdown_sections(text):
+            prefix = contextual_prefix(doc_title, section.metadata.get("section_title", ""), doc_summary)
+            if len(section.text) > self.max_chars:
+                pieces = iter_paragraph_chunks(section.text, self.max_chars, self.overlap_chars)
             else:
-                prefix = ""
-                content = c.text
+                pieces = (section.text,)
 
-            content_budget = max(100, self.max_chars - len(prefix))
-            sub_texts = split_by_paragraphs(content, content_budget, self.overlap_chars)
-            for sub_text in sub_texts:
-                new_meta = c.metadata.copy()
-                new_meta["chunk_index"] = global_idx
-                validated_chunks.append(Chunk(text=prefix + sub_text, metadata=new_meta))
-                global_idx += 1
+            for piece in pieces:
+                for sub_text in self._fit_prefix(prefix + piece):
+                    meta = base_metadata.copy()
+                    meta.update(section.metadata)
+                    meta["chunk_index"] = index
+                    yield Chunk(text=sub_text, metadata=meta)
+                    index += 1
+
+    def _fit_prefix(self, text: str) -> Iterator[str]:
+        # The contextual prefix ("Document: …\nSection: …\n\n") can push a chunk that was
+        # right under max_chars over the limit.  Split the content again with the room
+        # left after the prefix, keeping the same prefix on every resulting sub-chunk.
+        if len(text) <= self.max_chars:
+            yield text
+            return
+
+        # Find where the prefix ends (first blank line after the header block)
+        sep = "\n\n"
+        sep_pos = text.find(sep)
+        if sep_pos != -1:
+            prefix = text[: sep_pos + len(sep)]
+            content = text[sep_pos + len(sep) :]
+        else:
+            prefix = ""
+            content = text
 
-        # Update total_chunks to reflect the final count after post-split expansion
-        final_total = len(validated_chunks)
-        for c in validated_chunks:
-            c.metadata["total_chunks"] = final_total
+        content_budget = max(100, self.max_chars - len(prefix))
+        for sub_text in iter_paragraph_chunks(content, content_budget, self.overlap_chars):
+            yield prefix + sub_text
 
-        return validated_chunks
+    def _chunk_by_tokens(self, text: str, base_metadata: Dict) -> List[Chunk]:
+        sections = split_by_markdown_headers(text)
+        doc_title = base_metadata.get("document_title", "")
+        doc_summary = base_metadata.get("document_summary", "")
+        prefixes = [contextual_prefix(doc_title, s.metadata.get("section_title", ""), doc_summary) for s in sections]
+
+        # One batched tokenizer call for every section and distinct prefix
+        unique_prefixes = sorted(set(prefixes))
+        encodings = self.tokenizer.encode_batch([s.text for s in sections] + unique_prefixes, add_special_tokens=False)
+        prefix_tokens = {p: len(enc.ids) for p, enc in zip(unique_prefixes, encodings[len(sections):])}
+
+        final_chunks: List[Chunk] = []
+        for section, prefix, enc in zip(sections, prefixes, encodings):
+            budget = max(32, self.max_tokens - SPECIAL_TOKENS - prefix_tokens[prefix])
+            if len(enc.ids) <= budget:
+                sub_texts = [section.text]
+            else:
+                sub_texts = split_by_token_budget(section.text, enc.offsets, budget, min(self.overlap_tokens, budget // 2))
+            for sub_text in sub_texts:
+                meta = base_metadata.copy()
+                meta.update(section.metadata)
+                final_chunks.append(Chunk(text=prefix + sub_text, metadata=meta))
+
+        total = len(final_chunks)
+        for i, c in enumerate(final_chunks):
+            c.metadata["chunk_index"] = i
+            c.metadata["total_chunks"] = total
+        return final_chunks
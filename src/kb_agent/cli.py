@@ -10,8 +10,9 @@ warnings.filterwarnings("ignore", message=".*urllib3.*doesn't match a supported
 
 import kb_agent.config as config
 from kb_agent.config import load_settings
+from kb_agent.registry import registry
 
-def run_indexing():
+def run_indexing(workers: int = 1, force: bool = False):
     # Reload settings to ensure we have latest env vars
     load_settings()
     settings = config.settings
@@ -21,8 +22,11 @@ def run_indexing():
         sys.exit(1)
 
     print(f"Indexing documents from {settings.source_docs_path} to {settings.index_path}...")
+    if workers > 1:
+        print(f"Converting source files with {workers} worker processes.")
 
     import shutil
+    import time
     # Ensure index, source and archive paths exist before continuing
     os.makedirs(settings.index_path, exist_ok=True)
     os.makedirs(settings.source_docs_path, exist_ok=True)
@@ -32,22 +36,50 @@ def run_indexing():
     from kb_agent.processor import Processor
     from kb_agent.connectors.local_file import LocalFileConnector
     from kb_agent.graph.graph_builder import GraphBuilder
+    from kb_agent.ingest import IngestStats, iter_converted
 
-    processor = Processor(settings.index_path)
+    processor = Processor(settings.index_path, force=force)
     graph_builder = GraphBuilder(settings.source_docs_path, settings.index_path)
 
     # Read from SOURCE path
-    connector = LocalFileConnector(settings.source_docs_path)
-
     try:
-        all_docs = connector.fetch_all()
+        connector = LocalFileConnector(settings.source_docs_path)
     except FileNotFoundError:
         print(f"Source directory {settings.source_docs_path} not found.")
         sys.exit(1)
 
     count = 0
+    skipped = 0
+    stats = IngestStats()
+    run_start = time.perf_counter()
+
+    def _archive(source_path, file_id):
+        if source_path and os.path.exists(source_path):
+            source_filename = os.path.basename(source_path)
+            dest_path = settings.archive_path / source_filename
+            # If file already exists in archive, handle it (e.g., overwrite or suffix)
+            # Here we just move/overwrite for simplicity as per user request to avoid re-indexing
+            shutil.move(source_path, dest_path)
+            print(f"Archived {file_id} to {settings.archive_path}")
+
+    def _pending_files():
+        # Files whose size/mtime match the manifest are skipped before conversion
+        nonlocal skipped
+        # Materialize the listing up front: files are moved to the archive as we go
+        for path in list(connector.iter_files()):
+            if processor.is_source_unchanged(path.stem, path):
+                skipped += 1
+                print(f"Skipping unchanged {path.stem}")
+                _archive(str(path), path.stem)
+                continue
+            yield path
+
+    for path, doc, error in iter_converted(connector, _pending_files(), stats, workers=workers):
+        if doc is None:
+            if error:
+                print(f"Failed to convert {path.name}: {error}")
+            continue
 
-    for doc in all_docs:
         file_id = doc["id"] # filename
         source_path = doc.get("metadata", {}).get("path")
 
@@ -62,42 +94,80 @@ def run_indexing():
             safe_filename = file_id if file_id.endswith(".md") else f"{file_id}.md"
             index_file_path = settings.index_path / safe_filename
             with open(index_file_path, "w", encoding="utf-8") as f:
-                f.write(doc.get("content", ""))
-                
-            # Point metadata to the generated index file so embeddings correctly trace back to it
-            doc.setdefault("metadata", {})["path"] = str(index_file_path)
-            
-            processor.process(doc)
+                if doc.get("sections") is not None:
+                    # Streamed spreadsheet: each row group is written out as the processor reads it
+                    doc["sections"] = _write_through(doc["sections"], f)
+                else:
+                    f.write(doc.get("content", ""))
+
+                # Point metadata to the generated index file so embeddings correctly trace back to it
+                doc.setdefault("metadata", {})["path"] = str(index_file_path)
+
+                embed_start = time.perf_counter()
+                # Archive the file only once its chunks are upserted and the manifest written,
+                # so a failed or interrupted run leaves it in the source folder to be retried
+                stats.chunks_embedded += processor.process(
+                    doc, source_path=source_path,
+                    on_commit=lambda source_path=source_path, file_id=file_id: _archive(source_path, file_id),
+                )
+                stats.embed_seconds += time.perf_counter() - embed_start
+            stats.docs_embedded += 1
             count += 1
-            
-            # Archive the file
-            if source_path and os.path.exists(source_path):
-                source_filename = os.path.basename(source_path)
-                dest_path = settings.archive_path / source_filename
-                # If file already exists in archive, handle it (e.g., overwrite or suffix)
-                # Here we just move/overwrite for simplicity as per user request to avoid re-indexing
-                shutil.move(source_path, dest_path)
-                print(f"Archived {file_id} to {settings.archive_path}")
 
         except Exception as e:
             print(f"Failed to process {file_id}: {e}")
 
+    # Upsert whatever the cross-document batcher is still holding
+    embed_start = time.perf_counter()
+    try:
+        if not processor.flush():
+            print("Final vector store upsert failed; affected documents will be retried on the next run.")
+    except Exception as e:
+        print(f"Final vector store upsert failed: {e}; affected documents will be retried on the next run.")
+    stats.embed_seconds += time.perf_counter() - embed_start
+
     # Build Knowledge Graph
     try:
         graph_builder.build_graph()
     except Exception as e:
         print(f"Graph build failed: {e}")
 
-    print(f"Indexing complete. Processed {count} documents.")
+    # Bring the grep_search trigram index up to date so the first query doesn't have to
+    if settings.grep_index_enabled is not False:
+        try:
+            from kb_agent.tools.trigram_index import TrigramIndex
+            index_root = Path(settings.index_path)
+            grep_index = registry.get_or_create(("trigram_index", str(index_root)), lambda: TrigramIndex(index_root))
+            grep_index.refresh(force=True)
+        except Exception as e:
+            print(f"Grep index update failed: {e}")
+
+    stats.wall_seconds = time.perf_counter() - run_start
+    print(f"Indexing complete. Processed {count} documents, skipped {skipped} unchanged.")
+    print(stats.report())
+    cache = processor.vector_tool.embedding_cache
+    if cache is not None:
+        cs = cache.stats()
+        print(f"  embedding cache: {cs['hits']} hits / {cs['misses']} misses "
+              f"({cs['hit_rate']:.0%} hit rate), {cs['size_bytes'] / 1e6:.1f} MB on disk")
+    registry.shutdown()
+
+def _write_through(sections, f):
+    """Yield ``sections`` unchanged, writing them to ``f`` joined by blank lines as they pass."""
+    for i, section in enumerate(sections):
+        f.write(("\n\n" if i else "") + section)
+        yield section
 
 def main():
     parser = argparse.ArgumentParser(description="KB Agent CLI")
     parser.add_argument("command", nargs="?", choices=["index", "tui"], default="tui", help="Command to run (default: tui)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for file conversion during 'index' (default: 1, no pool)")
+    parser.add_argument("--force", action="store_true", help="Re-embed every document during 'index', ignoring the index manifest")
 
     args = parser.parse_args()
 
     if args.command == "index":
-        run_indexing()
+        run_indexing(workers=args.workers, force=args.force)
     else:
         # Start GAIP proxy if enabled
         from kb_agent.gaip_proxy import maybe_start_gaip_proxy
@@ -109,6 +179,7 @@ def main():
         try:
             app.run()
         finally:
+            registry.shutdown()
             if proxy:
                 proxy.stop()
 
@@ -21,6 +21,9 @@ class Settings(BaseModel):
     embedding_url: Optional[str] = Field(None, description="URL for the Embedding API. Empty to use local models.")
     embedding_model: Optional[str] = Field(None, description="Model name for embeddings.")
     embedding_model_path: Optional[Path] = Field(None, description="Path to a local ONNX embedding model directory. Overrides default if embedding_url is empty.")
+    embedding_max_batch_tokens: Optional[int] = Field(16384, description="Padded-token budget per local ONNX embedding batch; inputs are bucketed by length under it (0 = single batch)")
+    embedding_cache_enabled: Optional[bool] = Field(True, description="Cache chunk embeddings on disk (keyed by model + text hash) so unchanged text is never re-embedded")
+    embedding_cache_max_mb: Optional[int] = Field(512, description="Size cap in MB for the on-disk embedding cache; least-recently-used entries are evicted beyond it")
     
     # Agent/RAG Configuration
     max_iterations: Optional[int] = Field(None, description="Max iterations for agent RAG loops")
@@ -30,10 +33,24 @@ class Settings(BaseModel):
     auto_approve_max_items: Optional[int] = Field(None, description="Fast-path threshold for few-context auto-approve")
     chunk_max_chars: Optional[int] = Field(800, description="Max characters per chunk for knowledge document splitting")
     chunk_overlap_chars: Optional[int] = Field(200, description="Character overlap between consecutive chunks")
+    spreadsheet_group_rows: Optional[int] = Field(50, description="Max rows per spreadsheet row group when indexing XLSX/CSV; each group is a table with its own header, sized to fit one chunk")
+    chunk_max_tokens: Optional[int] = Field(None, description="If set, size chunks by tokens of the local embedding model's tokenizer (prefix included) instead of chunk_max_chars")
+    chunk_overlap_tokens: Optional[int] = Field(64, description="Token overlap between consecutive chunks when chunk_max_tokens is set")
+    embed_batch_max_chunks: Optional[int] = Field(256, description="Max chunks accumulated across documents before one embedding + upsert call during indexing")
+    embed_batch_max_tokens: Optional[int] = Field(65536, description="Approximate token budget accumulated across documents before flushing an indexing batch")
+    hybrid_rrf_k: Optional[int] = Field(60, description="Reciprocal rank fusion constant k used by hybrid_search to merge BM25 and vector rankings")
+    grep_index_enabled: Optional[bool] = Field(True, description="Serve grep_search from an incrementally maintained trigram index over index_path instead of running rg per query")
+    grep_max_matches_per_file: Optional[int] = Field(20, description="Max matching lines considered per file by grep_search (rg --max-count) so broad keywords stay cheap")
     debug_mode: Optional[bool] = Field(False, description="Enable debug mode to show detailed chunks in the TUI")
     use_reranker: Optional[bool] = Field(False, description="Enable cross-encoder reranking for context chunks")
     rerank_top_n: Optional[int] = Field(4, description="Number of results to keep after reranking")
     reranker_model_path: Optional[Path] = Field(Path('models/bge-reranker-v2-m3-Q4_K_M.gguf'), description="Path to local GGUF reranker model")
+    rerank_batch_size: Optional[int] = Field(8, description="Query-chunk pairs scored per llama.cpp evaluation by the reranker (1 = one chunk at a time)")
+    rerank_first_stage_k: Optional[int] = Field(0, description="Chunks kept by the cheap first-stage filter (similarity + term overlap) before cross-encoding; 0 (default) sends every chunk to the cross-encoder")
+    rerank_early_exit_margin: Optional[float] = Field(0.0, description="Skip the cross-encoder when the first stage separates the top chunks from the rest by at least this margin (0 = never)")
+    rerank_cache_size: Optional[int] = Field(2048, description="Query-chunk scores kept in the reranker's LRU cache across graph iterations and turns (0 = disabled)")
+    reranker_backend: Optional[str] = Field("llama_cpp", description="Reranker backend: 'llama_cpp' (GGUF via reranker_model_path) or 'onnx' (cross-encoder directory via reranker_onnx_path)")
+    reranker_onnx_path: Optional[Path] = Field(None, description="Directory with model.onnx + tokenizer.json of an ONNX cross-encoder reranker (used when reranker_backend='onnx')")
 
     # Paths
     data_folder: Optional[Path] = Field(None, description="Base directory for kb-agent data")
@@ -42,6 +59,17 @@ class Settings(BaseModel):
     archive_path: Optional[Path] = Field(None, description="Path to archive processed docs")
     audit_log_path: Optional[Path] = Field(None, description="Path to the audit log file")
     cache_path: Optional[Path] = Field(None, description="Path for caching external connector data")
+    csv_cache_max_mb: Optional[int] = Field(512, description="Memory budget in MB for parsed CSVs kept by csv_info/csv_query; least-recently-used files are evicted beyond it")
+    csv_stream_threshold_mb: Optional[int] = Field(256, description="CSV files larger than this (MB) are queried chunk by chunk instead of being loaded into memory (0 = never stream)")
+    csv_stream_chunk_rows: Optional[int] = Field(100000, description="Rows read per chunk when csv_query streams a large CSV")
+    csv_sidecar_enabled: Optional[bool] = Field(True, description="Keep a columnar copy (Parquet, or pickle without pyarrow) of each parsed CSV under cache_path so later loads skip CSV parsing")
+    csv_sql_enabled: Optional[bool] = Field(True, description="Enable the csv_sql tool, which copies CSVs from archive/ and input/ into an indexed SQLite database under cache_path and runs read-only SQL on it")
+    csv_sql_max_rows: Optional[int] = Field(200, description="Maximum rows returned by one csv_sql query")
+    csv_sql_timeout_seconds: Optional[int] = Field(10, description="Wall-clock limit in seconds for one csv_sql query")
+    pdf_page_cache_enabled: Optional[bool] = Field(True, description="Cache extracted PDF page text under cache_path, keyed by page content, so re-indexing a PDF only re-extracts changed pages")
+    pdf_page_cache_max_mb: Optional[int] = Field(256, description="Size cap in MB for the PDF page text cache; pages not read for longest are evicted beyond it")
+    pdf_extract_workers: Optional[int] = Field(0, description="Worker processes for extracting large PDFs page range by page range (0 = min(4, CPU count))")
+    graph_build_workers: Optional[int] = Field(0, description="Worker processes that parse changed Markdown files when building the knowledge graph (0 = min(4, CPU count))")
     skills_path: Optional[Path] = Field(None, description="Path to skill playbook YAML files")
     output_path: Optional[Path] = Field(None, description="Path to write skill execution outputs")
     python_code_path: Optional[Path] = Field(None, description="Path to store agent-generated Python scripts")
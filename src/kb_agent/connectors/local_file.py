@@ -1,14 +1,18 @@
-import pandas as pd
 from docx import Document
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 from .base import BaseConnector
+import kb_agent.config as config
 
 class LocalFileConnector(BaseConnector):
     """
     Connector for reading local files (Excel, Word, Markdown) and converting them to a common format.
     """
 
+    SUPPORTED_EXTENSIONS = {".md", ".txt", ".docx", ".xlsx", ".csv", ".pdf"}
+    # Converted lazily into "sections" by ``read_document(..., stream=True)``
+    STREAMED_EXTENSIONS = {".xlsx", ".csv"}
+
     def __init__(self, source_dir: Path):
         self.source_dir = Path(source_dir)
         if not self.source_dir.exists():
@@ -21,35 +25,57 @@ class LocalFileConnector(BaseConnector):
         query_lower = query.lower()
         for file_path in self.source_dir.rglob("*"):
             if file_path.is_file() and query_lower in file_path.name.lower():
-                content = self._read_file(file_path)
-                if content is not None:
-                    if not content.strip():
-                        print(f"Warning: Extracted empty text from {file_path.name}")
-                    results.append({
-                        "id": file_path.stem,
-                        "title": file_path.stem,
-                        "content": content,
-                        "metadata": {"source": "local_file", "path": str(file_path), "type": file_path.suffix}
-                    })
+                doc = self.read_document(file_path)
+                if doc is not None:
+                    results.append(doc)
         return results
 
     def fetch_all(self) -> List[Dict[str, Any]]:
-        results = []
-        # Support recursive search for common document types, case-insensitive
-        supported_extensions = {".md", ".txt", ".docx", ".xlsx", ".csv", ".pdf"}
+        return list(self.iter_all())
+
+    def iter_files(self) -> Iterator[Path]:
+        """Yield every supported source file under ``source_dir`` (recursive, case-insensitive suffix)."""
         for file_path in self.source_dir.rglob("*"):
-            if file_path.is_file() and file_path.suffix.lower() in supported_extensions:
-                content = self._read_file(file_path)
-                if content is not None:
-                    if not content.strip():
-                        print(f"Warning: Extracted empty text from {file_path.name}")
-                    results.append({
-                        "id": file_path.stem,
-                        "title": file_path.stem,
-                        "content": content,
-                        "metadata": {"source": "local_file", "path": str(file_path), "type": file_path.suffix}
-                    })
-        return results
+            if file_path.is_file() and file_path.suffix.lower() in self.SUPPORTED_EXTENSIONS:
+                yield file_path
+
+    def iter_all(self) -> Iterator[Dict[str, Any]]:
+        """Lazily convert every supported file, one document at a time."""
+        for file_path in self.iter_files():
+            doc = self.read_document(file_path)
+            if doc is not None:
+                yield doc
+
+    def read_document(self, file_path: Path, stream: bool = False) -> Optional[Dict[str, Any]]:
+        """Convert a single file into the common document dict, or None if unreadable.
+
+        With ``stream=True`` spreadsheets are not converted up front: the dict carries
+        "sections", a generator of row-group Markdown, instead of "content".  It reads
+        the file as it is iterated, so conversion errors surface there.
+        """
+        file_path = Path(file_path)
+        if stream and self.is_streamed(file_path):
+            from .spreadsheet import iter_spreadsheet_markdown
+            return {
+                "id": file_path.stem,
+                "title": file_path.stem,
+                "sections": iter_spreadsheet_markdown(file_path),
+                "metadata": {"source": "local_file", "path": str(file_path), "type": file_path.suffix}
+            }
+        content = self._read_file(file_path)
+        if content is None:
+            return None
+        if not content.strip():
+            print(f"Warning: Extracted empty text from {file_path.name}")
+        return {
+            "id": file_path.stem,
+            "title": file_path.stem,
+            "content": content,
+            "metadata": {"source": "local_file", "path": str(file_path), "type": file_path.suffix}
+        }
+
+    def is_streamed(self, file_path: Path) -> bool:
+        return Path(file_path).suffix.lower() in self.STREAMED_EXTENSIONS
 
     def _read_file(self, file_path: Path) -> Optional[str]:
         """Reads a file and converts it to Markdown text."""
@@ -73,23 +99,44 @@ class LocalFileConnector(BaseConnector):
 
     def _read_pdf(self, file_path: Path) -> str:
         try:
-            import fitz  # PyMuPDF
+            import fitz  # noqa: F401  (PyMuPDF)
         except ImportError:
             # Fallback if fitz missing
             return f"[PDF parsing requires pymupdf. File: {file_path.name}]"
-            
-        doc = fitz.open(file_path)
+
+        from .pdf_pages import default_workers, read_pdf_pages
+
+        settings = config.settings
+        pages = read_pdf_pages(file_path, cache=self._pdf_page_cache(), workers=default_workers(settings))
         full_text = []
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            text = page.get_text("text").strip()
-            
+        for page_num, text in enumerate(pages):
             if text:
                 # Inject Structural Metadata Headers enabling downstream Semantic Chunking
                 full_text.append(f"## Page {page_num + 1}\n\n{text}")
                 
         return "\n\n".join(full_text)
 
+    @staticmethod
+    def _pdf_page_cache():
+        settings = config.settings
+        if not settings or getattr(settings, "pdf_page_cache_enabled", True) is False:
+            return None
+        from kb_agent.registry import registry
+        from .pdf_pages import PageTextCache, default_cache_path
+
+        try:
+            path = default_cache_path(settings)
+            if path is None:
+                return None
+            max_mb = getattr(settings, "pdf_page_cache_max_mb", None)
+            max_bytes = (max_mb if isinstance(max_mb, int) and max_mb >= 0 else 256) * 1024 * 1024
+            return registry.get_or_create(
+                ("pdf_page_cache", str(path)), lambda: PageTextCache(path, max_bytes=max_bytes)
+            )
+        except Exception as e:
+            print(f"Warning: PDF page cache unavailable: {e}")
+            return None
+
     def _read_docx(self, file_path: Path) -> str:
         doc = Document(file_path)
         full_text = []
@@ -128,33 +175,17 @@ class LocalFileConnector(BaseConnector):
         return "\n\n".join(full_text)
 
     def _read_spreadsheet(self, file_path: Path) -> str:
-        # Convert spreadsheet to Markdown table with row limits
-        max_rows = 1000
-        
-        if file_path.suffix == ".csv":
-            df = pd.read_csv(file_path, nrows=max_rows + 1)
-            is_truncated = False
-            if len(df) > max_rows:
-                df = df.head(max_rows)
-                is_truncated = True
-                
-            md_text = df.to_markdown(index=False)
-            if is_truncated:
-                md_text += f"\n\n[TRUNCATED: {len(df)} limit reached, more rows omitted]"
-            return md_text
-        else:
-            # Excel might have multiple sheets
-            dfs = pd.read_excel(file_path, sheet_name=None, nrows=max_rows + 1)
-            md_parts = []
-            for sheet_name, df in dfs.items():
-                is_truncated = False
-                if len(df) > max_rows:
-                    df = df.head(max_rows)
-                    is_truncated = True
-                    
-                md_text = f"## Sheet: {sheet_name}\n\n" + df.to_markdown(index=False)
-                if is_truncated:
-                    md_text += f"\n\n[TRUNCATED: {len(df)} limit reached, more rows in this sheet omitted]"
-                md_parts.append(md_text)
-                
-            return "\n\n".join(md_parts)
+        # Every row is indexed: sheets are streamed into self-contained row-group tables.
+        # This joins them into one string; indexing uses read_document(stream=True)
+        # instead, so memory stays flat however large the sheet -- see scripts/bench_spreadsheet.py.
+        from .spreadsheet import iter_spreadsheet_markdown
+        return "\n\n".join(iter_spreadsheet_markdown(file_path))
+
+
+def convert_file(source_dir: str, file_path: str) -> Optional[Dict[str, Any]]:
+    """Process-pool entry point: convert one file in a worker process.
+
+    Module-level (and taking plain strings) so it pickles cleanly for
+    ``ProcessPoolExecutor``.
+    """
+    return LocalFileConnector(Path(source_dir)).read_document(Path(file_path))
@@ -0,0 +1,255 @@
+"""
+Page-level PDF text extraction for ``LocalFileConnector``.
+
+Large PDFs are split into contiguous page ranges that worker processes
+extract in parallel (PyMuPDF releases little of the GIL, so threads don't
+help); results are reassembled in page order.  Workers are spawned, not
+forked, and a process that is itself a conversion worker (``kb-agent index
+--workers N``) extracts serially instead of starting a pool of its own.
+
+Extracted text is cached per page in SQLite under ``cache_path``, keyed by a
+digest of the page's content streams, geometry and resources (fonts with their
+ToUnicode maps and encodings, Form XObjects, recursively) rather than of the
+whole file: when one page of a re-exported PDF changes, every other page is
+still a cache hit and only the changed page is extracted again.  Pages not
+read for longest are evicted once the cache outgrows its size cap.
+"""
+
+import concurrent.futures
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("kb_agent")
+
+PAGE_CACHE_FILENAME = "pdf_pages.db"
+
+# Below this many pages to extract, process start-up costs more than it saves
+PARALLEL_MIN_PAGES = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    digest BLOB PRIMARY KEY,
+    text TEXT NOT NULL,
+    last_used INTEGER NOT NULL
+) WITHOUT ROWID
+"""
+
+
+_REF = re.compile(r"(\d+) (\d+) R\b")
+
+
+def _object_digest(doc, xref: int, memo: Dict[int, str]) -> str:
+    """
+    Digest of an indirect object and everything it references.
+
+    References are replaced by the digest of their target, so the result does not
+    depend on xref numbers (which change whenever the file is rewritten).  Image
+    data is skipped: it cannot change extracted text.
+    """
+    if xref in memo:
+        return memo[xref]
+    if xref <= 0 or xref >= doc.xref_length():
+        return "null"
+    # Placeholder while the object is being hashed, in case something refers back to it
+    memo[xref] = "cycle"
+    source = doc.xref_object(xref, compressed=True)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(_REF.sub(lambda m: _object_digest(doc, int(m.group(1)), memo), source).encode("utf-8"))
+    if doc.xref_is_stream(xref) and "/Subtype/Image" not in source:
+        h.update(b"\x00")
+        h.update(doc.xref_stream(xref) or b"")
+    memo[xref] = h.hexdigest()
+    return memo[xref]
+
+
+def _resources_digest(doc, page, memo: Dict[int, str]) -> str:
+    """Digest of the page's /Resources, inherited from its ancestors if the page has none."""
+    xref = page.xref
+    while xref > 0:
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != "null":
+            return _REF.sub(lambda m: _object_digest(doc, int(m.group(1)), memo), value)
+        kind, value = doc.xref_get_key(xref, "Parent")
+        xref = int(value.split()[0]) if kind == "xref" else 0
+    return ""
+
+
+def page_digest(doc, page_num: int, memo: Optional[Dict[int, str]] = None) -> bytes:
+    """
+    Digest of everything that determines a page's extracted text.
+
+    ``memo`` caches object digests across pages of the same document, so shared
+    fonts and forms are hashed once.
+    """
+    page = doc[page_num]
+    h = hashlib.blake2b(digest_size=20)
+    for xref in page.get_contents():
+        h.update(doc.xref_stream(xref) or b"")
+        h.update(b"\x00")
+    h.update(repr((page.rotation, tuple(page.rect))).encode("utf-8"))
+    h.update(_resources_digest(doc, page, memo if memo is not None else {}).encode("utf-8"))
+    return h.digest()
+
+
+def extract_pages(file_path: str, page_nums: Sequence[int]) -> List[Tuple[int, str]]:
+    """Text of the given pages (0-based). Module-level so worker processes can run it."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(file_path) as doc:
+        return [(n, doc[n].get_text("text").strip()) for n in page_nums]
+
+
+def _ranges(page_nums: List[int], parts: int) -> List[List[int]]:
+    size = -(-len(page_nums) // parts)
+    return [page_nums[i:i + size] for i in range(0, len(page_nums), size)]
+
+
+def extract_pages_parallel(file_path: str, page_nums: List[int], workers: int) -> Dict[int, str]:
+    """Extract ``page_nums`` across ``workers`` processes; falls back to serial extraction on failure."""
+    if workers > 1 and len(page_nums) >= PARALLEL_MIN_PAGES:
+        try:
+            # "spawn" rather than fork: serial indexing has already loaded ONNX Runtime /
+            # Chroma in this process, whose thread pools don't survive fork
+            ctx = multiprocessing.get_context("spawn")
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                futures = [pool.submit(extract_pages, file_path, r) for r in _ranges(page_nums, workers)]
+                return {n: text for future in futures for n, text in future.result()}
+        except Exception as e:
+            logger.warning(f"Parallel PDF extraction failed for {file_path} ({e}); extracting serially.")
+    return dict(extract_pages(file_path, page_nums))
+
+
+def default_workers(settings) -> int:
+    if multiprocessing.parent_process() is not None:
+        # Already a worker of the ingest pool: its siblings keep the CPUs busy
+        return 1
+    workers = getattr(settings, "pdf_extract_workers", None) if settings else None
+    if isinstance(workers, int) and workers > 0:
+        return workers
+    return min(4, os.cpu_count() or 1)
+
+
+class PageTextCache:
+    """SQLite map of page digest → extracted text, evicted least-recently-used past ``max_bytes``."""
+
+    def __init__(self, db_path: Path, max_bytes: int = 256 * 1024 * 1024):
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_last_used ON pages(last_used)")
+        self._conn.commit()
+        self._size_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(CAST(text AS BLOB))), 0) FROM pages"
+        ).fetchone()[0]
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    def get_many(self, digests: List[bytes]) -> Dict[bytes, str]:
+        found: Dict[bytes, str] = {}
+        if not digests:
+            return found
+        with self._lock:
+            unique = list(dict.fromkeys(digests))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for digest, text in self._conn.execute(
+                    f"SELECT digest, text FROM pages WHERE digest IN ({placeholders})", batch
+                ):
+                    found[bytes(digest)] = text
+            if found:
+                now = time.time_ns()
+                self._conn.executemany("UPDATE pages SET last_used = ? WHERE digest = ?", [(now, d) for d in found])
+                self._conn.commit()
+            self.hits += sum(1 for d in digests if d in found)
+            self.misses += sum(1 for d in digests if d not in found)
+        return found
+
+    def put_many(self, items: Dict[bytes, str]):
+        if not items:
+            return
+        now = time.time_ns()
+        rows = [(d, text, now) for d, text in items.items()]
+        with self._lock:
+            for digest, text, _ in rows:
+                old = self._conn.execute(
+                    "SELECT LENGTH(CAST(text AS BLOB)) FROM pages WHERE digest = ?", (digest,)
+                ).fetchone()
+                self._size_bytes += len(text.encode("utf-8")) - (old[0] if old else 0)
+            self._conn.executemany("INSERT OR REPLACE INTO pages (digest, text, last_used) VALUES (?, ?, ?)", rows)
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        if self.max_bytes <= 0 or self._size_bytes <= self.max_bytes:
+            return
+        # Evict down to 90% of the cap so we don't evict on every subsequent insert
+        target = int(self.max_bytes * 0.9)
+        while self._size_bytes > target:
+            rows = self._conn.execute(
+                "SELECT digest, LENGTH(CAST(text AS BLOB)) FROM pages ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._size_bytes = 0
+                break
+            victims = []
+            for digest, length in rows:
+                victims.append((digest,))
+                self._size_bytes -= length
+                if self._size_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM pages WHERE digest = ?", victims)
+            self.evictions += len(victims)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def default_cache_path(settings) -> Optional[Path]:
+    if settings is None or not getattr(settings, "cache_path", None):
+        return None
+    return Path(settings.cache_path) / PAGE_CACHE_FILENAME
+
+
+def read_pdf_pages(file_path: Path, cache: Optional[PageTextCache] = None, workers: int = 1) -> List[str]:
+    """Stripped text of every page in order; only pages missing from ``cache`` are extracted."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(file_path) as doc:
+        page_count = len(doc)
+        memo: Dict[int, str] = {}
+        digests = [page_digest(doc, n, memo) for n in range(page_count)] if cache is not None else []
+        cached = cache.get_many(digests) if cache is not None else {}
+        missing = [n for n in range(page_count) if not digests or digests[n] not in cached]
+
+        if workers > 1 and len(missing) >= PARALLEL_MIN_PAGES:
+            extracted = None
+        else:
+            # Small job: reuse the document we already have open
+            extracted = {n: doc[n].get_text("text").strip() for n in missing}
+
+    if extracted is None:
+        extracted = extract_pages_parallel(str(file_path), missing, workers)
+    if cache is not None and missing:
+        cache.put_many({digests[n]: extracted[n] for n in missing})
+
+    return [cached[digests[n]] if n not in extracted else extracted[n] for n in range(page_count)]
@@ -0,0 +1,124 @@
+"""
+Streaming spreadsheet → Markdown conversion for ``LocalFileConnector``.
+
+CSV files are read in chunks with pandas, XLSX sheets row by row with
+openpyxl's read-only mode, so no sheet is ever held in memory as a whole.
+Rows are emitted in groups small enough to become one chunk each; every
+group is its own Markdown table under a ``## ... (rows a-b)`` heading with
+the column header repeated, so a retrieved chunk is self-contained.
+"""
+
+import datetime
+import itertools
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+import kb_agent.config as config
+
+# Room left in a chunk for the contextual prefix and the group heading
+_PREFIX_ALLOWANCE = 150
+CSV_READ_ROWS = 10000
+
+
+def group_limits(settings=None):
+    """(max characters, max rows) per row group, derived from the chunk size."""
+    settings = settings if settings is not None else config.settings
+    max_chars = getattr(settings, "chunk_max_chars", None) if settings else None
+    max_rows = getattr(settings, "spreadsheet_group_rows", None) if settings else None
+    max_chars = max_chars if isinstance(max_chars, int) and max_chars > 0 else 800
+    max_rows = max_rows if isinstance(max_rows, int) and max_rows > 0 else 50
+    return max(200, max_chars - _PREFIX_ALLOWANCE), max_rows
+
+
+def format_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return ""
+        if value.is_integer():
+            return str(int(value))
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time(0):
+        return value.date().isoformat()
+    return str(value).replace("\r\n", " ").replace("\n", " ").replace("|", "\\|").strip()
+
+
+def _row_line(cells: Sequence[str]) -> str:
+    return "| " + " | ".join(cells) + " |"
+
+
+def iter_row_groups(header: Sequence[str], rows: Iterable[Sequence], title: str,
+                    max_chars: int, max_rows: int) -> Iterator[str]:
+    """
+    Yield ``## {title} (rows a-b)`` sections, each a complete Markdown table.
+
+    A group closes once it holds ``max_rows`` rows or the next row would push
+    it past ``max_chars`` (a single oversized row still gets its own group).
+    Row numbers count data rows from 1.
+    """
+    width = len(header)
+    head = _row_line(header) + "\n" + _row_line(["---"] * width)
+    lines: List[str] = []
+    size = len(head)
+    first = 1
+    row_num = 0
+    for row in rows:
+        cells = [format_cell(v) for v in row]
+        if not any(cells):
+            continue
+        cells = (cells + [""] * width)[:width] if len(cells) != width else cells
+        line = _row_line(cells)
+        if lines and (len(lines) >= max_rows or size + len(line) + 1 > max_chars):
+            yield f"## {title} (rows {first}-{row_num})\n\n{head}\n" + "\n".join(lines)
+            lines = []
+            size = len(head)
+            first = row_num + 1
+        row_num += 1
+        lines.append(line)
+        size += len(line) + 1
+    if lines or row_num == 0:
+        label = f"rows {first}-{row_num}" if lines else "no rows"
+        yield f"## {title} ({label})\n\n{head}" + ("\n" + "\n".join(lines) if lines else "")
+
+
+def _header(values: Sequence) -> List[str]:
+    return [format_cell(v) or f"Unnamed: {i}" for i, v in enumerate(values)]
+
+
+def iter_csv_markdown(file_path: Path, max_chars: int, max_rows: int) -> Iterator[str]:
+    import pandas as pd
+
+    # Everything as text: the Markdown shows the values exactly as written in the file
+    with pd.read_csv(file_path, dtype=str, keep_default_na=False, chunksize=CSV_READ_ROWS) as reader:
+        frames = iter(reader)
+        first = next(frames, None)
+        if first is None:
+            return
+
+        def _rows():
+            for frame in itertools.chain([first], frames):
+                yield from frame.itertuples(index=False, name=None)
+
+        yield from iter_row_groups(_header(first.columns), _rows(), "Rows", max_chars, max_rows)
+
+
+def iter_xlsx_markdown(file_path: Path, max_chars: int, max_rows: int) -> Iterator[str]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            first = next(rows, None)
+            if first is None:
+                continue
+            yield from iter_row_groups(_header(first), rows, f"Sheet: {ws.title}", max_chars, max_rows)
+    finally:
+        wb.close()
+
+
+def iter_spreadsheet_markdown(file_path: Path, settings=None) -> Iterator[str]:
+    max_chars, max_rows = group_limits(settings)
+    if file_path.suffix.lower() == ".csv":
+        return iter_csv_markdown(file_path, max_chars, max_rows)
+    return iter_xlsx_markdown(file_path, max_chars, max_rows)
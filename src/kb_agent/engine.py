@@ -21,6 +21,7 @@ from kb_agent.processor import Processor
 # Agentic RAG (LangGraph)
 from kb_agent.agent.graph import compile_graph
 from kb_agent.agent.tools import reset_tools_cache
+from kb_agent.registry import registry
 
 # Regex to detect URLs, Jira tickets, and Confluence page IDs
 _URL_PATTERN = re.compile(r'https?://[^\s<>"\']+')
@@ -36,11 +37,11 @@ class Engine:
         self.web_connector = WebConnector()
         self._docs_path = Path("docs")
 
-        # Clear cached tool instances so they pick up new config
+        # Clear cached tool instances (and the graph wired to them) so they pick up new config
         reset_tools_cache()
 
-        # Compile the agentic RAG graph once
-        self._graph = compile_graph()
+        # Compiled once per Engine; queries and warmup share it through the registry
+        self._graph = registry.graph(compile_graph)
 
     def _get_processor(self) -> Processor:
         """Lazy load processor to avoid circular imports or early config checks."""
@@ -301,6 +302,16 @@ class Engine:
                 logger.warning(f"Processor failed for {target}: {e}")
                 errors.append(str(e))
 
+        # Chunks are batched across docs; write out whatever is still buffered
+        try:
+            if not processor.flush():
+                errors.append("Vector store upsert failed")
+        except Exception as e:
+            logger.warning(f"Processor flush failed for {target}: {e}")
+            errors.append(str(e))
+        finally:
+            processor.close()
+
         if errors:
             err_msg = "; ".join(errors)
             msg = f"Error processing {target}: {err_msg}"
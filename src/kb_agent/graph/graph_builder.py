@@ -1,151 +1,256 @@
 import networkx as nx
+import collections
+import concurrent.futures
+import multiprocessing
 import os
 import re
-import json
 import logging
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 import hashlib
 from datetime import datetime
 
+import kb_agent.config as config
+from kb_agent.graph.graph_store import GraphStore, LEGACY_JSON_FILENAME, default_store_path
+
 logger = logging.getLogger("kb_agent")
 
+# Changes are committed every this many processed files, so an interrupted build keeps its progress
+COMMIT_EVERY = 500
+
+# Below this many changed files, process start-up costs more than parallel parsing saves
+PARALLEL_MIN_FILES = 256
+# Files per task sent to a parse worker
+PARSE_BATCH_FILES = 64
+
+# Regex patterns (module-level so worker processes can use them)
+JIRA_LINK_PATTERN = re.compile(r'\[([A-Z]+-\d+)\]')
+MD_LINK_PATTERN = re.compile(r'\[.*?\]\((.*?)\)')
+WIKI_LINK_PATTERN = re.compile(r'\[\[(.*?)\]\]')
+
+PARENT_PATTERN = re.compile(r'Parent:\s*\[([A-Z]+-\d+)\]', re.IGNORECASE)
+CLONES_PATTERN = re.compile(r'Clones:\s*\[([A-Z]+-\d+)\]', re.IGNORECASE)
+BLOCKS_PATTERN = re.compile(r'Blocks:\s*\[([A-Z]+-\d+)\]', re.IGNORECASE)
+
+# (target, relation, target is a Jira issue, edge points from target to source)
+Relation = Tuple[str, str, bool, bool]
+
+
+def extract_relations(content: str) -> List[Relation]:
+    """Links found in a Markdown file, in the order the edges are added to the graph."""
+    relations: List[Relation] = []
+
+    # 1. Jira Links
+    parent_match = PARENT_PATTERN.search(content)
+    if parent_match:
+        target_id = parent_match.group(1)
+        relations.append((target_id, "PARENT_OF", True, True))
+        relations.append((target_id, "CHILD_OF", True, False))
+
+    for link in JIRA_LINK_PATTERN.findall(content):
+        relations.append((link, "MENTIONS", True, False))
+
+    # 2. Internal Links
+    for link in MD_LINK_PATTERN.findall(content):
+        relations.append((str(Path(link)), "REFERENCES", False, False))
+
+    return relations
+
+
+def parse_file(file_path: str) -> Tuple[str, List[Relation]]:
+    """(content hash, relations) of one file. Module-level so worker processes can run it."""
+    content = Path(file_path).read_text(encoding="utf-8", errors="ignore")
+    return hashlib.md5(content.encode("utf-8")).hexdigest(), extract_relations(content)
+
+
+def _safe_parse_file(file_path: str):
+    try:
+        return parse_file(file_path)
+    except Exception as e:
+        return e
+
+
+def _safe_parse_files(file_paths: List[str]) -> list:
+    return [_safe_parse_file(path) for path in file_paths]
+
+
+def file_signature(st: os.stat_result) -> Dict[str, int]:
+    """Stat fields stored on file nodes; content is only re-read when they change."""
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+
+def default_workers(settings) -> int:
+    workers = getattr(settings, "graph_build_workers", None) if settings else None
+    if isinstance(workers, int) and workers > 0:
+        return workers
+    return min(4, os.cpu_count() or 1)
+
+
 class GraphBuilder:
-    def __init__(self, source_path: Path, index_path: Path):
+    def __init__(self, source_path: Path, index_path: Path, workers: Optional[int] = None):
         self.source_path = source_path
         self.index_path = index_path
-        self.graph_path = index_path / "knowledge_graph.json"
+        # Written by older versions; imported into the SQLite store once
+        self.graph_path = index_path / LEGACY_JSON_FILENAME
+        self.store = GraphStore(default_store_path(index_path))
+        self.store.import_legacy_json(self.graph_path)
         self.graph = nx.DiGraph()
+        self.workers = workers if workers is not None else default_workers(config.settings)
 
         # Regex patterns
-        self.jira_link_pattern = re.compile(r'\[([A-Z]+-\d+)\]')
-        self.md_link_pattern = re.compile(r'\[.*?\]\((.*?)\)')
-        self.wiki_link_pattern = re.compile(r'\[\[(.*?)\]\]')
+        self.jira_link_pattern = JIRA_LINK_PATTERN
+        self.md_link_pattern = MD_LINK_PATTERN
+        self.wiki_link_pattern = WIKI_LINK_PATTERN
 
-        self.parent_pattern = re.compile(r'Parent:\s*\[([A-Z]+-\d+)\]', re.IGNORECASE)
-        self.clones_pattern = re.compile(r'Clones:\s*\[([A-Z]+-\d+)\]', re.IGNORECASE)
-        self.blocks_pattern = re.compile(r'Blocks:\s*\[([A-Z]+-\d+)\]', re.IGNORECASE)
+        self.parent_pattern = PARENT_PATTERN
+        self.clones_pattern = CLONES_PATTERN
+        self.blocks_pattern = BLOCKS_PATTERN
+
+    def _parse_all(self, paths: List[str]) -> Iterator:
+        """
+        (hash, relations) or the exception raised, per path and in order; parallel for
+        large batches.  Results are yielded as their batch completes, with at most
+        2x workers batches in flight, so they never pile up ahead of the caller.
+        """
+        done = 0
+        if self.workers > 1 and len(paths) >= PARALLEL_MIN_FILES:
+            batches = [paths[i:i + PARSE_BATCH_FILES] for i in range(0, len(paths), PARSE_BATCH_FILES)]
+            try:
+                # "spawn" rather than fork: run_indexing has already loaded ONNX Runtime /
+                # Chroma in this process, whose thread pools don't survive fork
+                ctx = multiprocessing.get_context("spawn")
+                with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx) as pool:
+                    in_flight = collections.deque()
+                    next_batch = 0
+                    while in_flight or next_batch < len(batches):
+                        while next_batch < len(batches) and len(in_flight) < self.workers * 2:
+                            in_flight.append(pool.submit(_safe_parse_files, batches[next_batch]))
+                            next_batch += 1
+                        for result in in_flight.popleft().result():
+                            yield result
+                            done += 1
+                return
+            except Exception as e:
+                logger.warning(f"Parallel graph parsing failed ({e}); parsing the rest serially.")
+        for path in paths[done:]:
+            yield _safe_parse_file(path)
 
     def build_graph(self):
-        """Scans source docs and builds the graph incrementally."""
+        """Scans source docs and updates the graph store incrementally."""
         logger.info(f"Building Knowledge Graph from {self.source_path}...")
 
-        # Load existing graph to preserve unaffected nodes/edges
-        self.load_graph()
+        stored_files = self.store.node_attrs_of_type("file")
 
         # Track active files to remove deleted ones later
         active_files = set()
+        # (file_id, file name, folder id, stat signature) of files whose stat changed
+        pending: List[Tuple[str, str, str, Dict[str, int]]] = []
+        pending_paths: List[str] = []
 
         for root, dirs, files in os.walk(self.source_path):
             root_path = Path(root)
 
             # Add Folder Nodes
             rel_root = root_path.relative_to(self.source_path)
-            if str(rel_root) != ".":
-                self.graph.add_node(str(rel_root), type="folder", label=rel_root.name)
+            if str(rel_root) != "." and not self.store.has_node(str(rel_root)):
+                self.store.add_node(str(rel_root), type="folder", label=rel_root.name)
                 parent_dir = rel_root.parent
                 if str(parent_dir) != ".":
-                     self.graph.add_edge(str(parent_dir), str(rel_root), relation="CONTAINS")
+                     self.store.add_edge(str(parent_dir), str(rel_root), relation="CONTAINS")
 
             for file in files:
                 if not file.lower().endswith(".md"):
                     continue
 
                 file_path = root_path / file
-                rel_path = file_path.relative_to(self.source_path)
-                file_id = str(rel_path)
+                file_id = str(file_path.relative_to(self.source_path))
                 active_files.add(file_id)
 
-                # Check hash for incremental update
+                # Stat pre-check: unchanged size/mtime/inode means unchanged content
                 try:
-                    content = file_path.read_text(encoding="utf-8", errors="ignore")
-                    current_hash = hashlib.md5(content.encode("utf-8")).hexdigest()
+                    signature = file_signature(file_path.stat())
+                except OSError as e:
+                    logger.warning(f"Failed to stat {file_path} for graph: {e}")
+                    continue
+                stored = stored_files.get(file_id)
+                if stored is not None and all(stored.get(k) == v for k, v in signature.items()):
+                    continue
+                pending.append((file_id, file, str(rel_root), signature))
+                pending_paths.append(str(file_path))
+
+        processed = 0
+        for (file_id, file, rel_root, signature), parsed in zip(pending, self._parse_all(pending_paths)):
+            if isinstance(parsed, Exception):
+                logger.warning(f"Failed to parse {self.source_path / file_id} for graph: {parsed}")
+                continue
+            current_hash, relations = parsed
 
-                    # Check if node exists and hash matches
-                    if file_id in self.graph.nodes:
-                        stored_hash = self.graph.nodes[file_id].get("hash")
-                        if stored_hash == current_hash:
-                            # logger.debug(f"Skipping unchanged file: {file_id}")
-                            continue # No changes, skip parsing
+            stored = stored_files.get(file_id)
+            if stored is not None and stored.get("hash") == current_hash:
+                # Touched but not modified: just remember the new stat
+                self.store.add_node(file_id, **signature)
+                continue
 
-                    # New or modified file
-                    logger.info(f"Processing changed/new file: {file_id}")
+            # New or modified file
+            logger.info(f"Processing changed/new file: {file_id}")
 
-                    # Remove old edges originating from this file (to clear old links)
-                    # We can't easily isolate only "link" edges vs hierarchy edges without attributes
-                    # But hierarchy is re-added below. So clearing outgoing is mostly safe IF we re-add folder link.
-                    # Safe approach: Clear all outgoing edges from this node.
-                    if file_id in self.graph:
-                        # list() is needed because we can't iterate while modifying
-                        out_edges = list(self.graph.out_edges(file_id))
-                        self.graph.remove_edges_from(out_edges)
+            # Clear all outgoing edges (old links); the folder -> file edge is
+            # incoming, and everything outgoing is re-derived from the content below.
+            self.store.remove_out_edges(file_id)
 
-                    # Update Node
-                    self.graph.add_node(file_id, type="file", label=file, hash=current_hash)
+            # Update Node
+            self.store.add_node(file_id, type="file", label=file, hash=current_hash, **signature)
 
-                    # Re-add Folder -> File link (Incoming to file, so safe from removal above)
-                    if str(rel_root) != ".":
-                        self.graph.add_edge(str(rel_root), file_id, relation="CONTAINS")
+            # Re-add Folder -> File link
+            if rel_root != ".":
+                self.store.add_edge(rel_root, file_id, relation="CONTAINS")
 
-                    # Parse Content Relations
-                    self._extract_relations(file_id, content)
+            # Parse Content Relations
+            self._apply_relations(file_id, relations)
 
-                except Exception as e:
-                    logger.warning(f"Failed to parse {file_path} for graph: {e}")
+            processed += 1
+            if processed % COMMIT_EVERY == 0:
+                self.store.commit()
 
         # Cleanup: Remove nodes representing files that no longer exist
         # We need to be careful not to remove "virtual" nodes (Jira IDs) that are not files
-        nodes_to_remove = []
-        for node, data in self.graph.nodes(data=True):
-            if data.get("type") == "file":
-                if node not in active_files:
-                    nodes_to_remove.append(node)
+        nodes_to_remove = [node for node in stored_files if node not in active_files]
 
         if nodes_to_remove:
             logger.info(f"Removing {len(nodes_to_remove)} deleted files from graph.")
-            self.graph.remove_nodes_from(nodes_to_remove)
+            self.store.remove_nodes(nodes_to_remove)
 
         self.save_graph()
-        logger.info(f"Graph built with {self.graph.number_of_nodes()} nodes and {self.graph.number_of_edges()} edges.")
+        logger.info(f"Graph built with {self.store.number_of_nodes()} nodes and {self.store.number_of_edges()} edges.")
+
+    def _apply_relations(self, source_id: str, relations: List[Relation]):
+        for target, relation, is_jira, inbound in relations:
+            target_node = self._resolve_node_id(target) if is_jira else target
+            if is_jira:
+                self.store.add_node(target_node, type="jira_issue")
+            if inbound:
+                self.store.add_edge(target_node, source_id, relation=relation)
+            else:
+                self.store.add_edge(source_id, target_node, relation=relation)
 
     def _extract_relations(self, source_id: str, content: str):
-        # 1. Jira Links
-        parent_match = self.parent_pattern.search(content)
-        if parent_match:
-            target_id = parent_match.group(1)
-            target_node = self._resolve_node_id(target_id)
-            self.graph.add_node(target_node, type="jira_issue")
-            self.graph.add_edge(target_node, source_id, relation="PARENT_OF")
-            self.graph.add_edge(source_id, target_node, relation="CHILD_OF")
-
-        links = self.jira_link_pattern.findall(content)
-        for link in links:
-            target_node = self._resolve_node_id(link)
-            self.graph.add_node(target_node, type="jira_issue")
-            self.graph.add_edge(source_id, target_node, relation="MENTIONS")
-
-        # 2. Internal Links
-        md_links = self.md_link_pattern.findall(content)
-        for link in md_links:
-            target_id = str(Path(link))
-            self.graph.add_edge(source_id, target_id, relation="REFERENCES")
+        self._apply_relations(source_id, extract_relations(content))
 
     def _resolve_node_id(self, entity_id: str) -> str:
         return entity_id
 
     def save_graph(self):
-        data = nx.node_link_data(self.graph)
-        with open(self.graph_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """Commit pending changes; nodes and edges are written to the store as they are built."""
+        self.store.commit()
 
     def load_graph(self):
-        if self.graph_path.exists():
-            try:
-                with open(self.graph_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                self.graph = nx.node_link_graph(data)
-            except Exception as e:
-                logger.warning(f"Failed to load existing graph: {e}. Starting fresh.")
-                self.graph = nx.DiGraph()
-        else:
+        """Materialize the stored graph as ``self.graph`` (an ``nx.DiGraph``).
+
+        Only needed for whole-graph analyses; lookups should go through ``self.store``.
+        """
+        try:
+            self.graph = self.store.to_networkx()
+        except Exception as e:
+            logger.warning(f"Failed to load existing graph: {e}. Starting fresh.")
             self.graph = nx.DiGraph()
+        return self.graph
@@ -0,0 +1,412 @@
+"""
+SQLite storage for the knowledge graph built by ``GraphBuilder``.
+
+Nodes and edges live in two adjacency tables (edges indexed by both
+endpoints), so a build writes only the nodes and edges that changed, and
+``GraphTool`` reads one node's neighbours with two index lookups instead
+of parsing the whole graph into NetworkX first.
+
+The semantics follow ``nx.DiGraph``: at most one edge per (source, target)
+pair, adding a node merges its attributes, and adding an edge creates
+missing endpoints without attributes.
+
+Node ids are also indexed for fuzzy entity lookup (``lookup``): lowercased
+id, basename and stem keys for exact matches, and a trigram posting table
+for substring matches, maintained on every node insert and removal.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from kb_agent.tools.trigram_index import fold_case, trigrams
+
+logger = logging.getLogger("kb_agent")
+
+GRAPH_DB_FILENAME = "knowledge_graph.db"
+LEGACY_JSON_FILENAME = "knowledge_graph.json"
+
+# Candidates examined per lookup pass; bounds the cost of unselective queries like "FSR-"
+LOOKUP_SCAN_LIMIT = 500
+# Stored in meta; bump to rebuild node_keys/node_trigrams when their derivation changes
+_ENTITY_INDEX_VERSION = "2"
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS nodes (
+        id TEXT PRIMARY KEY,
+        type TEXT,
+        attrs TEXT NOT NULL DEFAULT '{}'
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_nodes_type ON nodes(type)",
+    """
+    CREATE TABLE IF NOT EXISTS edges (
+        src TEXT NOT NULL,
+        dst TEXT NOT NULL,
+        relation TEXT,
+        PRIMARY KEY (src, dst)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_edges_dst ON edges(dst)",
+    # Entity lookup: kind 0 = lowercased id, 1 = basename, 2 = stem
+    """
+    CREATE TABLE IF NOT EXISTS node_keys (
+        key TEXT NOT NULL,
+        kind INTEGER NOT NULL,
+        node TEXT NOT NULL,
+        PRIMARY KEY (key, kind, node)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_node_keys_node ON node_keys(node)",
+    # Basename/stem prefix scans, without stepping over every full-id key in the range
+    "CREATE INDEX IF NOT EXISTS idx_node_keys_kind ON node_keys(kind, key)",
+    """
+    CREATE TABLE IF NOT EXISTS node_trigrams (
+        tri INTEGER NOT NULL,
+        node TEXT NOT NULL,
+        PRIMARY KEY (tri, node)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_node_trigrams_node ON node_trigrams(node)",
+    """
+    CREATE TABLE IF NOT EXISTS trigram_counts (
+        tri INTEGER PRIMARY KEY,
+        n INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    """,
+]
+
+
+class GraphStore:
+    """Directed graph in SQLite with ``nx.DiGraph``-like add/remove/neighbour operations."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            self._conn.execute(stmt)
+        self._conn.commit()
+        if self.get_meta("entity_index") != _ENTITY_INDEX_VERSION:
+            # Stores written before the lookup index existed, or with differently folded trigrams
+            self.rebuild_entity_index()
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def batch(self):
+        """Group writes into one transaction (committed on exit, rolled back on error)."""
+        with self._lock:
+            try:
+                yield self
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def add_node(self, node_id: str, **attrs):
+        """Insert ``node_id`` or merge ``attrs`` into its existing attributes."""
+        with self._lock:
+            row = self._conn.execute("SELECT type, attrs FROM nodes WHERE id = ?", (node_id,)).fetchone()
+            existing = _unpack(row) if row else {}
+            merged = {**existing, **attrs}
+            if row is not None and merged == existing:
+                return  # e.g. a Jira issue mentioned again
+            node_type = merged.pop("type", None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO nodes (id, type, attrs) VALUES (?, ?, ?)",
+                (node_id, node_type, json.dumps(merged, ensure_ascii=False)),
+            )
+            if row is None:
+                self._index_node(node_id)
+
+    def add_edge(self, src: str, dst: str, relation: Optional[str] = None):
+        with self._lock:
+            for node_id in (src, dst):
+                if self._conn.execute("INSERT OR IGNORE INTO nodes (id) VALUES (?)", (node_id,)).rowcount:
+                    self._index_node(node_id)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO edges (src, dst, relation) VALUES (?, ?, ?)", (src, dst, relation)
+            )
+
+    def remove_out_edges(self, node_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM edges WHERE src = ?", (node_id,))
+
+    def remove_nodes(self, node_ids: Iterable[str]):
+        """Remove nodes together with every edge touching them."""
+        ids = [(n,) for n in node_ids]
+        with self._lock:
+            self._conn.executemany("DELETE FROM edges WHERE src = ?", ids)
+            self._conn.executemany("DELETE FROM edges WHERE dst = ?", ids)
+            self._conn.executemany("DELETE FROM nodes WHERE id = ?", ids)
+            for (node_id,) in ids:
+                self._unindex_node(node_id)
+
+    # ------------------------------------------------------------------
+    # Entity lookup index
+    # ------------------------------------------------------------------
+
+    def _index_node(self, node_id: str):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO node_keys (key, kind, node) VALUES (?, ?, ?)",
+            [(key, kind, node_id) for kind, key in _lookup_keys(node_id)],
+        )
+        tris = trigrams(node_id)
+        self._conn.executemany("INSERT OR IGNORE INTO node_trigrams (tri, node) VALUES (?, ?)", [(t, node_id) for t in tris])
+        self._conn.executemany(
+            "INSERT INTO trigram_counts (tri, n) VALUES (?, 1) ON CONFLICT(tri) DO UPDATE SET n = n + 1",
+            [(t,) for t in tris],
+        )
+
+    def _unindex_node(self, node_id: str):
+        self._conn.execute("DELETE FROM node_keys WHERE node = ?", (node_id,))
+        if self._conn.execute("DELETE FROM node_trigrams WHERE node = ?", (node_id,)).rowcount:
+            self._conn.executemany("UPDATE trigram_counts SET n = n - 1 WHERE tri = ?", [(t,) for t in trigrams(node_id)])
+
+    def rebuild_entity_index(self):
+        with self._lock:
+            for table in ("node_keys", "node_trigrams", "trigram_counts"):
+                self._conn.execute(f"DELETE FROM {table}")
+            for (node_id,) in self._conn.execute("SELECT id FROM nodes").fetchall():
+                self._index_node(node_id)
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('entity_index', ?)", (_ENTITY_INDEX_VERSION,))
+            self._conn.commit()
+
+    def _substring_candidates(self, needle: str, cap: int) -> List[str]:
+        """Up to ``cap`` node ids holding every trigram of ``needle`` (a superset of the ids containing it)."""
+        tris = list(trigrams(needle))
+        placeholders = ",".join("?" * len(tris))
+        counts = dict(self._conn.execute(f"SELECT tri, n FROM trigram_counts WHERE tri IN ({placeholders})", tris))
+        if len(counts) < len(tris) or not all(counts.values()):
+            return []
+        # Walk the rarest posting list, checking the second rarest through the primary key
+        rarest = sorted(tris, key=lambda t: counts[t])
+        if len(rarest) == 1:
+            return [r[0] for r in self._conn.execute(
+                "SELECT node FROM node_trigrams WHERE tri = ? LIMIT ?", (rarest[0], cap)
+            )]
+        return [r[0] for r in self._conn.execute(
+            "SELECT a.node FROM node_trigrams a JOIN node_trigrams b ON b.tri = ? AND b.node = a.node "
+            "WHERE a.tri = ? LIMIT ?",
+            (rarest[1], rarest[0], cap),
+        )]
+
+    def lookup(self, query: str, limit: int = 10) -> List[str]:
+        """
+        Node ids matching ``query`` case-insensitively, best first: exact id, then
+        basename/stem equal to the query, then basename/stem starting with it, then
+        ids containing it anywhere. Ties go to the shorter id.
+
+        Each pass looks at no more than ``LOOKUP_SCAN_LIMIT`` candidates, so a
+        query matching a large part of the graph returns good matches, not
+        necessarily the best ones.  The substring pass is skipped once the earlier
+        passes have found ``limit`` matches, since it can only rank below them.
+        """
+        needle = query.strip().lower()
+        if not needle:
+            return []
+        ranked: Dict[str, int] = {}
+        with self._lock:
+            for node_id, kind in self._conn.execute("SELECT node, kind FROM node_keys WHERE key = ?", (needle,)):
+                ranked[node_id] = min(ranked.get(node_id, 9), 0 if kind == 0 else 1)
+            # Basename/stem prefix matches: a range scan per kind over idx_node_keys_kind
+            for (node_id,) in self._conn.execute(
+                "SELECT node FROM node_keys WHERE kind IN (1, 2) AND key > ? AND key < ? LIMIT ?",
+                (needle, needle + "\U0010ffff", LOOKUP_SCAN_LIMIT),
+            ):
+                ranked.setdefault(node_id, 2)
+            folded = fold_case(query.strip())
+            if len(ranked) >= limit:
+                candidates = []
+            elif len(folded) >= 3:
+                candidates = self._substring_candidates(folded, LOOKUP_SCAN_LIMIT)
+            else:
+                # Too short for trigrams: scan the node table
+                candidates = [r[0] for r in self._conn.execute(
+                    "SELECT id FROM nodes WHERE instr(lower(id), ?) > 0 LIMIT ?", (needle, LOOKUP_SCAN_LIMIT)
+                )]
+        for node_id in candidates:
+            if node_id not in ranked and folded in fold_case(node_id):
+                ranked[node_id] = 3
+        return sorted(ranked, key=lambda n: (ranked[n], len(n), n))[:limit]
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def has_node(self, node_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM nodes WHERE id = ?", (node_id,)).fetchone() is not None
+
+    def get_node(self, node_id: str) -> Optional[Dict[str, Any]]:
+        """Attributes of ``node_id`` (including ``type`` when set), or None if it doesn't exist."""
+        with self._lock:
+            row = self._conn.execute("SELECT type, attrs FROM nodes WHERE id = ?", (node_id,)).fetchone()
+        return _unpack(row) if row else None
+
+    def nodes_of_type(self, node_type: str) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT id FROM nodes WHERE type = ?", (node_type,))]
+
+    def node_attrs_of_type(self, node_type: str) -> Dict[str, Dict[str, Any]]:
+        """id → attributes (without ``type``) of every node of ``node_type``, in one query."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, attrs FROM nodes WHERE type = ?", (node_type,)).fetchall()
+        return {node_id: json.loads(attrs) if attrs else {} for node_id, attrs in rows}
+
+    def iter_nodes(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, type, attrs FROM nodes").fetchall()
+        for node_id, node_type, attrs in rows:
+            yield node_id, _unpack((node_type, attrs))
+
+    def neighbors_many(self, node_ids: Iterable[str], direction: str = "both",
+                       relations: Optional[Iterable[str]] = None) -> List[Tuple[str, str, Optional[str], Optional[str], str]]:
+        """
+        Edges touching any of ``node_ids`` in a handful of queries, as
+        (node, neighbour, relation, neighbour type, "out"/"in"), grouped by node.
+
+        ``direction`` is "out", "in" or "both"; ``relations`` keeps only those edge relations.
+        """
+        ids = list(dict.fromkeys(node_ids))
+        rels = list(relations) if relations else []
+        rel_clause = f" AND e.relation IN ({','.join('?' * len(rels))})" if rels else ""
+        sides = [("src", "dst", "out"), ("dst", "src", "in")]
+        if direction in ("out", "in"):
+            sides = [side for side in sides if side[2] == direction]
+        rows = []
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for near, far, label in sides:
+                    rows.extend(
+                        (node, neighbor, relation, node_type, label)
+                        for node, neighbor, relation, node_type in self._conn.execute(
+                            f"SELECT e.{near}, e.{far}, e.relation, n.type FROM edges e "
+                            f"LEFT JOIN nodes n ON n.id = e.{far} "
+                            f"WHERE e.{near} IN ({placeholders}){rel_clause} ORDER BY e.{near}, e.{far}",
+                            batch + rels,
+                        )
+                    )
+        order = {node_id: i for i, node_id in enumerate(ids)}
+        rows.sort(key=lambda r: order[r[0]])
+        return rows
+
+    def successors(self, node_id: str) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """(neighbour, relation, neighbour type) for every edge leaving ``node_id``."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT e.dst, e.relation, n.type FROM edges e LEFT JOIN nodes n ON n.id = e.dst WHERE e.src = ?",
+                (node_id,),
+            ).fetchall()
+
+    def predecessors(self, node_id: str) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """(neighbour, relation, neighbour type) for every edge entering ``node_id``."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT e.src, e.relation, n.type FROM edges e LEFT JOIN nodes n ON n.id = e.src WHERE e.dst = ?",
+                (node_id,),
+            ).fetchall()
+
+    def number_of_nodes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    def number_of_edges(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+
+    def to_networkx(self):
+        """Materialize the whole graph as an ``nx.DiGraph`` (for analyses that need one)."""
+        import networkx as nx
+
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.iter_nodes())
+        with self._lock:
+            edges = self._conn.execute("SELECT src, dst, relation FROM edges").fetchall()
+        graph.add_edges_from((s, d, {"relation": r} if r is not None else {}) for s, d, r in edges)
+        return graph
+
+    # ------------------------------------------------------------------
+    # Migration from the old node-link JSON file
+    # ------------------------------------------------------------------
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+    def import_legacy_json(self, json_path: Path) -> bool:
+        """One-time import of a ``knowledge_graph.json`` written by older versions."""
+        json_path = Path(json_path)
+        if self.get_meta("legacy_json_imported") or not json_path.exists():
+            return False
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            edges_key = "edges" if "edges" in data else "links"
+            with self.batch():
+                for node in data.get("nodes", []):
+                    attrs = {k: v for k, v in node.items() if k != "id"}
+                    self.add_node(node["id"], **attrs)
+                for edge in data.get(edges_key, []):
+                    self.add_edge(edge["source"], edge["target"], relation=edge.get("relation"))
+        except Exception as e:
+            logger.warning(f"Failed to import legacy graph {json_path}: {e}. Starting fresh.")
+            return False
+        finally:
+            self.set_meta("legacy_json_imported", "1")
+        logger.info(f"Imported {self.number_of_nodes()} nodes and {self.number_of_edges()} edges from {json_path.name}.")
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _lookup_keys(node_id: str) -> Set[Tuple[int, str]]:
+    """(kind, key) exact-match keys for a node: lowercased id, basename and stem."""
+    lowered = node_id.lower()
+    basename = lowered.replace("\\", "/").rstrip("/").rsplit("/", 1)[-1]
+    stem = os.path.splitext(basename)[0] or basename
+    return {(0, lowered), (1, basename), (2, stem)}
+
+
+def _unpack(row) -> Dict[str, Any]:
+    node_type, attrs = row
+    data = json.loads(attrs) if attrs else {}
+    if node_type is not None:
+        data["type"] = node_type
+    return data
+
+
+def default_store_path(index_path: Path) -> Path:
+    return Path(index_path) / GRAPH_DB_FILENAME
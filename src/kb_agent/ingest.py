@@ -0,0 +1,172 @@
+"""
+Ingestion pipeline for ``kb-agent index``.
+
+Converting source files (PDF via PyMuPDF, DOCX, XLSX/CSV via pandas) is
+CPU-bound, while chunking + embedding + upserting is dominated by ONNX
+inference.  With ``workers > 1`` conversion fans out to a process pool and
+converted documents stream through a bounded queue to a single consumer, so
+parsing overlaps with embedding and memory stays flat regardless of corpus
+size.  With ``workers <= 1`` files are converted lazily in the calling process.
+
+Spreadsheets are never sent to the pool: their documents are streamed
+(``read_document(..., stream=True)``), so the row groups are generated in the
+calling process while the processor consumes them.
+"""
+
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from kb_agent.connectors.local_file import LocalFileConnector, convert_file
+
+logger = logging.getLogger("kb_agent")
+
+# Sentinel pushed by the producer thread once every file has been converted.
+_DONE = object()
+
+
+@dataclass
+class IngestStats:
+    """Per-stage counters for the indexing run."""
+    files_converted: int = 0
+    files_failed: int = 0
+    convert_seconds: float = 0.0
+    docs_embedded: int = 0
+    chunks_embedded: int = 0
+    embed_seconds: float = 0.0
+    wall_seconds: float = 0.0
+
+    @staticmethod
+    def _rate(count: int, seconds: float) -> float:
+        return count / seconds if seconds > 0 else 0.0
+
+    def report(self) -> str:
+        """Human-readable throughput summary printed at the end of ``kb-agent index``."""
+        return "\n".join([
+            "Throughput:",
+            f"  convert: {self.files_converted} files in {self.convert_seconds:.1f}s "
+            f"({self._rate(self.files_converted, self.convert_seconds):.1f} files/s)"
+            + (f", {self.files_failed} failed" if self.files_failed else ""),
+            f"  embed:   {self.chunks_embedded} chunks from {self.docs_embedded} docs in {self.embed_seconds:.1f}s "
+            f"({self._rate(self.chunks_embedded, self.embed_seconds):.1f} chunks/s)",
+            f"  total:   {self.wall_seconds:.1f}s wall time",
+        ])
+
+
+ConvertedItem = Tuple[Path, Optional[Dict[str, Any]], Optional[str]]
+
+
+def iter_converted(
+    connector: LocalFileConnector,
+    paths: Iterable[Path],
+    stats: IngestStats,
+    workers: int = 1,
+    queue_size: int = 0,
+) -> Iterator[ConvertedItem]:
+    """Yield ``(path, doc, error)`` for each source file as soon as it is converted.
+
+    ``doc`` is None when the file could not be converted; ``error`` carries the
+    worker exception message if the conversion itself crashed.  Order is
+    completion order, not input order, when ``workers > 1``.
+    """
+    if workers <= 1:
+        yield from _iter_serial(connector, paths, stats)
+    else:
+        yield from _iter_parallel(connector, paths, stats, workers, queue_size or workers * 4)
+
+
+def _iter_serial(connector: LocalFileConnector, paths: Iterable[Path], stats: IngestStats) -> Iterator[ConvertedItem]:
+    for path in paths:
+        start = time.perf_counter()
+        doc = connector.read_document(path, stream=True)
+        stats.convert_seconds += time.perf_counter() - start
+        if doc is None:
+            stats.files_failed += 1
+        else:
+            stats.files_converted += 1
+        yield path, doc, None
+
+
+def _iter_parallel(
+    connector: LocalFileConnector,
+    paths: Iterable[Path],
+    stats: IngestStats,
+    workers: int,
+    queue_size: int,
+) -> Iterator[ConvertedItem]:
+    results: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    source_dir = str(connector.source_dir)
+
+    def _produce():
+        start = time.perf_counter()
+        # "spawn" rather than fork: by the time we get here the consumer has
+        # already loaded ONNX Runtime / Chroma, whose thread pools don't survive fork.
+        ctx = multiprocessing.get_context("spawn")
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                in_flight = {}
+                path_iter = iter(paths)
+                exhausted = False
+                while not stop.is_set():
+                    # Keep at most 2x workers conversions in flight so finished
+                    # documents never pile up faster than the queue drains.
+                    while not exhausted and len(in_flight) < workers * 2:
+                        try:
+                            path = next(path_iter)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        if connector.is_streamed(path):
+                            # A generator can't cross the process boundary; it is cheap to create here
+                            results.put((path, connector.read_document(path, stream=True), None))
+                            continue
+                        in_flight[pool.submit(convert_file, source_dir, str(path))] = path
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        path = in_flight.pop(fut)
+                        try:
+                            item = (path, fut.result(), None)
+                        except Exception as e:
+                            item = (path, None, str(e))
+                        results.put(item)
+                for fut in in_flight:
+                    fut.cancel()
+        except Exception as e:
+            logger.error(f"Conversion pool failed: {e}")
+            results.put((None, None, str(e)))
+        finally:
+            stats.convert_seconds = time.perf_counter() - start
+            results.put(_DONE)
+
+    producer = threading.Thread(target=_produce, name="kb-ingest-producer", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            path, doc, error = item
+            if path is None:
+                raise RuntimeError(f"Conversion pool failed: {error}")
+            if doc is None:
+                stats.files_failed += 1
+            else:
+                stats.files_converted += 1
+            yield item
+    finally:
+        stop.set()
+        # Unblock a producer waiting on a full queue so it can shut the pool down.
+        while producer.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
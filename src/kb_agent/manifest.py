@@ -0,0 +1,169 @@
+"""
+Persistent index manifest: what has already been embedded, and from what.
+
+One row per document id records the hash of the content that was indexed,
+the chunk ids that were upserted for it, and a fingerprint of the embedding
+model + chunker parameters used.  ``Processor`` consults it to skip unchanged
+documents and to delete orphaned chunk ids when a document shrinks.
+
+Rows are committed only after the corresponding upsert succeeded, so an
+interrupted ``kb-agent index`` run simply resumes: finished documents are
+skipped, unfinished ones are redone.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("kb_agent")
+
+MANIFEST_FILENAME = ".index_manifest.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    chunk_ids TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    source_size INTEGER,
+    source_mtime_ns INTEGER,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+@dataclass
+class ManifestEntry:
+    doc_id: str
+    content_hash: str
+    chunk_ids: List[str]
+    fingerprint: str
+    source_size: Optional[int] = None
+    source_mtime_ns: Optional[int] = None
+
+
+class ContentHasher:
+    """``content_hash`` of a document whose text arrives in parts (hashed as if concatenated)."""
+
+    def __init__(self):
+        self._h = hashlib.sha256()
+
+    def update(self, text: str):
+        self._h.update(text.encode("utf-8"))
+
+    def hexdigest(self, metadata: Optional[Dict[str, Any]] = None) -> str:
+        if metadata:
+            self._h.update(json.dumps(metadata, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        return self._h.hexdigest()
+
+
+def content_hash(text: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+    """Stable hash of a document's indexable content (text + metadata)."""
+    hasher = ContentHasher()
+    hasher.update(text)
+    return hasher.hexdigest(metadata)
+
+
+def source_signature(source_path: Optional[Path]) -> Optional[Tuple[int, int]]:
+    """(size, mtime_ns) of a source file, or None if it can't be stat'ed."""
+    if not source_path:
+        return None
+    try:
+        st = os.stat(source_path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def make_fingerprint(**params: Any) -> str:
+    """Serialize the parameters that affect chunk ids/embeddings into a comparable string."""
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+class IndexManifest:
+    """SQLite-backed doc id → (content hash, chunk ids, fingerprint) map."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def get(self, doc_id: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id, content_hash, chunk_ids, fingerprint, source_size, source_mtime_ns "
+                "FROM documents WHERE doc_id = ?",
+                (doc_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return ManifestEntry(row[0], row[1], json.loads(row[2]), row[3], row[4], row[5])
+
+    def is_source_unchanged(self, doc_id: str, source_path: Path, fingerprint: str) -> bool:
+        """True if ``source_path`` has the same size/mtime as when ``doc_id`` was last indexed.
+
+        Lets ``run_indexing`` skip even the (expensive) file conversion step.
+        """
+        entry = self.get(doc_id)
+        if entry is None or entry.fingerprint != fingerprint or entry.source_size is None:
+            return False
+        try:
+            st = os.stat(source_path)
+        except OSError:
+            return False
+        return st.st_size == entry.source_size and st.st_mtime_ns == entry.source_mtime_ns
+
+    def record(
+        self,
+        doc_id: str,
+        content_hash: str,
+        chunk_ids: List[str],
+        fingerprint: str,
+        source_path: Optional[Path] = None,
+        source_stat: Optional[Tuple[int, int]] = None,
+    ):
+        """Insert/replace the entry for ``doc_id`` and commit immediately.
+
+        ``source_stat`` is the (size, mtime_ns) of the source file; pass it when
+        the file may have been moved by the time the entry is recorded.
+        Otherwise ``source_path`` is stat'ed now.
+        """
+        size, mtime_ns = source_stat or source_signature(source_path) or (None, None)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(doc_id, content_hash, chunk_ids, fingerprint, source_size, source_mtime_ns, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (doc_id, content_hash, json.dumps(chunk_ids), fingerprint, size, mtime_ns, time.time()),
+            )
+            self._conn.commit()
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
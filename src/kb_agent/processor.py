@@ -1,43 +1,110 @@
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Iterable, Iterator, Optional
 from pathlib import Path
 from kb_agent.llm import LLMClient
-from kb_agent.tools.vector_tool import VectorTool
+from kb_agent.tools.vector_tool import VectorTool, UpsertBatcher
+from kb_agent.manifest import (
+    ContentHasher, IndexManifest, MANIFEST_FILENAME, content_hash, make_fingerprint, source_signature,
+)
+from kb_agent.tools.sparse_index import SparseIndex, SPARSE_INDEX_FILENAME
+import kb_agent.config as config
+import logging
 import os
 
+logger = logging.getLogger("kb_agent")
+
+# Sparse-index postings of a streamed document are staged under this id until it commits
+_STAGING_SUFFIX = "\x00staging"
+
 class Processor:
     """
     Processes fetched data into markdown files and indexes them in ChromaDB.
+
+    An ``IndexManifest`` next to the index makes processing incremental:
+    unchanged documents are skipped, and chunk ids that a changed document no
+    longer produces are deleted from the collection.  Chunk ids are derived from
+    chunk content (``content_chunk_ids``), so after an edit only chunks that are
+    actually new get embedded; the rest just have their metadata refreshed.
+    Pass ``force=True`` to re-embed everything regardless of the manifest.
+
+    Every committed document is also written to a BM25 ``SparseIndex`` (used by
+    ``hybrid_search``), so the lexical and vector indexes always cover the same chunks.
+
+    Chunks are accumulated across documents by an ``UpsertBatcher``; callers
+    must call ``flush()`` once they have processed their last document.
     """
-    def __init__(self, docs_path: Path):
+    def __init__(self, docs_path: Path, force: bool = False):
         self.docs_path = docs_path
+        self.force = force
         os.makedirs(self.docs_path, exist_ok=True)
 
         # Dependencies
         self.vector_tool = VectorTool()
+        self.batcher = UpsertBatcher(self.vector_tool)
         
         from kb_agent.chunking import MarkdownAwareChunker
         self.chunker = MarkdownAwareChunker()
 
-    def process(self, data: Dict[str, Any]):
+        self.manifest = IndexManifest(Path(self.docs_path) / MANIFEST_FILENAME)
+        self.sparse_index = SparseIndex(Path(self.docs_path) / SPARSE_INDEX_FILENAME)
+        self._discard_stale_manifest()
+
+    @property
+    def fingerprint(self) -> str:
+        """Everything besides the content itself that changes what ends up in Chroma."""
+        settings = config.settings
+        params = dict(
+            embedding_url=getattr(settings, "embedding_url", None) if settings else None,
+            embedding_model=getattr(settings, "embedding_model", None) if settings else None,
+            chunk_max_chars=self.chunker.max_chars,
+            chunk_overlap_chars=self.chunker.overlap_chars,
+            chunk_ids="content-exact",
+        )
+        if self.chunker.max_tokens:
+            params.update(chunk_max_tokens=self.chunker.max_tokens, chunk_overlap_tokens=self.chunker.overlap_tokens)
+        return make_fingerprint(**params)
+
+    def _discard_stale_manifest(self):
+        # If the Chroma store was wiped (e.g. scripts/clean_index.sh) but the manifest
+        # survived, every document would be skipped and the index would stay empty.
+        try:
+            if self.manifest.count() and self.vector_tool.collection.count() == 0:
+                logger.warning("Vector collection is empty but index manifest is not; resetting manifest.")
+                self.manifest.clear()
+                self.sparse_index.clear()
+        except Exception as e:
+            logger.debug(f"Could not verify index manifest against collection: {e}")
+
+    def is_source_unchanged(self, doc_id: str, source_path: Path) -> bool:
+        """True if ``source_path`` was already indexed as ``doc_id`` and hasn't changed on disk since."""
+        if self.force:
+            return False
+        return self.manifest.is_source_unchanged(doc_id, source_path, self.fingerprint)
+
+    def process(self, data: Dict[str, Any], source_path: Optional[Path] = None,
+                on_commit: Optional[Callable[[], None]] = None) -> int:
         """
         Process a single data item.
         data: {"id": "ISSUE-123", "title": "...", "content": "...", "metadata": {...}}
+            Instead of "content", "sections" may be an iterable of Markdown sections
+            (a spreadsheet's row groups) that is consumed once, a section at a time.
+        source_path: original file the item was converted from; its size/mtime are
+            recorded so the next run can skip conversion when it is unchanged.
+        on_commit: called once the document is durably indexed (its batch was
+            upserted and the manifest written), e.g. to archive the source file.
+            Not called if the upsert fails, so the document is retried next run.
+
+        Returns the number of chunks sent to the vector store (0 if skipped).
         """
         doc_id = data.get("id")
         if not doc_id:
-            return # Skip invalid data
+            return 0 # Skip invalid data
+
+        # Snapshot now: the caller may move the source before the batch is committed
+        source_stat = source_signature(source_path)
 
-        content = data.get("content", "")
         title = data.get("title", "")
         metadata = data.get("metadata", {})
 
-        # Combine title and content for the file
-        # Check if content already has a header to avoid duplication
-        if content.lstrip().startswith("#"):
-            full_content = content
-        else:
-            full_content = f"# {title}\n\n{content}"
-
         full_path_str = metadata.get("path")
         if not full_path_str:
             full_path_str = str(self.docs_path / f"{doc_id}.md")
@@ -57,22 +124,199 @@ class Processor:
         
         if summary:
             base_meta["document_summary"] = summary
+
+        if data.get("sections") is not None:
+            return self._process_sections(doc_id, title, data["sections"], base_meta, source_path, source_stat, on_commit)
+
+        content = data.get("content", "")
+        # Combine title and content for the file
+        # Check if content already has a header to avoid duplication
+        if content.lstrip().startswith("#"):
+            full_content = content
+        else:
+            full_content = f"# {title}\n\n{content}"
+
+        doc_hash = content_hash(full_content, base_meta)
+        previous = self.manifest.get(doc_id)
+        if (not self.force and previous
+                and previous.content_hash == doc_hash
+                and previous.fingerprint == self.fingerprint):
+            if source_path:
+                # Refresh the stat snapshot so the next run can skip conversion too
+                self.manifest.record(doc_id, doc_hash, previous.chunk_ids, self.fingerprint, source_stat=source_stat)
+            if not self.sparse_index.has_document(doc_id):
+                # Indexed before the sparse index existed: backfill it without re-embedding
+                chunks = self.chunker.chunk(full_content, base_meta)
+                self._update_sparse(doc_id, self._chunk_ids(doc_id, chunks), [c.text for c in chunks])
+            if on_commit:
+                on_commit()
+            return 0
         
         chunks = self.chunker.chunk(full_content, base_meta)
         
-        chunk_docs = []
-        chunk_metas = []
-        chunk_ids = []
-        
-        for c in chunks:
-            chunk_docs.append(c.text)
-            chunk_metas.append(c.metadata)
-            idx = c.metadata.get("chunk_index", 0)
-            chunk_ids.append(f"{doc_id}-chunk-{idx}")
+        chunk_docs = [c.text for c in chunks]
+        chunk_metas = [c.metadata for c in chunks]
+        chunk_ids = self._chunk_ids(doc_id, chunks)
+
+        # Chunks the previous version already stored (same content => same id) only
+        # need their metadata (chunk_index/total_chunks) refreshed, not re-embedding.
+        reusable = set()
+        if previous and not self.force and previous.fingerprint == self.fingerprint:
+            reusable = set(previous.chunk_ids)
+        new_idx = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id not in reusable]
+        kept_idx = [i for i, chunk_id in enumerate(chunk_ids) if chunk_id in reusable]
             
-        if chunk_docs:
-            self.vector_tool.add_documents(
-                documents=chunk_docs,
-                metadatas=chunk_metas,
-                ids=chunk_ids
-            )
+        if previous is None:
+            # Not in the manifest (first run, or indexed before the manifest existed):
+            # clear whatever chunks an earlier run may have left for this document.
+            self.vector_tool.delete_documents(where={"doc_id": doc_id})
+
+        # Runs once the batch holding this document's chunks has been upserted
+        def _commit(previous=previous, chunk_ids=chunk_ids, chunk_docs=chunk_docs):
+            if kept_idx:
+                self.vector_tool.update_metadatas([chunk_ids[i] for i in kept_idx], [chunk_metas[i] for i in kept_idx])
+            # Chunks the previous version produced that this one no longer does
+            if previous:
+                orphan_ids = sorted(set(previous.chunk_ids) - set(chunk_ids))
+                if orphan_ids:
+                    self.vector_tool.delete_documents(orphan_ids)
+            self._update_sparse(doc_id, chunk_ids, chunk_docs)
+            self.manifest.record(doc_id, doc_hash, chunk_ids, self.fingerprint, source_stat=source_stat)
+            if on_commit:
+                on_commit()
+
+        # On a failed flush the manifest is left untouched so the next run retries
+        ok = self.batcher.add(
+            documents=[chunk_docs[i] for i in new_idx],
+            metadatas=[chunk_metas[i] for i in new_idx],
+            ids=[chunk_ids[i] for i in new_idx],
+            on_commit=_commit,
+        )
+        if not ok:
+            logger.warning(f"Vector store upsert failed while queueing {doc_id}; the documents in that batch will be retried on the next run.")
+        return len(new_idx)
+
+    def _process_sections(self, doc_id: str, title: str, sections: Iterable[str], base_meta: Dict[str, Any],
+                          source_path: Optional[Path], source_stat, on_commit: Optional[Callable[[], None]]) -> int:
+        """
+        ``process`` for a document that arrives as a stream of sections.
+
+        Each section is hashed, chunked and queued for upsert as soon as it is
+        read, so beyond the current section only the document's chunk ids stay in
+        memory.  Its BM25 postings are staged under a temporary id and swapped in
+        when the document commits.  Hash, chunks and chunk ids come out the same
+        as for the sections joined by blank lines, passed as "content".
+        """
+        previous = self.manifest.get(doc_id)
+        reusable = set()
+        if previous and not self.force and previous.fingerprint == self.fingerprint:
+            reusable = set(previous.chunk_ids)
+        if previous is None:
+            self.vector_tool.delete_documents(where={"doc_id": doc_id})
+
+        staging_id = doc_id + _STAGING_SUFFIX
+        sparse_ok = self._stage_sparse(self.sparse_index.remove_document, staging_id)
+
+        hasher = ContentHasher()
+        seen: Dict[str, int] = {}
+        chunk_ids: List[str] = []
+        new_count = 0
+        ok = True
+        for text in _with_title(sections, title):
+            hasher.update(text)
+            chunks = self.chunker.chunk(text, base_meta)
+            for c in chunks:
+                # Numbered across the whole document; the total isn't known until the end
+                c.metadata["chunk_index"] += len(chunk_ids)
+                c.metadata.pop("total_chunks", None)
+            ids = self._chunk_ids(doc_id, chunks, seen)
+            chunk_ids.extend(ids)
+
+            new_idx = [i for i, chunk_id in enumerate(ids) if chunk_id not in reusable]
+            kept_idx = [i for i, chunk_id in enumerate(ids) if chunk_id in reusable]
+            if kept_idx:
+                self.vector_tool.update_metadatas([ids[i] for i in kept_idx], [chunks[i].metadata for i in kept_idx])
+            if new_idx:
+                ok = self.batcher.add(
+                    documents=[chunks[i].text for i in new_idx],
+                    metadatas=[chunks[i].metadata for i in new_idx],
+                    ids=[ids[i] for i in new_idx],
+                ) and ok
+                new_count += len(new_idx)
+            if sparse_ok:
+                sparse_ok = self._stage_sparse(self.sparse_index.add_chunks, staging_id, ids, [c.text for c in chunks])
+
+        doc_hash = hasher.hexdigest(base_meta)
+        if (not self.force and previous
+                and previous.content_hash == doc_hash
+                and previous.fingerprint == self.fingerprint):
+            if source_path:
+                self.manifest.record(doc_id, doc_hash, previous.chunk_ids, self.fingerprint, source_stat=source_stat)
+            if sparse_ok and not self.sparse_index.has_document(doc_id):
+                self._stage_sparse(self.sparse_index.rename_document, staging_id, doc_id)
+            else:
+                self._stage_sparse(self.sparse_index.remove_document, staging_id)
+            if on_commit:
+                on_commit()
+            return 0
+
+        def _commit(previous=previous):
+            if previous:
+                orphan_ids = sorted(set(previous.chunk_ids) - set(chunk_ids))
+                if orphan_ids:
+                    self.vector_tool.delete_documents(orphan_ids)
+            if sparse_ok:
+                self._stage_sparse(self.sparse_index.rename_document, staging_id, doc_id)
+            self.manifest.record(doc_id, doc_hash, chunk_ids, self.fingerprint, source_stat=source_stat)
+            if on_commit:
+                on_commit()
+
+        # Registered behind the document's last chunks, so it runs once all of them are upserted
+        if ok:
+            ok = self.batcher.add(documents=[], metadatas=[], ids=[], on_commit=_commit)
+        if not ok:
+            logger.warning(f"Vector store upsert failed while queueing {doc_id}; the documents in that batch will be retried on the next run.")
+        return new_count
+
+    def _stage_sparse(self, method: Callable, *args) -> bool:
+        try:
+            method(*args)
+            return True
+        except Exception as e:
+            # Not fatal: the next run backfills documents missing from the sparse index
+            logger.warning(f"Failed to update sparse index: {e}")
+            return False
+
+    @staticmethod
+    def _chunk_ids(doc_id: str, chunks, seen: Optional[Dict[str, int]] = None) -> List[str]:
+        from kb_agent.chunking import content_chunk_ids
+        return content_chunk_ids(doc_id, chunks, seen)
+
+    def _update_sparse(self, doc_id: str, chunk_ids: List[str], texts: List[str]):
+        try:
+            self.sparse_index.replace_document(doc_id, chunk_ids, texts)
+        except Exception as e:
+            # Not fatal: the next run backfills documents missing from the sparse index
+            logger.warning(f"Failed to update sparse index for {doc_id}: {e}")
+
+    def flush(self) -> bool:
+        """Upsert any chunks still buffered. Returns False if the final upsert failed."""
+        return self.batcher.flush()
+
+    def close(self):
+        """Close the manifest and sparse index connections (call after the last ``flush()``)."""
+        self.manifest.close()
+        self.sparse_index.close()
+
+
+def _with_title(sections: Iterable[str], title: str) -> Iterator[str]:
+    """Sections joined by blank lines, with the ``# title`` heading ``process`` adds when the first lacks one."""
+    first = True
+    for section in sections:
+        if first:
+            first = False
+            yield section if section.lstrip().startswith("#") else f"# {title}\n\n{section}"
+        else:
+            yield "\n\n" + section
+    if first:
+        yield f"# {title}\n\n"
@@ -0,0 +1,139 @@
+"""
+Process-wide registry of expensive, reusable resources.
+
+Loading the ONNX embedding model + tokenizer, opening a Chroma
+``PersistentClient``, loading the llama.cpp reranker and compiling the
+LangGraph workflow each take from hundreds of milliseconds to seconds.  Every
+call site (router fast path, agent tools, ``/file_search``, ``Engine``,
+``Processor``) goes through this registry so each of them happens once per
+process, not once per query.
+
+Entries are keyed by the settings they depend on, so changing e.g. the
+embedding model in ``/settings`` transparently yields a fresh instance on the
+next lookup.  Creation runs under a per-key lock: concurrent callers of the
+same key wait for a single load, while unrelated keys load in parallel.
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger("kb_agent")
+
+
+class ResourceRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items: Dict[Hashable, Any] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the resource cached under ``key``, creating it with ``factory`` on first use."""
+        with self._lock:
+            if key in self._items:
+                return self._items[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._items:
+                    return self._items[key]
+            value = factory()
+            with self._lock:
+                self._items[key] = value
+            return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            return self._items.get(key)
+
+    def discard(self, key: Hashable):
+        """Forget the resource under ``key`` (without closing it); the next lookup creates it again."""
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._items
+
+    # ------------------------------------------------------------------
+    # Typed accessors
+    # ------------------------------------------------------------------
+
+    def chroma_client(self, persist_dir: str):
+        import chromadb
+        return self.get_or_create(("chroma_client", persist_dir), lambda: chromadb.PersistentClient(path=persist_dir))
+
+    def graph(self, factory: Optional[Callable[[], Any]] = None):
+        """The compiled agentic RAG graph (``factory`` defaults to ``compile_graph``)."""
+        if factory is None:
+            from kb_agent.agent.graph import compile_graph
+            factory = compile_graph
+        return self.get_or_create(("graph",), factory)
+
+    def reranker(self):
+        """The shared ``RerankClient``, with its model loaded if the reranker is enabled."""
+        from kb_agent.tools.reranker import reranker_client
+
+        def _load():
+            reranker_client.load_sync()
+            return reranker_client
+
+        # Switching backend or model in /settings loads the newly selected model
+        return self.get_or_create(("reranker",) + reranker_client.configured_model(), _load)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def warmup(self, vector: bool = True, reranker: bool = True, graph: bool = True):
+        """Load everything a query needs up front so the first query doesn't pay for it.
+
+        Each part is best-effort: a missing model is logged and left to the
+        per-query fallbacks.
+        """
+        if vector:
+            try:
+                from kb_agent.agent.tools import _get_vector
+                vt = _get_vector()
+                ef = getattr(vt, "embedding_function", None)
+                if ef is not None:
+                    # First ONNX run allocates the session's buffers.  Call past the
+                    # embedding cache, which would otherwise answer from disk.
+                    getattr(ef, "inner", ef)(["warmup"])
+            except Exception as e:
+                logger.warning(f"Vector warmup failed: {e}")
+        if reranker:
+            try:
+                self.reranker()
+            except Exception as e:
+                logger.warning(f"Reranker warmup failed: {e}")
+        if graph:
+            try:
+                self.graph()
+            except Exception as e:
+                logger.warning(f"Graph warmup failed: {e}")
+
+    def clear(self):
+        """Forget every cached resource without closing anything (used by tests)."""
+        with self._lock:
+            self._items.clear()
+            self._key_locks.clear()
+
+    def shutdown(self):
+        """Release models, caches and clients; later lookups load them again."""
+        with self._lock:
+            items = list(self._items.values())
+            self._items.clear()
+            self._key_locks.clear()
+        for item in items:
+            for attr in ("close", "shutdown"):
+                fn = getattr(item, attr, None)
+                if callable(fn):
+                    try:
+                        fn()
+                    except Exception as e:
+                        logger.warning(f"Error releasing {type(item).__name__}: {e}")
+                    break
+
+
+registry = ResourceRegistry()
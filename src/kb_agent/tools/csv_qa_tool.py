@@ -1,23 +1,199 @@
+import glob
+import hashlib
+import io
 import json
 import logging
 import os
+import re
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from typing import Any, Dict, Optional, Tuple, List
 
 import pandas as pd
 
-from kb_agent.config import settings
+import kb_agent.config as config
+import kb_agent.tools.csv_sql_tool as csv_sql_tool
 
 logger = logging.getLogger(__name__)
 
+# Object columns with at most this share of distinct values are stored as categoricals in sidecars
+_CATEGORY_MAX_UNIQUE_RATIO = 0.5
+_CATEGORY_MIN_ROWS = 100
+
+
+def _downcast(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy of ``df`` with repetitive text columns (status, currency, branch codes, ...)
+    as categoricals, to keep sidecars small.
+
+    Only sidecars are downcast; ``_restore_dtypes`` undoes it on load.  Unordered
+    categoricals reject range comparisons and numeric columns would change
+    arithmetic, so queries always run on the dtypes ``read_csv`` produced.
+    """
+    df = df.copy(deep=False)
+    if len(df) < _CATEGORY_MIN_ROWS:
+        return df
+    for col in df.select_dtypes(include=["object", "string"]).columns:
+        try:
+            if df[col].nunique(dropna=True) <= len(df) * _CATEGORY_MAX_UNIQUE_RATIO:
+                df[col] = df[col].astype("category")
+        except TypeError:
+            # Unhashable / mixed values: leave the column alone
+            continue
+    return df
+
+
+def _restore_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the categoricals of a sidecar back to the dtype of their values."""
+    for col in df.select_dtypes(include=["category"]).columns:
+        df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return df
+
+
+def _is_mixed(series: pd.Series) -> bool:
+    """True for an object column holding values of several Python types (e.g. ints and strings)."""
+    return series.dtype == object and pd.api.types.infer_dtype(series, skipna=True).startswith("mixed")
+
+
+def _read_csv(file_path: str) -> pd.DataFrame:
+    """
+    Parse a whole CSV.  Columns pandas would parse to mixed Python types are
+    re-read as text, the same rule ``_csv_query_streaming`` applies per column.
+    """
+    df = pd.read_csv(file_path)
+    text_cols = [col for col in df.columns if _is_mixed(df[col])]
+    if text_cols:
+        df = pd.read_csv(file_path, dtype=dict.fromkeys(text_cols, str))
+    return df
+
+
+class DataFrameCache:
+    """
+    LRU cache of parsed CSVs bounded by their in-memory size (``memory_usage(deep=True)``).
+
+    Entries are invalidated when the file's size or mtime changes.  Each parsed
+    file is also written once to a sidecar under ``cache_path/csv`` (Parquet if
+    pyarrow is installed, otherwise pickle), so the next process loads it without
+    re-parsing the CSV.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, sidecar_dir: Optional[Path] = None):
+        self._max_bytes = max_bytes
+        self._sidecar_dir = sidecar_dir
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], pd.DataFrame, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is not None:
+            return self._max_bytes
+        settings = config.settings
+        max_mb = getattr(settings, "csv_cache_max_mb", None) if settings else None
+        return (max_mb if isinstance(max_mb, int) and max_mb >= 0 else 512) * 1024 * 1024
+
+    @property
+    def sidecar_dir(self) -> Optional[Path]:
+        if self._sidecar_dir is not None:
+            return self._sidecar_dir
+        settings = config.settings
+        if not settings or getattr(settings, "csv_sidecar_enabled", True) is False:
+            return None
+        cache_path = getattr(settings, "cache_path", None)
+        return Path(cache_path) / "csv" if isinstance(cache_path, (str, Path)) else None
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __contains__(self, file_path: str) -> bool:
+        return file_path in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, file_path: str) -> pd.DataFrame:
+        """The DataFrame for ``file_path``, parsing (or loading its sidecar) if it isn't cached or changed on disk."""
+        st = os.stat(file_path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None:
+                if entry[0] == stamp:
+                    self._entries.move_to_end(file_path)
+                    return entry[1]
+                self._drop_locked(file_path)
+
+        df = self._load(file_path, stamp)
+        nbytes = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if file_path in self._entries:
+                self._drop_locked(file_path)
+            self._entries[file_path] = (stamp, df, nbytes)
+            self._total_bytes += nbytes
+            # Evict least recently used, but always keep the frame just loaded
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                self._drop_locked(next(iter(self._entries)))
+        return df
+
+    def _drop_locked(self, file_path: str):
+        _, _, nbytes = self._entries.pop(file_path)
+        self._total_bytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    # ------------------------------------------------------------------
+    # Sidecars
+    # ------------------------------------------------------------------
+
+    def _sidecar_base(self, file_path: str) -> Optional[Path]:
+        sidecar_dir = self.sidecar_dir
+        if sidecar_dir is None:
+            return None
+        digest = hashlib.blake2b(os.path.abspath(file_path).encode("utf-8"), digest_size=10).hexdigest()
+        return sidecar_dir / f"{Path(file_path).stem}-{digest}"
+
+    def _load(self, file_path: str, stamp: Tuple[int, int]) -> pd.DataFrame:
+        base = self._sidecar_base(file_path)
+        if base is None:
+            return _read_csv(file_path)
+
+        tag = f"{base}.{stamp[0]}.{stamp[1]}"
+        for suffix, reader in ((".parquet", pd.read_parquet), (".pkl", pd.read_pickle)):
+            if os.path.exists(tag + suffix):
+                try:
+                    return _restore_dtypes(reader(tag + suffix))
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable CSV sidecar {tag + suffix}: {e}")
+
+        df = _read_csv(file_path)
+        try:
+            os.makedirs(base.parent, exist_ok=True)
+            # Sidecars of older versions of this file are obsolete
+            for old in glob.glob(glob.escape(str(base)) + ".*"):
+                os.remove(old)
+            stored = _downcast(df)
+            try:
+                stored.to_parquet(tag + ".parquet", index=False)
+            except ImportError:
+                stored.to_pickle(tag + ".pkl")
+        except Exception as e:
+            logger.warning(f"Could not write CSV sidecar for {file_path}: {e}")
+        return df
+
+
 # Global cache for DataFrames
-_df_cache: Dict[str, pd.DataFrame] = {}
+_df_cache = DataFrameCache()
 
 
 def clear_cache() -> None:
     """Clear the pandas DataFrame cache to free memory."""
-    global _df_cache
     _df_cache.clear()
+    _stream_text_cols.clear()
     logger.debug("CSV cache cleared.")
 
 
@@ -29,7 +205,7 @@ def _find_csv_file(filename: str) -> Optional[str]:
     if not filename.endswith(".csv"):
         filename += ".csv"
     
-    base_dir = Path(settings.data_folder)
+    base_dir = Path(config.settings.data_folder)
     
     # Priority 1: archive folder
     archive_path = base_dir / "archive" / filename
@@ -44,6 +220,174 @@ def _find_csv_file(filename: str) -> Optional[str]:
     return None
 
 
+MAX_RESULT_ROWS = 50
+
+
+def _stream_settings() -> Tuple[int, int]:
+    """(size threshold in bytes above which CSVs are processed in chunks, rows per chunk)."""
+    settings = config.settings
+    threshold_mb = getattr(settings, "csv_stream_threshold_mb", None) if settings else None
+    chunk_rows = getattr(settings, "csv_stream_chunk_rows", None) if settings else None
+    threshold_mb = threshold_mb if isinstance(threshold_mb, int) and threshold_mb >= 0 else 256
+    chunk_rows = chunk_rows if isinstance(chunk_rows, int) and chunk_rows > 0 else 100_000
+    return threshold_mb * 1024 * 1024, chunk_rows
+
+
+def _use_streaming(file_path: str) -> bool:
+    # A file that is already in memory is always faster to query there
+    if file_path in _df_cache:
+        return False
+    threshold, _ = _stream_settings()
+    return threshold > 0 and os.path.getsize(file_path) > threshold
+
+
+def _condition_error(condition: str, e: Exception, headers: List[str]) -> str:
+    return (
+        f"Error executing condition '{condition}': {str(e)}.\n"
+        f"CRITICAL: Do not generate the same erroneous query again. "
+        f"The valid column headers in the CSV are: {headers}. "
+        f"Please correct your pandas query strictly using ONLY these headers and try again."
+    )
+
+
+def _referenced_columns(condition: str, headers: List[str]) -> List[str]:
+    """Header columns a pandas ``query`` condition may refer to (a superset is fine)."""
+    referenced = []
+    for col in headers:
+        name = str(col)
+        if f"`{name}`" in condition or re.search(r"(?<![\w.])" + re.escape(name) + r"(?!\w)", condition):
+            referenced.append(col)
+    return referenced
+
+
+# file_path -> ((size, mtime_ns), columns to read as text) for streamed files, see _csv_query_streaming
+_stream_text_cols: Dict[str, Tuple[Tuple[int, int], frozenset]] = {}
+# Evenly spaced samples read to decide text columns before streaming a file
+_STREAM_SAMPLES = 8
+_STREAM_SAMPLE_ROWS = 1000
+
+
+def _value_kind(series: pd.Series) -> str:
+    """Coarse kind of a chunk's column: "string", "mixed", "empty" (all missing) or "other"."""
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    if kind.startswith("mixed"):
+        return "mixed"
+    return kind if kind in ("string", "empty") else "other"
+
+
+def _mixed_columns(kinds_per_sample: List[Dict[str, str]], seen: Optional[Dict[str, str]] = None) -> set:
+    """
+    Columns that are mixed in a sample, or "string" in one sample and something
+    else in another.  ``seen`` carries the kinds over between calls.
+    """
+    seen = {} if seen is None else seen
+    mixed = set()
+    for kinds in kinds_per_sample:
+        for col, kind in kinds.items():
+            if kind == "empty":
+                continue
+            if kind == "mixed" or seen.setdefault(col, kind) != kind:
+                mixed.add(col)
+    return mixed
+
+
+def _sample_text_columns(file_path: str, sample_rows: int) -> set:
+    """
+    Columns that should be read as text, judged from ``_STREAM_SAMPLES`` runs of
+    ``sample_rows`` lines spread evenly over the file (a bounded read, however
+    large the file is).  A sample that doesn't parse (it started inside a quoted
+    multi-line field) is skipped.
+    """
+    size = os.path.getsize(file_path)
+    samples = []
+    with open(file_path, "rb") as f:
+        header = f.readline()
+        for i in range(_STREAM_SAMPLES):
+            f.seek(len(header) + (size - len(header)) * i // _STREAM_SAMPLES)
+            if i:
+                f.readline()  # skip the partial line
+            lines = [f.readline() for _ in range(sample_rows)]
+            body = b"".join(line for line in lines if line)
+            if not body:
+                continue
+            try:
+                sample = pd.read_csv(io.BytesIO(header + body))
+            except Exception:
+                continue
+            samples.append({col: _value_kind(sample[col]) for col in sample.columns})
+    return _mixed_columns(samples)
+
+
+def _csv_query_streaming(file_path: str, condition: Optional[str], columns: Optional[List[str]]) -> str:
+    """
+    ``csv_query`` for files too large to load: evaluate ``condition`` chunk by chunk,
+    reading only the columns it and ``columns`` need, until enough rows match.
+
+    Chunks infer their dtypes independently, so an id column may be int64 in one
+    chunk and text in the next.  Columns that are mixed -- in evenly spaced
+    samples taken once per file version, or in the chunks as they are read --
+    are read as text, which is what ``_read_csv`` gives the whole file; a column
+    found mixed mid-scan restarts the scan.  Numeric drift (int64 → float64)
+    needs neither: the matches are concatenated, which widens them.  The file
+    is never scanned in full up front, so drift that the samples miss and that
+    lies beyond the point where enough rows matched goes unnoticed.
+    """
+    _, chunk_rows = _stream_settings()
+    headers = list(pd.read_csv(file_path, nrows=0).columns)
+
+    if columns:
+        missing_cols = [col for col in columns if col not in headers]
+        if missing_cols:
+            return f"Error: the following requested columns do not exist in the DataFrame: {missing_cols}. Available columns are: {headers}"
+
+    usecols = None
+    if columns:
+        needed = set(columns) | set(_referenced_columns(condition, headers) if condition else [])
+        usecols = [col for col in headers if col in needed]
+
+    st = os.stat(file_path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    cached = _stream_text_cols.get(file_path)
+    if cached and cached[0] == stamp:
+        text_cols = set(cached[1])
+    else:
+        text_cols = _sample_text_columns(file_path, min(chunk_rows, _STREAM_SAMPLE_ROWS))
+        _stream_text_cols[file_path] = (stamp, frozenset(text_cols))
+
+    while True:
+        matches: List[pd.DataFrame] = []
+        found = 0
+        seen_kinds: Dict[str, str] = {}
+        drifted = set()
+        dtype = {col: str for col in text_cols if usecols is None or col in usecols}
+        with pd.read_csv(file_path, usecols=usecols, chunksize=chunk_rows, dtype=dtype or None) as reader:
+            for chunk in reader:
+                kinds = {col: _value_kind(chunk[col]) for col in chunk.columns if col not in text_cols}
+                drifted = _mixed_columns([kinds], seen_kinds)
+                if drifted:
+                    break
+                if condition:
+                    try:
+                        chunk = chunk.query(condition)
+                    except Exception as e:
+                        return _condition_error(condition, e, headers)
+                if chunk.empty:
+                    continue
+                matches.append(chunk[columns] if columns else chunk)
+                found += len(chunk)
+                if found >= MAX_RESULT_ROWS:
+                    break
+        if not drifted:
+            break
+        # Rows already evaluated saw these columns as numbers: start over with them as text
+        text_cols |= drifted
+        _stream_text_cols[file_path] = (stamp, frozenset(text_cols))
+
+    if not matches:
+        return "Query returned no results."
+    return pd.concat(matches).head(MAX_RESULT_ROWS).to_markdown(index=False)
+
+
 def get_csv_schema_and_sample(filename: str) -> str:
     """
     Get the schema (columns and dtypes) and a small sample of the CSV.
@@ -54,11 +398,14 @@ def get_csv_schema_and_sample(filename: str) -> str:
         return f"Error: CSV file '{filename}' not found in archive or source folders."
         
     try:
-        # Load into cache if not present
-        if file_path not in _df_cache:
-            _df_cache[file_path] = pd.read_csv(file_path)
-            
-        df = _df_cache[file_path]
+        note = ""
+        if _use_streaming(file_path):
+            # Too large to load just to describe it: infer dtypes from the first chunk
+            _, chunk_rows = _stream_settings()
+            df = pd.read_csv(file_path, nrows=chunk_rows)
+            note = f"\n(dtypes inferred from the first {len(df)} rows; file is large, csv_query scans it in chunks)"
+        else:
+            df = _df_cache.get(file_path)
         
         # Build schema representation
         schema_info = []
@@ -68,7 +415,7 @@ def get_csv_schema_and_sample(filename: str) -> str:
         schema_str = "\n".join(schema_info)
         sample_str = df.head(3).to_markdown()
         
-        return f"Schema:\n{schema_str}\n\nSample Data (first 3 rows):\n{sample_str}"
+        return f"Schema:\n{schema_str}{note}\n\nSample Data (first 3 rows):\n{sample_str}"
         
     except Exception as e:
         return f"Error reading CSV {filename}: {str(e)}"
@@ -101,12 +448,15 @@ def csv_query(filename: str, query_json_str: str) -> str:
             
         condition = query_obj.get("condition")
         columns = query_obj.get("columns")
+
+        if _use_streaming(file_path):
+            return _csv_query_streaming(
+                file_path,
+                str(condition) if condition and str(condition).strip() else None,
+                columns if isinstance(columns, list) and columns else None,
+            )
         
-        # Load into cache if not present
-        if file_path not in _df_cache:
-            _df_cache[file_path] = pd.read_csv(file_path)
-            
-        df = _df_cache[file_path]
+        df = _df_cache.get(file_path)
         
         result_df = df
         
@@ -115,13 +465,8 @@ def csv_query(filename: str, query_json_str: str) -> str:
             try:
                 result_df = result_df.query(condition)
             except Exception as e:
-                headers = list(df.columns)
-                return (
-                    f"Error executing condition '{condition}': {str(e)}.\n"
-                    f"CRITICAL: Do not generate the same erroneous query again. "
-                    f"The valid column headers in the CSV are: {headers}. "
-                    f"Please correct your pandas query strictly using ONLY these headers and try again."
-                )
+                return _condition_error(condition, e, list(df.columns))
+            csv_sql_tool.record_condition(file_path, _referenced_columns(condition, list(df.columns)))
                 
         # Select columns if provided
         if columns and isinstance(columns, list) and len(columns) > 0:
@@ -136,7 +481,7 @@ def csv_query(filename: str, query_json_str: str) -> str:
                 return f"Error selecting columns {columns}: {str(e)}."
                 
         # Limit the results and convert to markdown
-        limited_df = result_df.head(50)
+        limited_df = result_df.head(MAX_RESULT_ROWS)
         
         if limited_df.empty:
             return "Query returned no results."
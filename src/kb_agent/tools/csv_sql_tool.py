@@ -0,0 +1,392 @@
+"""
+SQL over the CSV files in ``archive/`` and ``input/`` (``csv_sql`` tool).
+
+Each CSV is copied once into an on-disk SQLite database under ``cache_path``
+(one table per file, reloaded when the file's size or mtime changes), so
+aggregations and joins run inside SQLite instead of materializing pandas
+DataFrames.  Only the tables a statement names are loaded; a file pandas
+can't parse is skipped (and not retried until it changes) instead of failing
+every query.  Columns that appear in conditions — of ``csv_sql`` queries or
+of ``csv_query`` filters — get an index, so repeated lookups by account id
+or date become index seeks.
+
+Queries run on a separate read-only connection with an authorizer that only
+permits reads, a wall-clock timeout and a result row cap.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+import kb_agent.config as config
+
+logger = logging.getLogger(__name__)
+
+DB_FILENAME = "csv_sql.db"
+LOAD_CHUNK_ROWS = 100_000
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS _csv_files (
+        name TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS _csv_failures (
+        name TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        error TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS _csv_column_usage (
+        name TEXT NOT NULL,
+        col TEXT NOT NULL,
+        hits INTEGER NOT NULL,
+        PRIMARY KEY (name, col)
+    )
+    """,
+]
+
+# Everything a read-only SELECT needs; anything else (writes, PRAGMA, ATTACH, ...) is denied
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+if hasattr(sqlite3, "SQLITE_RECURSIVE"):
+    _ALLOWED_ACTIONS.add(sqlite3.SQLITE_RECURSIVE)
+
+_CONDITION_OPS = r"\s*(?:=|==|!=|<>|<=|>=|<|>|\bIN\b|\bNOT\s+IN\b|\bBETWEEN\b|\bLIKE\b)"
+
+
+def table_name(file_name: str) -> str:
+    """SQL table name for a CSV file: ``Q3 Transactions.csv`` → ``q3_transactions``."""
+    name = re.sub(r"\W+", "_", Path(file_name).stem.lower()).strip("_") or "csv"
+    return f"t_{name}" if name[0].isdigit() else name
+
+
+def _quote(identifier: str) -> str:
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def mentions_table(sql: str, name: str) -> bool:
+    return re.search(rf'(?<![\w"]){re.escape(name)}(?![\w"])|"{re.escape(name)}"', sql, re.IGNORECASE) is not None
+
+
+def condition_columns(sql: str, columns: Iterable[str]) -> List[str]:
+    """Columns compared against something in ``sql`` (``col = ...``, ``col IN (...)``, ...)."""
+    used = []
+    for col in columns:
+        name = re.escape(str(col))
+        if re.search(rf'(?:"{name}"|`{name}`|(?<![\w."]){name}(?![\w"])){_CONDITION_OPS}', sql, re.IGNORECASE):
+            used.append(col)
+    return used
+
+
+class CsvSqlEngine:
+    def __init__(self, db_path: Path, source_dirs: List[Path]):
+        self.db_path = Path(db_path)
+        # Later directories take precedence when two hold the same file name
+        self.source_dirs = [Path(d) for d in source_dirs]
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            self._conn.execute(stmt)
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def csv_files(self) -> Dict[str, Path]:
+        files: Dict[str, Path] = {}
+        for directory in self.source_dirs:
+            if not directory.is_dir():
+                continue
+            for entry in sorted(directory.iterdir()):
+                if entry.is_file() and entry.suffix.lower() == ".csv":
+                    files[table_name(entry.name)] = entry
+        return files
+
+    def referenced_tables(self, sql: str) -> List[str]:
+        """Tables of the current CSV files that ``sql`` names."""
+        return [name for name in self.csv_files() if mentions_table(sql, name)]
+
+    def sync(self, names: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Load new/changed CSVs (only ``names``, if given) and drop tables whose file
+        is gone. Returns the tables (re)loaded.  Files that fail to parse are logged,
+        skipped and remembered by size/mtime, so they are only retried once changed.
+        """
+        files = self.csv_files()
+        wanted = set(files) if names is None else set(names) & set(files)
+        loaded = []
+        with self._lock:
+            known = {
+                name: (path, size, mtime_ns)
+                for name, path, size, mtime_ns in self._conn.execute("SELECT name, path, size, mtime_ns FROM _csv_files")
+            }
+            failed = {
+                name: (path, size, mtime_ns)
+                for name, path, size, mtime_ns in self._conn.execute("SELECT name, path, size, mtime_ns FROM _csv_failures")
+            }
+            for name in sorted(wanted):
+                path = files[name]
+                st = path.stat()
+                signature = (str(path), st.st_size, st.st_mtime_ns)
+                if known.get(name) == signature or failed.get(name) == signature:
+                    continue
+                try:
+                    self._load_locked(name, path, st)
+                except Exception as e:
+                    self._fail_locked(name, path, st, e)
+                    continue
+                loaded.append(name)
+            for name in set(known) - set(files):
+                self._conn.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+                self._conn.execute("DELETE FROM _csv_files WHERE name = ?", (name,))
+            self._conn.execute(
+                f"DELETE FROM _csv_failures WHERE name NOT IN ({','.join('?' * len(files))})", list(files)
+            )
+            self._conn.commit()
+        return loaded
+
+    def _fail_locked(self, name: str, path: Path, st: os.stat_result, error: Exception):
+        logger.warning(f"csv_sql: skipping {path.name}, could not load it: {error}")
+        # pandas commits each appended chunk, so drop whatever part of the table was written
+        self._conn.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        self._conn.execute("DELETE FROM _csv_files WHERE name = ?", (name,))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO _csv_failures (name, path, size, mtime_ns, error) VALUES (?, ?, ?, ?, ?)",
+            (name, str(path), st.st_size, st.st_mtime_ns, str(error)),
+        )
+
+    def _load_locked(self, name: str, path: Path, st: os.stat_result):
+        start = time.perf_counter()
+        self._conn.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        rows = 0
+        with pd.read_csv(path, chunksize=LOAD_CHUNK_ROWS) as reader:
+            for chunk in reader:
+                chunk.to_sql(name, self._conn, if_exists="append", index=False)
+                rows += len(chunk)
+        if not rows:
+            # Header-only file: still create the (empty) table
+            pd.read_csv(path, nrows=0).to_sql(name, self._conn, if_exists="replace", index=False)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO _csv_files (name, path, size, mtime_ns) VALUES (?, ?, ?, ?)",
+            (name, str(path), st.st_size, st.st_mtime_ns),
+        )
+        self._conn.execute("DELETE FROM _csv_failures WHERE name = ?", (name,))
+        for (col,) in self._conn.execute("SELECT col FROM _csv_column_usage WHERE name = ?", (name,)).fetchall():
+            self._create_index_locked(name, col)
+        logger.info(f"csv_sql: loaded {rows} rows of {path.name} into table {name} in {time.perf_counter() - start:.1f}s")
+
+    def failures(self) -> Dict[str, str]:
+        """Tables whose current file failed to load, with the error."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, error FROM _csv_failures"))
+
+    def columns(self, name: str) -> List[str]:
+        with self._lock:
+            return [row[1] for row in self._conn.execute(f"PRAGMA table_info({_quote(name)})")]
+
+    def tables(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT name FROM _csv_files ORDER BY name")]
+
+    # ------------------------------------------------------------------
+    # Indexes from past conditions
+    # ------------------------------------------------------------------
+
+    def _create_index_locked(self, name: str, col: str):
+        try:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {_quote(f'idx_{name}_{col}')} ON {_quote(name)} ({_quote(col)})"
+            )
+        except sqlite3.Error as e:
+            logger.debug(f"csv_sql: could not index {name}.{col}: {e}")
+
+    def record_condition_columns(self, name: str, cols: Iterable[str]):
+        """Remember that ``cols`` of table ``name`` were filtered on, and index them if the table is loaded."""
+        cols = list(cols)
+        if not cols:
+            return
+        with self._lock:
+            loaded = self._conn.execute("SELECT 1 FROM _csv_files WHERE name = ?", (name,)).fetchone() is not None
+            for col in cols:
+                self._conn.execute(
+                    "INSERT INTO _csv_column_usage (name, col, hits) VALUES (?, ?, 1) "
+                    "ON CONFLICT(name, col) DO UPDATE SET hits = hits + 1",
+                    (name, col),
+                )
+                if loaded:
+                    self._create_index_locked(name, col)
+            self._conn.commit()
+
+    def _record_sql_conditions(self, sql: str):
+        for name in self.tables():
+            if mentions_table(sql, name):
+                self.record_condition_columns(name, condition_columns(sql, self.columns(name)))
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+
+    def execute(self, sql: str, max_rows: int = 200, timeout: float = 10.0) -> Tuple[List[str], List[tuple], bool]:
+        """Run one read-only statement. Returns (column names, rows, truncated)."""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            conn.set_authorizer(lambda action, *args: sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY)
+            deadline = time.monotonic() + timeout
+            # Returning non-zero aborts the statement with "interrupted"
+            conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10_000)
+            cursor = conn.execute(sql)
+            columns = [d[0] for d in cursor.description or []]
+            rows = cursor.fetchmany(max_rows + 1)
+        finally:
+            conn.close()
+        truncated = len(rows) > max_rows
+        self._record_sql_conditions(sql)
+        return columns, rows[:max_rows], truncated
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _limits() -> Tuple[int, float]:
+    settings = config.settings
+    max_rows = getattr(settings, "csv_sql_max_rows", None) if settings else None
+    timeout = getattr(settings, "csv_sql_timeout_seconds", None) if settings else None
+    max_rows = max_rows if isinstance(max_rows, int) and max_rows > 0 else 200
+    timeout = float(timeout) if isinstance(timeout, (int, float)) and timeout > 0 else 10.0
+    return max_rows, timeout
+
+
+def is_enabled() -> bool:
+    settings = config.settings
+    return bool(settings and getattr(settings, "data_folder", None)) and getattr(settings, "csv_sql_enabled", True) is not False
+
+
+def _db_path() -> Path:
+    settings = config.settings
+    base_dir = Path(settings.data_folder)
+    cache_dir = Path(settings.cache_path) if getattr(settings, "cache_path", None) else base_dir / "cache"
+    return cache_dir / DB_FILENAME
+
+
+def _existing_engine() -> Optional[CsvSqlEngine]:
+    from kb_agent.registry import registry
+    return registry.peek(("csv_sql", str(_db_path())))
+
+
+def get_engine() -> Optional[CsvSqlEngine]:
+    """The process-wide engine for the configured data folder, or None if csv_sql is disabled."""
+    if not is_enabled():
+        return None
+    settings = config.settings
+    base_dir = Path(settings.data_folder)
+    db_path = _db_path()
+    from kb_agent.registry import registry
+
+    def _create():
+        # input/ first so archive/ wins on name clashes, matching csv_query's lookup order
+        engine = CsvSqlEngine(db_path, [base_dir / "input", base_dir / "archive"])
+        with _pending_lock:
+            pending = _pending_conditions.pop(str(db_path), {})
+        for name, cols in pending.items():
+            engine.record_condition_columns(name, cols)
+        return engine
+
+    return registry.get_or_create(("csv_sql", str(db_path)), _create)
+
+
+# csv_query conditions seen before csv_sql was first used, per database: table -> columns
+_pending_conditions: Dict[str, Dict[str, List[str]]] = {}
+_pending_lock = threading.Lock()
+
+
+def record_condition(file_path: str, cols: Iterable[str]):
+    """
+    Called by ``csv_query`` so columns it filters on get indexed for ``csv_sql`` too.
+
+    Until ``csv_sql`` has opened its database in this process the columns are
+    only kept in memory, so ``csv_query`` alone never creates or writes it.
+    """
+    cols = list(cols)
+    if not cols or not is_enabled():
+        return
+    try:
+        name = table_name(Path(file_path).name)
+        engine = _existing_engine()
+        if engine is not None:
+            engine.record_condition_columns(name, cols)
+            return
+        with _pending_lock:
+            tables = _pending_conditions.setdefault(str(_db_path()), {})
+            tables.setdefault(name, []).extend(c for c in cols if c not in tables[name])
+    except Exception as e:
+        logger.debug(f"csv_sql: could not record condition columns: {e}")
+
+
+def _describe(engine: CsvSqlEngine) -> str:
+    loaded = set(engine.tables())
+    failures = engine.failures()
+    lines = []
+    for name, path in engine.csv_files().items():
+        if name in failures:
+            lines.append(f"- {name} (could not be loaded: {failures[name]})")
+            continue
+        try:
+            cols = engine.columns(name) if name in loaded else list(pd.read_csv(path, nrows=0).columns)
+        except Exception as e:
+            lines.append(f"- {name} (could not be read: {e})")
+            continue
+        lines.append(f"- {name}({', '.join(str(c) for c in cols)})")
+    return "\n".join(lines) or "(no CSV files found)"
+
+
+def run_sql(sql: str) -> str:
+    """Run a read-only SQL query over the CSV tables and return a Markdown table."""
+    engine = get_engine()
+    if engine is None:
+        return "Error: csv_sql is disabled (set csv_sql_enabled and data_folder). Use csv_query instead."
+    if not sql or not sql.strip():
+        return "Error: empty SQL query."
+
+    try:
+        engine.sync(engine.referenced_tables(sql))
+    except Exception as e:
+        return f"Error loading CSV files into SQLite: {str(e)}"
+
+    max_rows, timeout = _limits()
+    try:
+        columns, rows, truncated = engine.execute(sql.strip().rstrip(";"), max_rows=max_rows, timeout=timeout)
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e):
+            return f"Error: query exceeded the {timeout:g}s time limit. Add filters or aggregate instead of scanning everything."
+        return f"Error executing SQL: {str(e)}.\nAvailable tables:\n{_describe(engine)}"
+    except sqlite3.DatabaseError as e:
+        # Includes "not authorized" for anything but reads
+        return f"Error executing SQL: {str(e)}. Only a single read-only SELECT statement is allowed.\nAvailable tables:\n{_describe(engine)}"
+    except Exception as e:
+        return f"Unexpected error executing SQL: {str(e)}"
+
+    if not rows:
+        return "Query returned no results."
+    result = pd.DataFrame(rows, columns=columns).to_markdown(index=False)
+    if truncated:
+        result += f"\n\n[Showing the first {max_rows} rows; aggregate or add a LIMIT/WHERE clause to narrow the result.]"
+    return result
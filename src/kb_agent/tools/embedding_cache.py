@@ -0,0 +1,204 @@
+"""
+Persistent embedding cache keyed by (embedding model id, normalized text hash).
+
+Sits in front of the configured embedding function (local ONNX or remote
+``embedding_url``) for document chunks, so re-indexing unchanged content, a model warm restart, or
+rebuilding a collection after a Chroma wipe does not re-embed identical chunk
+text.  Vectors are stored as float16 blobs in a single SQLite file under
+``data_folder``; entries are evicted least-recently-used once the file grows
+past a configurable size.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import chromadb.utils.embedding_functions as embedding_functions
+
+logger = logging.getLogger("kb_agent")
+
+CACHE_FILENAME = "embedding_cache.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    vec BLOB NOT NULL,
+    last_used INTEGER NOT NULL
+) WITHOUT ROWID
+"""
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalization applied before hashing, so canonically equivalent spellings share an entry.
+
+    Only NFC: surrounding whitespace is kept because it changes the tokens the model sees.
+    """
+    return unicodedata.normalize("NFC", text)
+
+
+# Bumped whenever normalize_text changes, so entries stored under the old rule are never served
+_KEY_VERSION = b"2"
+
+
+def cache_key(model_id: str, text: str) -> bytes:
+    h = hashlib.blake2b(digest_size=20)
+    h.update(_KEY_VERSION)
+    h.update(b"\x00")
+    h.update(model_id.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(normalize_text(text).encode("utf-8"))
+    return h.digest()
+
+
+class EmbeddingCache:
+    """SQLite store of float16 vectors with hit/miss counters and LRU eviction."""
+
+    def __init__(self, db_path: Path, max_bytes: int = 512 * 1024 * 1024):
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._size_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0]
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Return cached float32 vectors for whichever keys are present, refreshing their LRU stamp."""
+        if not keys:
+            return {}
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, vec in self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})", batch
+                ):
+                    found[bytes(key)] = np.frombuffer(vec, dtype=np.float16).astype(np.float32)
+            if found:
+                now = time.time_ns()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, items: Dict[bytes, np.ndarray]):
+        if not items:
+            return
+        now = time.time_ns()
+        rows = [(k, np.asarray(v, dtype=np.float16).tobytes(), now) for k, v in items.items()]
+        with self._lock:
+            for key, blob, _ in rows:
+                old = self._conn.execute("SELECT LENGTH(vec) FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self._size_bytes += len(blob) - (old[0] if old else 0)
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vec, last_used) VALUES (?, ?, ?)", rows)
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        if self.max_bytes <= 0 or self._size_bytes <= self.max_bytes:
+            return
+        # Evict down to 90% of the cap so we don't evict on every subsequent insert
+        target = int(self.max_bytes * 0.9)
+        while self._size_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vec) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._size_bytes = 0
+                break
+            victims = []
+            for key, length in rows:
+                victims.append((key,))
+                self._size_bytes -= length
+                if self._size_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+            self.evictions += len(victims)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._size_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddingFunction(embedding_functions.EmbeddingFunction):
+    """Wraps an embedding function and serves repeated texts from an ``EmbeddingCache``."""
+
+    def __init__(self, inner, cache: EmbeddingCache, model_id: str):
+        self.inner = inner
+        self.cache = cache
+        self.model_id = model_id
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        if not input:
+            return []
+
+        keys = [cache_key(self.model_id, text) for text in input]
+        cached = self.cache.get_many(keys)
+
+        # Embed each distinct missing text once, in one call to the inner function
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, input):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            fresh = self.inner(list(missing.values()))
+            computed = {key: np.asarray(vec, dtype=np.float32) for key, vec in zip(missing, fresh)}
+            self.cache.put_many(computed)
+            cached.update(computed)
+
+        return [cached[key].tolist() for key in keys]
+
+    def embed_query(self, input: List[str]) -> List[List[float]]:
+        """
+        Embed search queries without the cache: queries rarely repeat, and caching
+        them would cost a SQLite write on every search.  Chroma calls this for
+        ``collection.query``; ``__call__`` is only used for documents.
+        """
+        embed_query = getattr(self.inner, "embed_query", None)
+        return embed_query(input=input) if callable(embed_query) else self.inner(input)
+
+    def close(self):
+        self.cache.close()
+
+
+def default_cache_path(settings) -> Optional[Path]:
+    """Location of the cache file (``cache_path`` defaults to ``<data_folder>/cache``)."""
+    if settings is None or not getattr(settings, "cache_path", None):
+        return None
+    return Path(settings.cache_path) / CACHE_FILENAME
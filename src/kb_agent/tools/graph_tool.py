@@ -1,43 +1,66 @@
-from kb_agent.graph.graph_builder import GraphBuilder
+from collections import Counter, deque
+from kb_agent.graph.graph_store import GraphStore, LEGACY_JSON_FILENAME, default_store_path
 from kb_agent.config import settings
-from typing import List, Dict, Any
-import networkx as nx
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 import logging
 
 logger = logging.getLogger("kb_agent")
 
+# Bounds for traverse(): hops, new neighbours expanded per node, and nodes in the returned subgraph
+MAX_TRAVERSE_DEPTH = 4
+DEFAULT_FANOUT = 20
+MAX_SUBGRAPH_NODES = 200
+
 class GraphTool:
     def __init__(self):
+        # Neighbours are read from the SQLite store on demand; the graph is never loaded as a whole
+        self.store: Optional[GraphStore] = None
         if settings:
-            self.builder = GraphBuilder(settings.source_docs_path, settings.index_path)
-            self.builder.load_graph()
-            self.graph = self.builder.graph
-        else:
-            self.graph = nx.DiGraph()
+            self.store = GraphStore(default_store_path(settings.index_path))
+            self.store.import_legacy_json(settings.index_path / LEGACY_JSON_FILENAME)
+
+    def _resolve(self, entity_id: str) -> Optional[str]:
+        if self.store.has_node(entity_id):
+            return entity_id
+        # Try appending .md
+        if self.store.has_node(f"{entity_id}.md"):
+            return f"{entity_id}.md"
+        # Best fuzzy match from the store's lookup index (case-insensitive id, basename, substring)
+        candidates = self.store.lookup(entity_id, limit=1)
+        return candidates[0] if candidates else None
+
+    def find_entities(self, query: str, limit: int = 10) -> List[str]:
+        """Node ids matching ``query``, best first (see ``GraphStore.lookup``)."""
+        if self.store is None:
+            return []
+        return self.store.lookup(query, limit=limit)
 
     def get_related_nodes(self, entity_id: str, max_depth: int = 1) -> List[Dict[str, Any]]:
         """
         Returns related nodes for a given entity.
         Supports fuzzy matching if exact node not found.
+
+        With ``max_depth`` > 1 every node reached within that many hops is
+        returned once, with its ``depth`` and the edge it was reached through.
         """
-        if not self.graph:
+        if self.store is None:
             return []
 
-        # 1. Find target node
-        target = None
-        if entity_id in self.graph:
-            target = entity_id
-        else:
-            # Try appending .md
-            if f"{entity_id}.md" in self.graph:
-                target = f"{entity_id}.md"
-            # Try finding matches by label
-            else:
-                for node, data in self.graph.nodes(data=True):
-                    if entity_id.lower() in str(node).lower():
-                        target = node
-                        break
+        if max_depth > 1:
+            _, nodes, via, _, _ = self._bfs([entity_id], max_depth)
+            return [
+                {
+                    "node": node,
+                    "type": info["type"],
+                    "relation": via[node][1],
+                    "direction": via[node][2],
+                    "depth": info["depth"],
+                }
+                for node, info in nodes.items() if node in via
+            ]
 
+        # 1. Find target node
+        target = self._resolve(entity_id)
         if not target:
             return []
 
@@ -46,29 +69,113 @@ class GraphTool:
         # For undirected relationship semantics, we look at both
 
         # Outgoing edges
-        for neighbor in self.graph.successors(target):
-            edge_data = self.graph.get_edge_data(target, neighbor)
+        for neighbor, relation, node_type in self.store.successors(target):
             results.append({
                 "node": neighbor,
-                "type": self.graph.nodes[neighbor].get("type", "unknown"),
-                "relation": edge_data.get("relation", "related_to"),
+                "type": node_type or "unknown",
+                "relation": relation or "related_to",
                 "direction": "out"
             })
 
         # Incoming edges
-        for neighbor in self.graph.predecessors(target):
-            edge_data = self.graph.get_edge_data(neighbor, target)
+        for neighbor, relation, node_type in self.store.predecessors(target):
             results.append({
                 "node": neighbor,
-                "type": self.graph.nodes[neighbor].get("type", "unknown"),
-                "relation": edge_data.get("relation", "related_to"),
+                "type": node_type or "unknown",
+                "relation": relation or "related_to",
                 "direction": "in"
             })
 
         return results
 
+    def _bfs(self, entity_ids: Iterable[str], max_depth: int, relations: Optional[Iterable[str]] = None,
+             direction: str = "both", max_fanout: int = DEFAULT_FANOUT, max_nodes: int = MAX_SUBGRAPH_NODES):
+        """Level-by-level BFS; each level's neighbourhoods are fetched in one batched store query."""
+        seeds: Dict[str, Optional[str]] = {}
+        nodes: Dict[str, Dict[str, Any]] = {}
+        # node -> (node it was reached from, relation, direction)
+        via: Dict[str, Tuple[str, str, str]] = {}
+        edges: Dict[Tuple[str, str], str] = {}
+        truncated = False
+
+        for entity_id in entity_ids:
+            target = self._resolve(entity_id)
+            seeds[entity_id] = target
+            if target and target not in nodes:
+                node_type = (self.store.get_node(target) or {}).get("type", "unknown")
+                nodes[target] = {"id": target, "type": node_type, "depth": 0}
+
+        frontier = list(nodes)
+        for depth in range(1, max(1, min(max_depth, MAX_TRAVERSE_DEPTH)) + 1):
+            if not frontier:
+                break
+            expanded: Counter = Counter()
+            next_frontier = []
+            for node, neighbor, relation, node_type, label in self.store.neighbors_many(frontier, direction, relations):
+                relation = relation or "related_to"
+                key = (node, neighbor) if label == "out" else (neighbor, node)
+                if neighbor in nodes:
+                    # Edge between nodes already in the subgraph
+                    edges.setdefault(key, relation)
+                    continue
+                if expanded[node] >= max_fanout or len(nodes) >= max_nodes:
+                    truncated = True
+                    continue
+                expanded[node] += 1
+                nodes[neighbor] = {"id": neighbor, "type": node_type or "unknown", "depth": depth}
+                via[neighbor] = (node, relation, label)
+                edges.setdefault(key, relation)
+                next_frontier.append(neighbor)
+            frontier = next_frontier
+
+        return seeds, nodes, via, edges, truncated
+
+    def traverse(self, entity_ids: Iterable[str], max_depth: int = 2, relations: Optional[Iterable[str]] = None,
+                 direction: str = "both", max_fanout: int = DEFAULT_FANOUT,
+                 max_nodes: int = MAX_SUBGRAPH_NODES) -> Dict[str, Any]:
+        """
+        Bounded breadth-first walk from several seed entities at once.
+
+        Args:
+            entity_ids: Seed entities, resolved like ``get_related_nodes`` (exact, ``.md``, fuzzy).
+            max_depth: Hops to follow (capped at ``MAX_TRAVERSE_DEPTH``).
+            relations: Only follow edges with these relations (e.g. PARENT_OF, CHILD_OF, MENTIONS).
+            direction: "out", "in" or "both".
+            max_fanout: New neighbours expanded per node; further ones are skipped.
+            max_nodes: Size limit of the returned subgraph.
+
+        Returns:
+            ``{"seeds": {entity: node or None}, "nodes": [{"id", "type", "depth"}],
+            "edges": [[source, relation, target]], "truncated": bool}``
+        """
+        if self.store is None:
+            return {"seeds": {e: None for e in entity_ids}, "nodes": [], "edges": [], "truncated": False}
+        if relations:
+            relations = [r.strip().upper() for r in relations if r and r.strip()]
+        seeds, nodes, _, edges, truncated = self._bfs(entity_ids, max_depth, relations, direction, max_fanout, max_nodes)
+        return {
+            "seeds": seeds,
+            "nodes": list(nodes.values()),
+            "edges": [[src, relation, dst] for (src, dst), relation in edges.items()],
+            "truncated": truncated,
+        }
+
     def find_path(self, start: str, end: str) -> List[str]:
-        try:
-            return nx.shortest_path(self.graph, start, end)
-        except (nx.NetworkXNoPath, nx.NodeNotFound):
+        """Shortest directed path from ``start`` to ``end`` (BFS over the store), or [] if none."""
+        if self.store is None or not self.store.has_node(start) or not self.store.has_node(end):
             return []
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            if node == end:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                return path[::-1]
+            for neighbor, _, _ in self.store.successors(node):
+                if neighbor not in parents:
+                    parents[neighbor] = node
+                    queue.append(neighbor)
+        return []
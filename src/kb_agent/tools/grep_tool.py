@@ -4,7 +4,7 @@ import json
 import os
 import re
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import kb_agent.config as config
 import logging
 
@@ -15,85 +15,124 @@ class GrepTool:
         settings = config.settings
         self.docs_path = settings.index_path if settings else Path(".")
 
-    def search(self, query: str) -> List[Dict[str, Any]]:
+    def _get_index(self):
+        settings = config.settings
+        if not settings or getattr(settings, "grep_index_enabled", True) is False:
+            return None
+        from kb_agent.registry import registry
+        from kb_agent.tools.trigram_index import TrigramIndex
+        root = Path(self.docs_path)
+        return registry.get_or_create(("trigram_index", str(root)), lambda: TrigramIndex(root))
+
+    def search(self, query: str, max_results: Optional[int] = 20) -> List[Dict[str, Any]]:
         """
         Searches for the query string in the docs directory.
-        Tries to use `rg` (ripgrep) if available, otherwise falls back to Python-based search.
+        Uses the trigram index when the pattern has literals it can filter on;
+        otherwise tries `rg` (ripgrep) if available, then a Python-based search.
+
+        At most ``max_results`` passages are returned (None for no limit), and at
+        most ``grep_max_matches_per_file`` matches are considered per file, so
+        broad keywords stop early instead of scanning the whole corpus.
         """
+        settings = config.settings
+        per_file = getattr(settings, "grep_max_matches_per_file", None) if settings else None
+        if not isinstance(per_file, int) or per_file <= 0:
+            per_file = None
+
+        try:
+            index = self._get_index()
+            results = index.search(query, max_results=max_results, max_per_file=per_file) if index is not None else None
+            if results is not None:
+                return results
+        except Exception as e:
+            logger.warning(f"Trigram index search failed: {e}. Falling back to ripgrep.")
+
         if shutil.which("rg"):
              try:
-                 results = self._ripgrep_search(query)
+                 results = self._ripgrep_search(query, max_results=max_results, max_per_file=per_file)
              except Exception as e:
                  logger.warning(f"Ripgrep failed: {e}. Falling back to Python.")
-                 results = self._python_search(query)
+                 results = self._python_search(query, max_results=max_results, max_per_file=per_file)
         else:
              logger.warning("Ripgrep (rg) not found in PATH. Using Python search.")
-             results = self._python_search(query)
+             results = self._python_search(query, max_results=max_results, max_per_file=per_file)
              
         return results
 
-    def _ripgrep_search(self, query: str) -> List[Dict[str, Any]]:
-        # Run rg command with -C 10 (context lines)
-        cmd = ["rg", "--json", "-i", "-C", "10", query, str(self.docs_path)]
-        process = subprocess.run(
+    def _ripgrep_search(self, query: str, max_results: Optional[int] = None, max_per_file: Optional[int] = None) -> List[Dict[str, Any]]:
+        # Run rg command with -C 10 (context lines), streaming its JSON output
+        cmd = ["rg", "--json", "-i", "-C", "10"]
+        if max_per_file:
+            cmd += ["--max-count", str(max_per_file)]
+        cmd += ["-e", query, str(self.docs_path)]
+        process = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             text=True,
-            encoding="utf-8"
+            encoding="utf-8",
+            errors="replace",
         )
 
-        if process.returncode not in [0, 1]:
-             raise Exception(f"Ripgrep error code {process.returncode}")
-
         # Ripgrep with --json and -C groups results in a specific way.
-        # It outputs "begin", "match", "context", "end" event types.
-        # We will manually merge them into contiguous passages.
-        passages: Dict[str, List[Dict[str, Any]]] = {}
-        
-        for line in process.stdout.splitlines():
-            try:
-                data = json.loads(line)
+        # It outputs "begin", "match", "context", "end" event types, and each file's
+        # events arrive contiguously and in line order. Lines are merged into
+        # passages (within 20 lines of each other) as they arrive.
+        results: List[Dict[str, Any]] = []
+        current_path = None
+        current_passage: List[Dict[str, Any]] = []
+        truncated = False
+
+        def _emit():
+            if current_passage:
+                results.append(self._format_passage(current_path, current_passage))
+
+        try:
+            for line in process.stdout:
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
                 evt_type = data.get("type")
-                
-                if evt_type in ["match", "context"]:
-                    path_data = data["data"]["path"]
-                    path = path_data["text"] if isinstance(path_data, dict) else str(path_data)
-                    line_num = data["data"]["line_number"]
-                    lines_data = data["data"]["lines"]
-                    content = lines_data["text"] if isinstance(lines_data, dict) else str(lines_data)
-                    
-                    if path not in passages:
-                        passages[path] = []
-                    
-                    passages[path].append({
+                try:
+                    if evt_type in ["match", "context"]:
+                        path_data = data["data"]["path"]
+                        path = path_data["text"] if isinstance(path_data, dict) else str(path_data)
+                        line_num = data["data"]["line_number"]
+                        lines_data = data["data"]["lines"]
+                        content = lines_data["text"] if isinstance(lines_data, dict) else str(lines_data)
+                    elif evt_type == "end":
+                        path = None
+                    else:
+                        continue
+                except (KeyError, TypeError):
+                    continue
+
+                if path != current_path or (current_passage and line_num - current_passage[-1]["line"] > 20):
+                    _emit()
+                    current_passage = []
+                    current_path = path
+                    if max_results and len(results) >= max_results:
+                        truncated = True
+                        break
+                if path is not None:
+                    current_passage.append({
                         "line": line_num,
                         "content": content,
                         "is_match": evt_type == "match"
                     })
-            except (json.JSONDecodeError, KeyError, TypeError):
-                continue
-                
-        # Merge lines into passages (within 20 lines of each other)
-        results = []
-        for path, lines in passages.items():
-            lines.sort(key=lambda x: x["line"])
-            
-            if not lines:
-                continue
-                
-            current_passage = [lines[0]]
-            
-            for i in range(1, len(lines)):
-                if lines[i]["line"] - current_passage[-1]["line"] <= 20:
-                    current_passage.append(lines[i])
-                else:
-                    results.append(self._format_passage(path, current_passage))
-                    current_passage = [lines[i]]
-                    
-            if current_passage:
-                results.append(self._format_passage(path, current_passage))
-                
-        return results
+            else:
+                _emit()
+        finally:
+            if truncated or process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+
+        if not truncated and returncode not in [0, 1]:
+             raise Exception(f"Ripgrep error code {returncode}")
+
+        return results[:max_results] if max_results else results
 
     def _format_passage(self, path: str, lines: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Format a list of lines into a single passage result."""
@@ -111,7 +150,7 @@ class GrepTool:
             "content": "\n".join(content_lines)
         }
 
-    def _python_search(self, query: str) -> List[Dict[str, Any]]:
+    def _python_search(self, query: str, max_results: Optional[int] = None, max_per_file: Optional[int] = None) -> List[Dict[str, Any]]:
         results = []
         try:
             pattern = re.compile(query, re.IGNORECASE)
@@ -130,6 +169,8 @@ class GrepTool:
                         for i, line in enumerate(all_lines, 1):
                             if pattern.search(line):
                                 matches.append(i)
+                                if max_per_file and len(matches) >= max_per_file:
+                                    break
                                 
                         if not matches:
                             continue
@@ -158,6 +199,8 @@ class GrepTool:
                                 "line": p["match_lines"][0],
                                 "content": content.strip("\n")
                             })
+                        if max_results and len(results) >= max_results:
+                            return results[:max_results]
                     except Exception:
                         continue
         return results
@@ -0,0 +1,86 @@
+"""
+Hybrid retrieval: BM25 (``SparseIndex``) and dense (``VectorTool``) results
+merged with reciprocal rank fusion.
+
+RRF only looks at ranks, so BM25 scores and cosine similarities never have
+to be calibrated against each other:  ``score(d) = sum(1 / (k + rank_i(d)))``
+over every retriever that returned ``d``.
+"""
+
+import concurrent.futures
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+from kb_agent.tools.sparse_index import SparseIndex
+from kb_agent.tools.vector_tool import VectorTool
+
+logger = logging.getLogger("kb_agent")
+
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[tuple]:
+    """Fuse several best-first id lists into ``(id, rrf_score)`` pairs, best first."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+
+class HybridSearchTool:
+    def __init__(self, vector_tool: VectorTool, sparse_index: Optional[SparseIndex], rrf_k: int = RRF_K):
+        self.vector_tool = vector_tool
+        self.sparse_index = sparse_index
+        self.rrf_k = rrf_k
+
+    def _sparse(self, query: str, n_results: int) -> List[str]:
+        if self.sparse_index is None:
+            return []
+        return [chunk_id for chunk_id, _ in self.sparse_index.search(query, n_results=n_results)]
+
+    def search(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
+        """
+        Returns dicts shaped like ``VectorTool.search`` results.  ``score`` is the
+        dense similarity when the vector retriever found the chunk (so grading
+        thresholds keep their meaning) and is omitted for lexical-only hits;
+        ``rrf_score`` and ``retrievers`` describe the fusion.
+        """
+        # Each retriever contributes a deeper list than we return, so items ranked
+        # moderately by both can beat items ranked highly by only one.
+        depth = max(n_results * 2, 10)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            dense_future = pool.submit(self.vector_tool.search, query, depth)
+            sparse_future = pool.submit(self._sparse, query, depth)
+            try:
+                dense = dense_future.result()
+            except Exception as e:
+                logger.warning(f"Dense retrieval failed in hybrid_search: {e}")
+                dense = []
+            try:
+                sparse_ids = sparse_future.result()
+            except Exception as e:
+                logger.warning(f"Sparse retrieval failed in hybrid_search: {e}")
+                sparse_ids = []
+
+        dense_by_id = {item["id"]: item for item in dense}
+        fused = reciprocal_rank_fusion([list(dense_by_id), sparse_ids], k=self.rrf_k)[:n_results]
+
+        # Lexical-only hits: fetch text + metadata from Chroma in one call
+        missing = [doc_id for doc_id, _ in fused if doc_id not in dense_by_id]
+        fetched = self.vector_tool.get_documents(missing) if missing else {}
+
+        sparse_set = set(sparse_ids)
+        results = []
+        for doc_id, rrf_score in fused:
+            if doc_id in dense_by_id:
+                item = dict(dense_by_id[doc_id])
+            elif doc_id in fetched:
+                item = {"id": doc_id, **fetched[doc_id]}
+            else:
+                # In the sparse index but no longer in Chroma
+                continue
+            item["rrf_score"] = rrf_score
+            item["retrievers"] = [name for name, hit in (("dense", doc_id in dense_by_id), ("sparse", doc_id in sparse_set)) if hit]
+            results.append(item)
+        return results
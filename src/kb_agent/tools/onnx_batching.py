@@ -0,0 +1,54 @@
+"""
+Length-bucketed batching for the local ONNX models (``ONNXEmbeddingFunction``
+and the ``ONNXCrossEncoder`` reranker).
+
+Their tokenizers run without padding; inputs are sorted by token length and
+grouped so each batch is padded only to its own longest member, then the
+results are scattered back into input order by the caller.
+"""
+
+from typing import Any, Dict, List, Sequence
+
+
+def length_buckets(lengths: Sequence[int], max_tokens: int = 0, max_rows: int = 0) -> List[List[int]]:
+    """Input indices grouped by ascending token length.
+
+    A bucket is closed before it would exceed ``max_tokens`` padded tokens
+    (rows x longest sequence) or ``max_rows`` rows; limits <= 0 are ignored.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    buckets: List[List[int]] = []
+    current: List[int] = []
+    for idx in order:
+        # Ascending order: the incoming item is the longest, so it sets the padded width
+        if current and ((max_tokens > 0 and (len(current) + 1) * lengths[idx] > max_tokens)
+                        or (max_rows > 0 and len(current) >= max_rows)):
+            buckets.append(current)
+            current = []
+        current.append(idx)
+    if current:
+        buckets.append(current)
+    return buckets
+
+
+def padded_inputs(encoded: Sequence[Any], bucket: Sequence[int], input_names: Sequence[str]) -> Dict[str, Any]:
+    """ONNX inputs for ``encoded[i]`` (tokenizer encodings) of every ``i`` in ``bucket``, zero-padded.
+
+    Only the tensors the model declares in ``input_names`` are returned.
+    """
+    import numpy as np
+
+    max_len = max(len(encoded[i].ids) for i in bucket)
+    input_ids = np.zeros((len(bucket), max_len), dtype=np.int64)
+    attention_mask = np.zeros((len(bucket), max_len), dtype=np.int64)
+    token_type_ids = np.zeros((len(bucket), max_len), dtype=np.int64)
+    for row, i in enumerate(bucket):
+        enc = encoded[i]
+        n = len(enc.ids)
+        input_ids[row, :n] = enc.ids
+        attention_mask[row, :n] = enc.attention_mask
+        if getattr(enc, "type_ids", None):
+            token_type_ids[row, :n] = enc.type_ids
+
+    inputs = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+    return {name: tensor for name, tensor in inputs.items() if name in input_names}
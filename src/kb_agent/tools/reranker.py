@@ -1,68 +1,401 @@
 import asyncio
+import hashlib
 import os
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 
-from kb_agent.config import settings, get_project_root
+import kb_agent.config as config
+from kb_agent.config import get_project_root
+from kb_agent.tools.onnx_batching import length_buckets, padded_inputs
 
 logger = logging.getLogger(__name__)
 
+# Token budget reserved per query–chunk pair when sizing the llama.cpp batch
+TOKENS_PER_PAIR = 512
+
+
+def llama_kwargs(batch_size: int) -> Dict[str, Any]:
+    """Context/batch sizes that let ``batch_size`` pairs be scored in one evaluation.
+
+    The reranker is a non-causal model with RANK pooling, so every sequence in
+    a batch must fit in a single micro-batch: ``n_ubatch`` has to match ``n_batch``.
+    """
+    n_tokens = max(2048, TOKENS_PER_PAIR * max(1, batch_size))
+    return {
+        "embedding": True,
+        "pooling_type": 4,  # LLAMA_POOLING_TYPE_RANK
+        "verbose": False,
+        "n_ctx": n_tokens,
+        "n_batch": n_tokens,
+        "n_ubatch": n_tokens,
+    }
+
+
+def rerank_prompt(query: str, content: str) -> str:
+    # Assuming BGE-M3 cross-encoder format: <s>query</s></s>text</s>
+    return f"<s>{query}</s></s>{content}</s>"
+
+
+def normalize_query(query: str) -> str:
+    """Case/width/whitespace-insensitive form of a query, so rephrasings that only differ cosmetically share scores."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def lexical_overlap(query_terms: set, content: str) -> float:
+    """Fraction of the query's terms that occur in ``content`` (0..1)."""
+    from kb_agent.tools.sparse_index import tokenize
+
+    if not query_terms:
+        return 0.0
+    return len(query_terms & set(tokenize(content))) / len(query_terms)
+
+
+def first_stage_scores(query: str, chunks: List[Dict[str, Any]]) -> List[float]:
+    """
+    Cheap relevance estimate used to prune the pool before cross-encoding.
+
+    Averages the retriever's cosine similarity (``chunk["score"]``, when the
+    chunk came from vector/hybrid search) with query-term overlap.  Chunks
+    without a similarity (grep, file reads) use the overlap for both halves.
+    """
+    from kb_agent.tools.sparse_index import tokenize
+
+    query_terms = set(tokenize(query))
+    scores = []
+    for chunk in chunks:
+        overlap = lexical_overlap(query_terms, chunk.get("content", ""))
+        similarity = chunk.get("score")
+        if not isinstance(similarity, (int, float)):
+            similarity = overlap
+        scores.append(0.5 * float(similarity) + 0.5 * overlap)
+    return scores
+
+
+class ScoreCache:
+    """
+    Bounded LRU of cross-encoder scores keyed by (normalized query, chunk text hash).
+
+    The agent loop re-retrieves many of the same chunks across iterations and
+    follow-up turns; only chunks that weren't scored for this query before
+    need to go through the model.
+    """
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, query: str, content: str) -> Tuple[str, str, str]:
+        digest = hashlib.blake2b(content.encode("utf-8", errors="ignore"), digest_size=16).hexdigest()
+        return model, normalize_query(query), digest
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._entries.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, key: Tuple[str, str, str], score: float):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = score
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class ONNXCrossEncoder:
+    """
+    Cross-encoder reranker exported to ONNX (e.g. bge-reranker-v2-m3), loaded from
+    a local directory the same way ``ONNXEmbeddingFunction`` loads the embedder.
+    Query/chunk pairs are tokenized together with truncation and scored in
+    padded batches; the single output logit per pair is the relevance score.
+    """
+    def __init__(self, model_dir: str, max_length: int = 512):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, "model.onnx")
+        if not os.path.exists(model_path):
+            model_path = os.path.join(model_dir, "onnx", "model.onnx")
+        tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+        if not os.path.exists(model_path) or not os.path.exists(tokenizer_path):
+            raise FileNotFoundError(f"Model ({model_path}) or Tokenizer ({tokenizer_path}) not found in {model_dir}")
+
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = 4
+        self.session = ort.InferenceSession(model_path, sess_options=sess_options, providers=['CPUExecutionProvider'])
+        self.valid_input_names = [i.name for i in self.session.get_inputs()]
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length, strategy="longest_first")
+        self.tokenizer.no_padding()
+
+    def score(self, query: str, texts: List[str], batch_size: int = 16) -> List[float]:
+        import numpy as np
+
+        if not texts:
+            return []
+        encoded = self.tokenizer.encode_batch([(query, text) for text in texts])
+        lengths = [len(enc.ids) for enc in encoded]
+        scores = np.empty(len(texts), dtype=np.float32)
+        # Similar lengths share a batch, so little compute goes to padding
+        for bucket in length_buckets(lengths, max_rows=max(1, batch_size)):
+            logits = self.session.run(None, padded_inputs(encoded, bucket, self.valid_input_names))[0]
+            scores[bucket] = np.asarray(logits, dtype=np.float32).reshape(len(bucket), -1)[:, 0]
+        return scores.tolist()
+
+
 class RerankClient:
     def __init__(self):
         self.llm: Any = None
+        self.cross_encoder: Optional[ONNXCrossEncoder] = None
         self._load_task: Optional[asyncio.Task] = None
         self._lock = asyncio.Lock()
-        
+        # Cleared if the loaded llama.cpp build can't evaluate several sequences at once
+        self._batching = True
+        # (backend, model path) of the loaded model, see configured_model
+        self._loaded_model: Optional[Tuple[str, str]] = None
+        self.score_cache = ScoreCache(self.cache_size)
+        # (hits, misses) of the last score() call in this thread, for debug output
+        self._last_call = threading.local()
+
+    @property
+    def batch_size(self) -> int:
+        settings = config.settings
+        size = getattr(settings, "rerank_batch_size", None) if settings else None
+        return size if isinstance(size, int) and size > 0 else 8
+
+    @property
+    def cache_size(self) -> int:
+        settings = config.settings
+        size = getattr(settings, "rerank_cache_size", None) if settings else None
+        return size if isinstance(size, int) and size >= 0 else 2048
+
+    @property
+    def last_call_stats(self) -> Tuple[int, int]:
+        """(cache hits, cache misses) of the most recent ``score`` call made by this thread."""
+        return getattr(self._last_call, "stats", (0, 0))
+
+    @property
+    def backend(self) -> str:
+        settings = config.settings
+        backend = getattr(settings, "reranker_backend", None) if settings else None
+        return backend if backend == "onnx" else "llama_cpp"
+
+    def configured_model(self) -> Tuple[str, str]:
+        """(backend, resolved model path) selected by the current settings."""
+        settings = config.settings
+        backend = self.backend
+        path = getattr(settings, "reranker_onnx_path" if backend == "onnx" else "reranker_model_path", None) if settings else None
+        return backend, self._resolve_path(path) if path else ""
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.llm is not None or self.cross_encoder is not None
+
+    @staticmethod
+    def _is_enabled() -> bool:
+        settings = config.settings
+        if not settings or not settings.use_reranker:
+            return False
+        if getattr(settings, "reranker_backend", None) == "onnx":
+            return bool(getattr(settings, "reranker_onnx_path", None))
+        return bool(settings.reranker_model_path)
+
     async def initialize(self):
         """Asynchronously initialize the reranker model if enabled."""
-        if not settings.use_reranker or not settings.reranker_model_path:
+        if not self._is_enabled():
             logger.info("Reranker is disabled or model path is not set.")
             return
 
         async with self._lock:
-            if self._load_task is None and self.llm is None:
+            if self._load_task is None and not self.is_loaded:
                 self._load_task = asyncio.create_task(self._load_model())
 
-    async def _load_model(self):
+    def _resolve_path(self, path) -> str:
+        model_path = os.path.expanduser(str(path))
+        if not os.path.isabs(model_path):
+            model_path = os.path.join(str(get_project_root()), model_path)
+        return model_path
+
+    def _create_cross_encoder(self) -> Optional[ONNXCrossEncoder]:
+        """Load the ONNX cross-encoder (blocking). Returns None if it is unavailable."""
+        model_dir = self._resolve_path(config.settings.reranker_onnx_path)
+        try:
+            logger.info(f"Loading ONNX reranker from {model_dir}...")
+            model = ONNXCrossEncoder(model_dir)
+            logger.info("ONNX reranker loaded successfully.")
+            return model
+        except Exception as e:
+            logger.error(f"Failed to load ONNX reranker from {model_dir}: {e}")
+            return None
+
+    def _load_backend(self):
+        configured = self.configured_model()
+        if self.is_loaded and self._loaded_model != configured:
+            # Backend or model path changed in /settings: drop the old model first
+            self.close()
+        if self.backend == "onnx":
+            self.cross_encoder = self.cross_encoder or self._create_cross_encoder()
+        elif self.llm is None:
+            self.llm = self._create_llama()
+        self._loaded_model = configured if self.is_loaded else None
+
+    def _create_llama(self):
+        """Load the GGUF reranker (blocking). Returns None if it is unavailable."""
         try:
             from llama_cpp import Llama
-            
-            model_path_str = str(settings.reranker_model_path)
-            model_path = os.path.expanduser(model_path_str)
-            if not os.path.isabs(model_path):
-                model_path = os.path.join(str(get_project_root()), model_path)
-                
+
+            model_path = self._resolve_path(config.settings.reranker_model_path)
+
             if not os.path.exists(model_path):
                 logger.error(f"Reranker model not found at {model_path}")
-                return
+                return None
 
             logger.info(f"Loading reranker model from {model_path}...")
-            
-            loop = asyncio.get_running_loop()
-            
+
             # Use pooling_type=4 (LLAMA_POOLING_TYPE_RANK) and embedding=True to get sequence scores
-            def create_llama():
-                return Llama(
-                    model_path=model_path,
-                    embedding=True,
-                    pooling_type=4,
-                    verbose=False,
-                    n_ctx=2048, # Sufficient context for query + chunk
-                )
-
-            self.llm = await loop.run_in_executor(None, create_llama)
+            llm = Llama(model_path=model_path, **llama_kwargs(self.batch_size))
             logger.info("Reranker model loaded successfully.")
-            
+            return llm
+
         except ImportError:
             logger.error("llama-cpp-python is not installed. Please install it to use the reranker.")
         except Exception as e:
             logger.error(f"Failed to load reranker model: {e}")
+        return None
+
+    async def _load_model(self):
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._load_backend)
         finally:
             self._load_task = None
 
+    def load_sync(self):
+        """Load the model in the calling thread if the reranker is enabled and not loaded yet."""
+        if self._is_enabled():
+            self._load_backend()
+
+    def close(self):
+        """Free the llama.cpp context / ONNX session."""
+        self.score_cache.clear()
+        self.cross_encoder = None
+        llm, self.llm = self.llm, None
+        if llm is not None and hasattr(llm, "close"):
+            llm.close()
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+
+    def _score_one(self, prompt: str) -> float:
+        try:
+            res = self.llm.create_embedding(prompt)
+            # The score is the first float in the embedding array when using pooling_type=RANK
+            return float(res["data"][0]["embedding"][0])
+        except Exception as e:
+            logger.error(f"Error reranking chunk: {e}")
+            return -999.0
+
+    def _score_batch(self, prompts: List[str]) -> List[float]:
+        """Score several pairs in one llama.cpp evaluation (one sequence per pair)."""
+        res = self.llm.create_embedding(prompts)
+        data = sorted(res["data"], key=lambda d: d.get("index", 0))
+        if len(data) != len(prompts):
+            raise ValueError(f"expected {len(prompts)} scores, got {len(data)}")
+        return [float(d["embedding"][0]) for d in data]
+
+    def _model_key(self) -> str:
+        settings = config.settings
+        if self.cross_encoder is not None:
+            return f"onnx:{getattr(settings, 'reranker_onnx_path', '')}"
+        return f"llama_cpp:{getattr(settings, 'reranker_model_path', '')}"
+
+    def score(self, query: str, chunks: List[Dict[str, Any]], batch_size: Optional[int] = None) -> List[float]:
+        """Cross-encoder scores for ``chunks`` in input order (blocking).
+
+        Scores already in the cache for this query are reused; only the rest
+        are sent to the model.  Failed scores (-999) are not cached.
+        """
+        self.score_cache.max_entries = self.cache_size
+        model = self._model_key()
+        keys = [ScoreCache.key(model, query, chunk.get("content", "")) for chunk in chunks]
+        scores: List[Optional[float]] = [self.score_cache.get(key) for key in keys]
+        missing = [i for i, s in enumerate(scores) if s is None]
+        self._last_call.stats = (len(chunks) - len(missing), len(missing))
+        if missing:
+            fresh = self._score_uncached(query, [chunks[i] for i in missing], batch_size)
+            for i, s in zip(missing, fresh):
+                scores[i] = s
+                if s != -999.0:
+                    self.score_cache.put(keys[i], s)
+        return scores
+
+    def _score_uncached(self, query: str, chunks: List[Dict[str, Any]], batch_size: Optional[int] = None) -> List[float]:
+        batch_size = batch_size or self.batch_size
+        if self.cross_encoder is not None:
+            try:
+                return self.cross_encoder.score(query, [chunk.get("content", "") for chunk in chunks], batch_size)
+            except Exception as e:
+                logger.error(f"Error reranking chunks with ONNX cross-encoder: {e}")
+                return [-999.0] * len(chunks)
+
+        prompts = [rerank_prompt(query, chunk.get("content", "")) for chunk in chunks]
+        if batch_size > 1 and self._batching and len(prompts) > 1:
+            try:
+                scores: List[float] = []
+                for start in range(0, len(prompts), batch_size):
+                    scores.extend(self._score_batch(prompts[start:start + batch_size]))
+                return scores
+            except Exception as e:
+                logger.warning(f"Batched reranking failed ({e}); falling back to per-chunk scoring.")
+                self._batching = False
+        return [self._score_one(p) for p in prompts]
+
+    @staticmethod
+    def _top_n(chunks: List[Dict[str, Any]], scores: List[float], top_n: int) -> List[Dict[str, Any]]:
+        scored_chunks = []
+        for chunk, score in zip(chunks, scores):
+            chunk_copy = chunk.copy()
+            chunk_copy["rerank_score"] = score
+            scored_chunks.append(chunk_copy)
+        # Sort chunks by rerank_score descending
+        scored_chunks.sort(key=lambda x: x.get("rerank_score", -999.0), reverse=True)
+        return scored_chunks[:top_n]
+
     async def rerank(self, query: str, chunks: List[Dict[str, Any]], top_n: int = 3) -> List[Dict[str, Any]]:
         """Rerank a list of chunks based on a query."""
-        if not settings.use_reranker:
+        settings = config.settings
+        if not settings or not settings.use_reranker:
             logger.debug("Reranker is disabled, returning original top_n chunks.")
             return chunks[:top_n]
 
@@ -70,75 +403,67 @@ class RerankClient:
             logger.debug("Waiting for reranker model to finish loading...")
             await self._load_task
 
-        if self.llm is None:
+        if not self.is_loaded:
             logger.warning("Reranker model is not loaded, returning original top_n chunks.")
             return chunks[:top_n]
 
         logger.info(f"Reranking {len(chunks)} chunks...")
-        scored_chunks = []
-        
         loop = asyncio.get_running_loop()
-        
-        for chunk in chunks:
-            content = chunk.get("content", "")
-            # Assuming BGE-M3 cross-encoder format: <s>query</s></s>text</s>
-            prompt = f"<s>{query}</s></s>{content}</s>"
-            
-            try:
-                # Use a wrapper to avoid lambda issues with run_in_executor typing in some environments
-                def get_embed():
-                    return self.llm.create_embedding(prompt)
-
-                res = await loop.run_in_executor(None, get_embed)
-                
-                # The score is the first float in the embedding array when using pooling_type=RANK
-                score = res["data"][0]["embedding"][0]
-                
-                chunk_copy = chunk.copy()
-                chunk_copy["rerank_score"] = float(score)
-                scored_chunks.append(chunk_copy)
-            except Exception as e:
-                logger.error(f"Error reranking chunk: {e}")
-                chunk_copy = chunk.copy()
-                chunk_copy["rerank_score"] = -999.0
-                scored_chunks.append(chunk_copy)
-                
-        # Sort chunks by rerank_score descending
-        scored_chunks.sort(key=lambda x: x.get("rerank_score", -999.0), reverse=True)
-        
-        return scored_chunks[:top_n]
+        scores = await loop.run_in_executor(None, self.score, query, chunks)
+        return self._top_n(chunks, scores, top_n)
 
     def rerank_sync(self, query: str, chunks: List[Dict[str, Any]], top_n: int = 3) -> List[Dict[str, Any]]:
         """Synchronously rerank a list of chunks based on a query."""
-        if not settings.use_reranker:
+        settings = config.settings
+        if not settings or not settings.use_reranker:
             logger.debug("Reranker is disabled, returning original top_n chunks.")
             return chunks[:top_n]
 
-        if self.llm is None:
+        if not self.is_loaded:
             logger.warning("Reranker model is not loaded, returning original top_n chunks.")
             return chunks[:top_n]
 
         logger.info(f"[Sync] Reranking {len(chunks)} chunks...")
-        scored_chunks = []
-        
-        for chunk in chunks:
-            content = chunk.get("content", "")
-            prompt = f"<s>{query}</s></s>{content}</s>"
-            
-            try:
-                res = self.llm.create_embedding(prompt)
-                score = res["data"][0]["embedding"][0]
-                chunk_copy = chunk.copy()
-                chunk_copy["rerank_score"] = float(score)
-                scored_chunks.append(chunk_copy)
-            except Exception as e:
-                logger.error(f"Error reranking chunk: {e}")
-                chunk_copy = chunk.copy()
-                chunk_copy["rerank_score"] = -999.0
-                scored_chunks.append(chunk_copy)
-                
-        scored_chunks.sort(key=lambda x: x.get("rerank_score", -999.0), reverse=True)
-        return scored_chunks[:top_n]
+        return self._top_n(chunks, self.score(query, chunks), top_n)
+
+    def rerank_cascade_sync(
+        self,
+        query: str,
+        chunks: List[Dict[str, Any]],
+        top_n: int = 3,
+        first_stage_k: int = 0,
+        early_exit_margin: float = 0.0,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Two-stage rerank: ``first_stage_scores`` keeps the best ``first_stage_k``
+        chunks and only those are cross-encoded.  When ``early_exit_margin`` > 0
+        and the first stage already separates the top ``top_n`` from the rest
+        by at least that margin, the cross-encoder is skipped.
+
+        Returns the top chunks and per-stage stats (timings in ms) for the audit log.
+        """
+        stats: Dict[str, Any] = {"candidates": len(chunks), "first_stage_kept": len(chunks), "early_exit": False}
+        # An early exit or an unloaded model never reaches score(); don't report the previous call
+        self._last_call.stats = (0, 0)
+        survivors = chunks
+        if first_stage_k > 0 and len(chunks) > max(first_stage_k, top_n):
+            start = time.perf_counter()
+            cheap = first_stage_scores(query, chunks)
+            order = sorted(range(len(chunks)), key=lambda i: cheap[i], reverse=True)
+            stats["first_stage_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+            keep = max(first_stage_k, top_n)
+            survivors = [chunks[i] for i in order[:keep]]
+            stats["first_stage_kept"] = len(survivors)
+            if early_exit_margin > 0 and top_n > 0 and cheap[order[top_n - 1]] - cheap[order[top_n]] >= early_exit_margin:
+                stats["early_exit"] = True
+                return [dict(chunks[i], first_stage_score=cheap[i]) for i in order[:top_n]], stats
+
+        start = time.perf_counter()
+        top = self.rerank_sync(query, survivors, top_n=top_n)
+        stats["cross_encoder_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        stats["cache_hits"], stats["cache_misses"] = self.last_call_stats
+        return top, stats
 
 # Global instance
 reranker_client = RerankClient()
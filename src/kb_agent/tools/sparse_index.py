@@ -0,0 +1,252 @@
+"""
+Persistent BM25 index over the same chunks that go into the Chroma collection.
+
+Embeddings are weak at exact identifiers (config keys, error codes, class
+names, ticket numbers); a lexical index catches those.  Postings live in a
+SQLite file next to the index manifest, so nothing is rebuilt from chunk
+texts at startup and a query only touches the posting lists of its own
+terms.  ``Processor`` replaces a document's postings whenever it re-indexes
+that document.
+
+Only ids, lengths and term frequencies are stored; chunk texts and metadata
+are fetched from Chroma for the hits that are actually returned.
+
+(``rank-bm25`` is deliberately not used here: it keeps the whole tokenized
+corpus in memory and has to be rebuilt from scratch on every start.)
+"""
+
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("kb_agent")
+
+SPARSE_INDEX_FILENAME = ".sparse_index.db"
+
+# BM25 parameters (Robertson / Lucene defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS chunks (
+        id INTEGER PRIMARY KEY,
+        chunk_id TEXT NOT NULL UNIQUE,
+        doc_id TEXT NOT NULL,
+        length INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_chunks_doc ON chunks(doc_id)",
+    """
+    CREATE TABLE IF NOT EXISTS postings (
+        term TEXT NOT NULL,
+        chunk INTEGER NOT NULL,
+        tf INTEGER NOT NULL,
+        PRIMARY KEY (term, chunk)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk)",
+    # Corpus statistics BM25 needs on every query (chunk count, total length), kept
+    # current by triggers so no write path can forget them
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    """
+    CREATE TRIGGER IF NOT EXISTS chunks_counted AFTER INSERT ON chunks BEGIN
+        UPDATE meta SET value = value + 1 WHERE key = 'n_chunks';
+        UPDATE meta SET value = value + NEW.length WHERE key = 'total_length';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chunks_uncounted AFTER DELETE ON chunks BEGIN
+        UPDATE meta SET value = value - 1 WHERE key = 'n_chunks';
+        UPDATE meta SET value = value - OLD.length WHERE key = 'total_length';
+    END
+    """,
+]
+
+# Identifiers: words joined by . _ - / : (e.g. db.pool.max_size, ERR-1042, api/v2/users)
+_IDENT_RE = re.compile(r"[0-9a-z]+(?:[._\-/:][0-9a-z]+)*")
+_PART_RE = re.compile(r"[0-9a-z]+")
+_CJK_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms: whole identifiers, their parts, and CJK character bigrams.
+
+    Keeping both ``max_pool_size`` and ``max``/``pool``/``size`` lets an exact
+    identifier match outrank chunks that merely mention the same words.
+    """
+    text = text.lower()
+    tokens: List[str] = []
+    for m in _IDENT_RE.finditer(text):
+        ident = m.group(0)
+        tokens.append(ident)
+        parts = _PART_RE.findall(ident)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    for m in _CJK_RE.finditer(text):
+        run = m.group(0)
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class SparseIndex:
+    """SQLite-backed BM25 inverted index, updated one document at a time."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            self._conn.execute(stmt)
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'n_chunks'").fetchone() is None:
+            # Index created before the statistics were stored
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) "
+                "SELECT 'n_chunks', COUNT(*) FROM chunks UNION ALL "
+                "SELECT 'total_length', COALESCE(SUM(length), 0) FROM chunks"
+            )
+        self._conn.commit()
+
+    def replace_document(self, doc_id: str, chunk_ids: Sequence[str], texts: Sequence[str]):
+        """Drop ``doc_id``'s previous chunks and index the given ones in a single transaction."""
+        with self._lock:
+            try:
+                self._delete_locked(doc_id)
+                self._insert_locked(doc_id, chunk_ids, texts)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def add_chunks(self, doc_id: str, chunk_ids: Sequence[str], texts: Sequence[str]):
+        """Index more chunks under ``doc_id``, keeping the ones it already has."""
+        with self._lock:
+            try:
+                self._insert_locked(doc_id, chunk_ids, texts)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def rename_document(self, old_doc_id: str, new_doc_id: str):
+        """Replace ``new_doc_id``'s chunks with those indexed under ``old_doc_id``, in one transaction.
+
+        Lets a document too large to hold in memory be indexed in parts under a
+        temporary id and swapped in once it is complete.
+        """
+        with self._lock:
+            try:
+                self._delete_locked(new_doc_id)
+                self._conn.execute("UPDATE chunks SET doc_id = ? WHERE doc_id = ?", (new_doc_id, old_doc_id))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def _insert_locked(self, doc_id: str, chunk_ids: Sequence[str], texts: Sequence[str]):
+        for chunk_id, text in zip(chunk_ids, texts):
+            terms = tokenize(text)
+            # A chunk id may have belonged to another document before
+            self._conn.execute(
+                "DELETE FROM postings WHERE chunk IN (SELECT id FROM chunks WHERE chunk_id = ?)", (chunk_id,)
+            )
+            self._conn.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id,))
+            cur = self._conn.execute(
+                "INSERT INTO chunks (chunk_id, doc_id, length) VALUES (?, ?, ?)",
+                (chunk_id, doc_id, len(terms)),
+            )
+            rowid = cur.lastrowid
+            self._conn.executemany(
+                "INSERT INTO postings (term, chunk, tf) VALUES (?, ?, ?)",
+                [(term, rowid, tf) for term, tf in Counter(terms).items()],
+            )
+
+    def remove_document(self, doc_id: str):
+        with self._lock:
+            self._delete_locked(doc_id)
+            self._conn.commit()
+
+    def _delete_locked(self, doc_id: str):
+        self._conn.execute(
+            "DELETE FROM postings WHERE chunk IN (SELECT id FROM chunks WHERE doc_id = ?)", (doc_id,)
+        )
+        self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+
+    def has_document(self, doc_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM chunks WHERE doc_id = ? LIMIT 1", (doc_id,)).fetchone() is not None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._stats_locked()[0]
+
+    def _stats_locked(self) -> Tuple[int, int]:
+        stats = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        return stats.get("n_chunks", 0), stats.get("total_length", 0)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """Return ``(chunk_id, bm25_score)`` pairs, best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n_chunks, total_len = self._stats_locked()
+            if not n_chunks:
+                return []
+            avg_len = total_len / n_chunks or 1.0
+
+            placeholders = ",".join("?" * len(terms))
+            df: Dict[str, int] = dict(self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ).fetchall())
+            if not df:
+                return []
+            params: Dict[str, object] = {"k1": BM25_K1, "b": BM25_B, "avg_len": avg_len, "limit": n_results}
+            for i, (term, freq) in enumerate(df.items()):
+                params[f"t{i}"] = term
+                params[f"idf{i}"] = math.log(1.0 + (n_chunks - freq + 0.5) / (freq + 0.5))
+            values = ",".join(f"(:t{i}, :idf{i})" for i in range(len(df)))
+
+            # Score every matching chunk in one aggregate; CROSS JOIN makes SQLite walk
+            # the query terms first and read only their posting lists
+            return self._conn.execute(
+                f"""
+                WITH q(term, idf) AS (VALUES {values})
+                SELECT c.chunk_id,
+                       SUM(q.idf * p.tf * (:k1 + 1) / (p.tf + :k1 * (1 - :b + :b * c.length / :avg_len))) AS score
+                FROM q CROSS JOIN postings p ON p.term = q.term
+                JOIN chunks c ON c.id = p.chunk
+                GROUP BY p.chunk
+                ORDER BY score DESC, p.chunk
+                LIMIT :limit
+                """,
+                params,
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def default_index_path(settings) -> Optional[Path]:
+    if settings is None or not getattr(settings, "index_path", None):
+        return None
+    return Path(settings.index_path) / SPARSE_INDEX_FILENAME
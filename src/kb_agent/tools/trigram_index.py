@@ -0,0 +1,420 @@
+"""
+Trigram index over the Markdown files in ``index_path`` for ``grep_search``.
+
+For every file we store the set of case-folded character trigrams it
+contains (``fold_case``).  A search pattern is reduced to the literal
+substrings any match must contain; only files holding all of their trigrams
+are opened and verified line by line with Python's ``re``.
+
+The index is refreshed incrementally.  A routine refresh only stats the
+directories it knows and rescans those whose mtime changed (files added,
+removed or renamed); files are re-read when their size/mtime changed.  Edits
+that rewrite a file in place leave its directory's mtime alone, so every
+``full_rescan_interval`` -- and on ``refresh(force=True)``, which indexing
+runs -- the whole tree is walked instead.
+
+Patterns with no ASCII literal of three or more characters, or with
+alternation / groups (where "required literal" analysis would need a real
+regex parser), are not accelerated: ``search`` returns None and the caller
+falls back to rg.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("kb_agent")
+
+GREP_INDEX_FILENAME = ".grep_index.db"
+
+# Same passage shape as `rg -C 10` + GrepTool's merge of lines within 20 of each other
+CONTEXT_LINES = 10
+MERGE_GAP = 20
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS trigrams (
+        tri INTEGER NOT NULL,
+        file INTEGER NOT NULL,
+        PRIMARY KEY (tri, file)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_trigrams_file ON trigrams(file)",
+    """
+    CREATE TABLE IF NOT EXISTS dirs (
+        path TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL
+    )
+    """,
+]
+
+# Bumped when the stored trigrams change meaning; older indexes are rebuilt
+_SCHEMA_VERSION = 1
+
+_QUANTIFIERS = set("*+?{")
+# Escapes that stand for a literal character
+_LITERAL_ESCAPES = set(".^$*+?{}[]()|\\/-#&~ \"'`!@%=:;,<>")
+
+
+def _pack(tri: str) -> int:
+    """Encode a 3-character string as one integer key (21 bits per code point)."""
+    return (ord(tri[0]) << 42) | (ord(tri[1]) << 21) | ord(tri[2])
+
+
+# Non-ASCII letters that ``re.IGNORECASE`` matches to an ASCII letter but whose
+# lower() is not that letter (the Kelvin sign already lowercases to "k")
+_FOLD = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s"})
+
+
+def fold_case(text: str) -> str:
+    """
+    Lowercase ``text`` one character per character.
+
+    For ASCII patterns this agrees with ``re.IGNORECASE``: every character the
+    regex would match to an ASCII letter folds to that letter.  ("İ".lower() is
+    two characters and would shift every trigram after it.)
+    """
+    return text.translate(_FOLD).lower()
+
+
+def trigrams(text: str) -> Set[int]:
+    text = fold_case(text)
+    return {_pack(text[i:i + 3]) for i in range(len(text) - 2)}
+
+
+def required_literals(pattern: str) -> Optional[List[str]]:
+    """Literal substrings every match of ``pattern`` must contain.
+
+    Returns None when the pattern uses alternation or groups; the list may be
+    empty (e.g. ``\\d+``) when nothing literal is required.
+    """
+    literals: List[str] = []
+    run: List[str] = []
+
+    def _end_run():
+        if run:
+            literals.append("".join(run))
+            run.clear()
+
+    i = 0
+    n = len(pattern)
+    while i < n:
+        ch = pattern[i]
+        if ch in "|()":
+            return None
+        if ch == "\\":
+            if i + 1 >= n:
+                return None
+            nxt = pattern[i + 1]
+            if nxt in _LITERAL_ESCAPES:
+                run.append(nxt)
+            else:
+                # \d, \w, \s, \b, backrefs, ... – not a literal
+                _end_run()
+            i += 2
+        elif ch == "[":
+            _end_run()
+            # Skip the character class (a leading ']' or '^]' is part of the class)
+            j = i + 1
+            if j < n and pattern[j] == "^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 2 if pattern[j] == "\\" else 1
+            i = j + 1
+        elif ch in _QUANTIFIERS:
+            # The preceding character may repeat ('+') or vanish ('*', '?', '{0,}'):
+            # either way it can't be part of a contiguous literal with what follows.
+            if ch != "+" and run:
+                run.pop()
+            _end_run()
+            if ch == "{":
+                close = pattern.find("}", i)
+                i = close + 1 if close != -1 else n
+            else:
+                i += 1
+            # Lazy / possessive suffix
+            if i < n and pattern[i] in "?+":
+                i += 1
+        elif ch in ".^$":
+            _end_run()
+            i += 1
+        else:
+            run.append(ch)
+            i += 1
+    _end_run()
+    return literals
+
+
+def _split_lines(text: str) -> List[str]:
+    # Split on "\n" only, like rg's line numbering; a trailing newline doesn't start a new line
+    lines = text.split("\n")
+    if lines and lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+def passages_for_file(path: str, lines: List[str], match_lines: List[int]) -> List[Dict]:
+    """Build ``GrepTool``-style passages: ±10 lines of context, merging lines within 20 of each other."""
+    shown: Set[int] = set()
+    for m in match_lines:
+        shown.update(range(max(1, m - CONTEXT_LINES), min(len(lines), m + CONTEXT_LINES) + 1))
+    ordered = sorted(shown)
+    matches = set(match_lines)
+
+    results = []
+    group: List[int] = []
+    for ln in ordered:
+        if group and ln - group[-1] > MERGE_GAP:
+            results.append(_format(path, lines, group, matches))
+            group = []
+        group.append(ln)
+    if group:
+        results.append(_format(path, lines, group, matches))
+    return results
+
+
+def _format(path: str, lines: List[str], group: List[int], matches: Set[int]) -> Dict:
+    first_match = next((ln for ln in group if ln in matches), group[0])
+    return {
+        "file_path": path,
+        "line": first_match,
+        "content": "\n".join(lines[ln - 1] for ln in group),
+    }
+
+
+class TrigramIndex:
+    """SQLite trigram → file posting lists, refreshed from the filesystem on demand."""
+
+    def __init__(self, root: Path, db_path: Optional[Path] = None, refresh_interval: float = 2.0,
+                 full_rescan_interval: float = 60.0):
+        self.root = Path(root)
+        self.db_path = Path(db_path) if db_path else self.root / GREP_INDEX_FILENAME
+        self.refresh_interval = refresh_interval
+        self.full_rescan_interval = full_rescan_interval
+        self._last_refresh = 0.0
+        self._last_full_refresh: Optional[float] = None
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            self._conn.execute(stmt)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+            for table in ("trigrams", "files", "dirs"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        self._conn.commit()
+
+    def refresh(self, force: bool = False) -> int:
+        """Re-index new/changed files and drop deleted ones. Returns the number of files (re)indexed."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_refresh < self.refresh_interval:
+                return 0
+            full = (force or self._last_full_refresh is None
+                    or now - self._last_full_refresh >= self.full_rescan_interval)
+            try:
+                changed = None if full else self._changed_dirs_locked()
+                if changed is None:
+                    updated = self._scan_locked([str(self.root)], recursive=True)
+                    self._last_full_refresh = now
+                else:
+                    updated = self._scan_locked(changed, recursive=False)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._last_refresh = time.monotonic()
+            if updated:
+                logger.debug(f"Trigram index: re-indexed {updated} file(s) under {self.root}")
+            return updated
+
+    def _changed_dirs_locked(self) -> Optional[List[str]]:
+        """Known directories whose entries changed since they were scanned (None: nothing known yet)."""
+        known = self._conn.execute("SELECT path, mtime_ns FROM dirs").fetchall()
+        if not known:
+            return None
+        changed = []
+        for path, mtime_ns in known:
+            try:
+                if os.stat(path).st_mtime_ns == mtime_ns:
+                    continue
+            except OSError:
+                pass
+            changed.append(path)
+        return changed
+
+    def _scan_locked(self, start_dirs: List[str], recursive: bool) -> int:
+        """
+        Sync the files directly inside ``start_dirs`` with the index.  Subdirectories
+        are descended into if ``recursive`` or if they are new; known ones are
+        checked by ``_changed_dirs_locked`` on their own.
+        """
+        known_dirs = {row[0] for row in self._conn.execute("SELECT path FROM dirs")}
+        updated = 0
+        stack = list(start_dirs)
+        while stack:
+            path = stack.pop()
+            try:
+                # Stat before listing, so an entry added meanwhile changes the mtime again
+                mtime_ns = os.stat(path).st_mtime_ns
+                with os.scandir(path) as it:
+                    entries = list(it)
+            except OSError:
+                self._forget_tree_locked(path)
+                continue
+            self._conn.execute("INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)", (path, mtime_ns))
+
+            present_files: Set[str] = set()
+            present_dirs: Set[str] = set()
+            # Hidden files/dirs (.chroma, our own db) are skipped, as rg does by default
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    # Like os.walk: symlinked directories are not followed
+                    if not entry.is_symlink():
+                        present_dirs.add(entry.path)
+                        if recursive or entry.path not in known_dirs:
+                            stack.append(entry.path)
+                elif entry.name.lower().endswith(".md"):
+                    present_files.add(entry.path)
+
+            indexed = self._files_in_locked(path)
+            for file_path in present_files:
+                updated += self._index_file_locked(file_path, indexed.get(file_path))
+            for file_path, (file_id, _, _) in indexed.items():
+                if file_path not in present_files:
+                    self._conn.execute("DELETE FROM trigrams WHERE file = ?", (file_id,))
+                    self._conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            for sub in known_dirs:
+                if os.path.dirname(sub) == path and sub not in present_dirs:
+                    self._forget_tree_locked(sub)
+        return updated
+
+    @staticmethod
+    def _prefix_range(path: str) -> Tuple[str, str]:
+        """Bounds of the paths strictly below directory ``path`` (for an index range scan)."""
+        return path + os.sep, path + chr(ord(os.sep) + 1)
+
+    def _files_in_locked(self, path: str) -> Dict[str, Tuple[int, int, int]]:
+        lo, hi = self._prefix_range(path)
+        return {
+            file_path: (file_id, size, mtime_ns)
+            for file_id, file_path, size, mtime_ns in self._conn.execute(
+                "SELECT id, path, size, mtime_ns FROM files WHERE path > ? AND path < ?", (lo, hi)
+            )
+            if os.path.dirname(file_path) == path
+        }
+
+    def _index_file_locked(self, path: str, prev: Optional[Tuple[int, int, int]]) -> int:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return 0
+        if prev and prev[1] == st.st_size and prev[2] == st.st_mtime_ns:
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                text = f.read()
+        except OSError:
+            return 0
+        if prev:
+            file_id = prev[0]
+            self._conn.execute("DELETE FROM trigrams WHERE file = ?", (file_id,))
+            self._conn.execute(
+                "UPDATE files SET size = ?, mtime_ns = ? WHERE id = ?", (st.st_size, st.st_mtime_ns, file_id)
+            )
+        else:
+            file_id = self._conn.execute(
+                "INSERT INTO files (path, size, mtime_ns) VALUES (?, ?, ?)", (path, st.st_size, st.st_mtime_ns)
+            ).lastrowid
+        self._conn.executemany(
+            "INSERT INTO trigrams (tri, file) VALUES (?, ?)", [(t, file_id) for t in trigrams(text)]
+        )
+        return 1
+
+    def _forget_tree_locked(self, path: str):
+        """Drop a directory that no longer exists, with everything indexed below it."""
+        lo, hi = self._prefix_range(path)
+        self._conn.execute(
+            "DELETE FROM trigrams WHERE file IN (SELECT id FROM files WHERE path > ? AND path < ?)", (lo, hi)
+        )
+        self._conn.execute("DELETE FROM files WHERE path > ? AND path < ?", (lo, hi))
+        self._conn.execute("DELETE FROM dirs WHERE path = ? OR (path > ? AND path < ?)", (path, lo, hi))
+
+    def candidate_files(self, literals: List[str]) -> List[str]:
+        wanted: Set[int] = set()
+        for lit in literals:
+            wanted |= trigrams(lit)
+        keys = list(wanted)
+        with self._lock:
+            if not keys:
+                return [row[0] for row in self._conn.execute("SELECT path FROM files ORDER BY path")]
+            placeholders = ",".join("?" * len(keys))
+            rows = self._conn.execute(
+                f"SELECT f.path FROM trigrams t JOIN files f ON f.id = t.file "
+                f"WHERE t.tri IN ({placeholders}) GROUP BY t.file HAVING COUNT(*) = ? ORDER BY f.path",
+                keys + [len(keys)],
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, query: str, max_results: Optional[int] = None, max_per_file: Optional[int] = None) -> Optional[List[Dict]]:
+        """Case-insensitive regex search with rg-style passages, or None if the pattern can't be accelerated.
+
+        Stops after ``max_results`` passages; ``max_per_file`` caps matches per file like ``rg --max-count``.
+        """
+        literals = required_literals(query)
+        # Non-ASCII literals are left to rg: Unicode case-insensitive matching
+        # (e.g. "ß", final sigma) doesn't reduce to one folded character each
+        usable = [lit for lit in literals or [] if len(lit) >= 3 and lit.isascii()]
+        if not usable:
+            return None
+        try:
+            regex = re.compile(query, re.IGNORECASE)
+        except re.error:
+            return None
+
+        self.refresh()
+        results: List[Dict] = []
+        for path in self.candidate_files(usable):
+            try:
+                with open(path, "r", encoding="utf-8", errors="ignore", newline="") as f:
+                    lines = _split_lines(f.read())
+            except OSError:
+                continue
+            match_lines = []
+            for i, line in enumerate(lines, 1):
+                if regex.search(line):
+                    match_lines.append(i)
+                    if max_per_file and len(match_lines) >= max_per_file:
+                        break
+            if match_lines:
+                results.extend(passages_for_file(path, lines, match_lines))
+            if max_results and len(results) >= max_results:
+                return results[:max_results]
+        return results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -2,19 +2,30 @@ import chromadb
 from chromadb.config import Settings
 import chromadb.utils.embedding_functions as embedding_functions
 import kb_agent.config as config
-from typing import List, Dict, Optional, Any
+from kb_agent.registry import registry
+from kb_agent.tools.embedding_cache import EmbeddingCache, CachedEmbeddingFunction, default_cache_path
+from kb_agent.tools.onnx_batching import length_buckets, padded_inputs
+from typing import Callable, List, Dict, Optional, Any
+import logging
 import os
 
+logger = logging.getLogger("kb_agent")
+
+# Used when the Chroma client cannot report its own max batch size
+_DEFAULT_MAX_BATCH_SIZE = 5000
+
 class ONNXEmbeddingFunction(embedding_functions.EmbeddingFunction):
     """
     Custom embedding function that loads a local ONNX model and tokenizer.
     Designed for BGE-like models (mean pooling + normalization).
     """
-    def __init__(self, model_dir: str):
+    def __init__(self, model_dir: str, max_batch_tokens: int = 16384):
         import onnxruntime as ort
         from tokenizers import Tokenizer
         
         self.model_dir = model_dir
+        # Padded-token budget (rows x longest sequence) per ONNX run; <= 0 runs the whole input as one batch
+        self.max_batch_tokens = max_batch_tokens
         model_path = os.path.join(model_dir, "model.onnx")
         if not os.path.exists(model_path):
             model_path = os.path.join(model_dir, "onnx", "model.onnx")
@@ -37,49 +48,12 @@ class ONNXEmbeddingFunction(embedding_functions.EmbeddingFunction):
         # Load the tokenizer
         self.tokenizer = Tokenizer.from_file(tokenizer_path)
         self.tokenizer.enable_truncation(max_length=8192)
+        # Padding is done per bucket below; padding here would pad everything to the longest input
+        self.tokenizer.no_padding()
 
-
-        
-    def __call__(self, input: List[str]) -> List[List[float]]:
+    def _run(self, ort_inputs):
         import numpy as np
-        
-        if not input:
-            return []
-            
-        # Tokenize
-        encoded = self.tokenizer.encode_batch(input)
-        
-        # Prepare inputs for ONNX
-        batch_input_ids = []
-        batch_attention_mask = []
-        batch_token_type_ids = []
-        
-        for enc in encoded:
-            batch_input_ids.append(enc.ids)
-            batch_attention_mask.append(enc.attention_mask)
-            if hasattr(enc, 'type_ids'):
-                batch_token_type_ids.append(enc.type_ids)
-            else:
-                batch_token_type_ids.append([0] * len(enc.ids))
-                
-        # Pad to max length in batch
-        max_len = max(len(ids) for ids in batch_input_ids)
-        
-        for i in range(len(batch_input_ids)):
-            pad_len = max_len - len(batch_input_ids[i])
-            if pad_len > 0:
-                batch_input_ids[i].extend([0] * pad_len)
-                batch_attention_mask[i].extend([0] * pad_len)
-                batch_token_type_ids[i].extend([0] * pad_len)
-        
-        ort_inputs = {}
-        if "input_ids" in self.valid_input_names:
-            ort_inputs["input_ids"] = np.array(batch_input_ids, dtype=np.int64)
-        if "attention_mask" in self.valid_input_names:
-            ort_inputs["attention_mask"] = np.array(batch_attention_mask, dtype=np.int64)
-        if "token_type_ids" in self.valid_input_names:
-            ort_inputs["token_type_ids"] = np.array(batch_token_type_ids, dtype=np.int64)
-        
+
         # Run inference
         outputs = self.session.run(None, ort_inputs)
         
@@ -91,9 +65,101 @@ class ONNXEmbeddingFunction(embedding_functions.EmbeddingFunction):
         
         # Normalize
         norms = np.linalg.norm(sentence_embeddings, axis=1, keepdims=True)
-        sentence_embeddings = sentence_embeddings / np.clip(norms, a_min=1e-12, a_max=None)
+        return sentence_embeddings / np.clip(norms, a_min=1e-12, a_max=None)
         
-        return sentence_embeddings.tolist()
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        import numpy as np
+        
+        if not input:
+            return []
+            
+        # Tokenize
+        encoded = self.tokenizer.encode_batch(input)
+        lengths = [len(enc.ids) for enc in encoded]
+        
+        result = None
+        for bucket in length_buckets(lengths, max_tokens=self.max_batch_tokens):
+            embeddings = self._run(padded_inputs(encoded, bucket, self.valid_input_names))
+            if result is None:
+                result = np.empty((len(input), embeddings.shape[1]), dtype=np.float32)
+            # Scatter back so outputs line up with the caller's input order
+            result[bucket] = embeddings
+        
+        return result.tolist()
+
+def _embedding_key(settings) -> tuple:
+    """Settings that determine which embedding function ``_create_embedding_function`` builds."""
+    return tuple(
+        getattr(settings, name, None) if settings else None
+        for name in ("embedding_url", "embedding_model", "embedding_model_path", "embedding_max_batch_tokens",
+                     "embedding_cache_enabled", "embedding_cache_max_mb", "cache_path")
+    )
+
+
+def _local_model_dir(settings):
+    """(model name, directory) of the local ONNX embedding model."""
+    # Determine Local Model Base Path and Model Name
+    emb_model_name = getattr(settings, "embedding_model", None)
+    if not emb_model_name:
+        emb_model_name = "bge-small-zh-v1.5" # Fallback if not specified
+
+    # Check configured base path, otherwise use default bundled model path
+    base_path = str(settings.embedding_model_path) if settings and getattr(settings, "embedding_model_path", None) else os.path.join(os.getcwd(), "models")
+
+    # Combine base path and model name
+    return emb_model_name, os.path.join(base_path, emb_model_name)
+
+
+def _create_embedding_function(settings):
+    """Build the configured embedding function, or None to use Chroma's default."""
+    # Embedding logic fallback: URL > Configured Local ONNX > Built-in Default Local ONNX > Chroma Default
+    if settings and getattr(settings, "embedding_url", None):
+        remote_model = settings.embedding_model if hasattr(settings, "embedding_model") and settings.embedding_model else "text-embedding-ada-002"
+        ef = embedding_functions.OpenAIEmbeddingFunction(
+            api_key="dummy",
+            api_base=settings.embedding_url,
+            model_name=remote_model
+        )
+        model_id = f"remote:{settings.embedding_url}:{remote_model}"
+    else:
+        emb_model_name, model_path_str = _local_model_dir(settings)
+        model_id = f"onnx:{emb_model_name}"
+        if os.path.exists(model_path_str):
+            try:
+                max_batch_tokens = getattr(settings, "embedding_max_batch_tokens", None)
+                if not isinstance(max_batch_tokens, int):
+                    max_batch_tokens = 16384
+                ef = ONNXEmbeddingFunction(model_path_str, max_batch_tokens=max_batch_tokens)
+            except Exception as e:
+                print(f"Warning: Failed to load local ONNX model from {model_path_str}: {e}")
+                print("Falling back to ChromaDB default embedding function.")
+                ef = None
+        else:
+            print(f"Warning: Expected local model path {model_path_str} does not exist.")
+            print("Falling back to ChromaDB default embedding function.")
+            ef = None
+
+    if ef:
+        ef = _wrap_with_cache(ef, model_id, settings)
+    return ef
+
+
+def _wrap_with_cache(ef, model_id: str, settings):
+    """Put the persistent embedding cache in front of ``ef`` if enabled."""
+    if not settings or getattr(settings, "embedding_cache_enabled", True) is False:
+        return ef
+    cache_file = None
+    try:
+        cache_file = default_cache_path(settings)
+        if cache_file is None:
+            return ef
+        max_mb = settings.embedding_cache_max_mb if settings.embedding_cache_max_mb is not None else 512
+        cache = EmbeddingCache(cache_file, max_bytes=max_mb * 1024 * 1024)
+    except Exception as e:
+        print(f"Warning: Embedding cache unavailable at {cache_file}: {e}")
+        return ef
+    return CachedEmbeddingFunction(ef, cache, model_id)
+
 
 class VectorTool:
     def __init__(self, collection_name: str = "kb_docs"):
@@ -106,69 +172,110 @@ class VectorTool:
 
         os.makedirs(persist_dir, exist_ok=True)
 
-        self.client = chromadb.PersistentClient(path=persist_dir)
+        self.client = registry.chroma_client(persist_dir)
 
-        # Embedding logic fallback: URL > Configured Local ONNX > Built-in Default Local ONNX > Chroma Default
-        if settings and getattr(settings, "embedding_url", None):
-            ef = embedding_functions.OpenAIEmbeddingFunction(
-                api_key="dummy",
-                api_base=settings.embedding_url,
-                model_name=settings.embedding_model if hasattr(settings, "embedding_model") and settings.embedding_model else "text-embedding-ada-002"
-            )
-        else:
-            # Determine Local Model Base Path and Model Name
-            emb_model_name = getattr(settings, "embedding_model", None)
-            if not emb_model_name:
-                emb_model_name = "bge-small-zh-v1.5" # Fallback if not specified
-
-            # Check configured base path, otherwise use default bundled model path
-            base_path = str(settings.embedding_model_path) if settings and getattr(settings, "embedding_model_path", None) else os.path.join(os.getcwd(), "models")
-            
-            # Combine base path and model name
-            model_path_str = os.path.join(base_path, emb_model_name)
-            
-            if os.path.exists(model_path_str):
-                try:
-                    ef = ONNXEmbeddingFunction(model_path_str)
-                except Exception as e:
-                    print(f"Warning: Failed to load local ONNX model from {model_path_str}: {e}")
-                    print("Falling back to ChromaDB default embedding function.")
-                    ef = None
-            else:
-                print(f"Warning: Expected local model path {model_path_str} does not exist.")
-                print("Falling back to ChromaDB default embedding function.")
-                ef = None
+        # The model and collection handle are shared process-wide; this object is a cheap view over them
+        ef_key = _embedding_key(settings)
+        ef = registry.get_or_create(("embedding_function",) + ef_key, lambda: _create_embedding_function(settings))
+        self.embedding_function = ef
+        self.embedding_cache = ef.cache if isinstance(ef, CachedEmbeddingFunction) else None
+        self.collection = registry.get_or_create(
+            ("collection", persist_dir, collection_name) + ef_key,
+            lambda: self._open_collection(collection_name, ef),
+        )
 
+    def _open_collection(self, collection_name: str, ef):
         if ef:
             try:
-                self.collection = self.client.get_collection(name=collection_name, embedding_function=ef)
+                return self.client.get_collection(name=collection_name, embedding_function=ef)
             except Exception as e:
                 print(f"Failed to get collection '{collection_name}'. Attempting to create...")
                 try:
-                    self.collection = self.client.create_collection(name=collection_name, embedding_function=ef, metadata={"hnsw:space": "cosine"})
+                    return self.client.create_collection(name=collection_name, embedding_function=ef, metadata={"hnsw:space": "cosine"})
                 except Exception as e:
                     print(f"Failed to create collection '{collection_name}': {e}")
                     print("This is likely due to a dimension or metric mismatch from previous runs. Please delete the .chroma folder and restart the system.")
                     # Fallback if there's a race condition or mismatch
-                    self.collection = self.client.get_or_create_collection(name=collection_name, metadata={"hnsw:space": "cosine"})
-        else:
-            self.collection = self.client.get_or_create_collection(name=collection_name, metadata={"hnsw:space": "cosine"})
+                    return self.client.get_or_create_collection(name=collection_name, metadata={"hnsw:space": "cosine"})
+        return self.client.get_or_create_collection(name=collection_name, metadata={"hnsw:space": "cosine"})
 
-    def add_documents(self, documents: List[str], metadatas: List[Dict[str, Any]], ids: List[str]):
+    def add_documents(self, documents: List[str], metadatas: List[Dict[str, Any]], ids: List[str]) -> bool:
         """
-        Adds documents to the vector store.
+        Adds documents to the vector store. Returns False if the upsert failed.
         """
         if not documents:
-            return
+            return True
 
+        # Chroma rejects upserts larger than the client's max batch size
+        step = self.max_batch_size
         try:
-            self.collection.upsert(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
+            for start in range(0, len(documents), step):
+                self.collection.upsert(
+                    documents=documents[start:start + step],
+                    metadatas=metadatas[start:start + step],
+                    ids=ids[start:start + step]
+                )
+            return True
         except Exception as e:
             print(f"Error adding documents to ChromaDB: {e}")
+            return False
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> bool:
+        """
+        Overwrites the metadata of stored chunks without re-embedding them. Returns False on failure.
+        """
+        if not ids:
+            return True
+
+        step = self.max_batch_size
+        try:
+            for start in range(0, len(ids), step):
+                self.collection.update(ids=ids[start:start + step], metadatas=metadatas[start:start + step])
+            return True
+        except Exception as e:
+            print(f"Error updating metadata in ChromaDB: {e}")
+            return False
+
+    @property
+    def max_batch_size(self) -> int:
+        try:
+            size = self.client.get_max_batch_size()
+        except Exception:
+            size = None
+        return size if isinstance(size, int) and size > 0 else _DEFAULT_MAX_BATCH_SIZE
+
+    def delete_documents(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        """
+        Removes documents from the vector store by id and/or metadata filter.
+        """
+        if not ids and not where:
+            return
+
+        try:
+            self.collection.delete(ids=ids or None, where=where)
+        except Exception as e:
+            print(f"Error deleting documents from ChromaDB: {e}")
+
+    def get_documents(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetches stored chunks by id (no embedding). Returns {id: {"content", "metadata"}}.
+        """
+        if not ids:
+            return {}
+        try:
+            res = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        except Exception as e:
+            print(f"Error fetching documents from ChromaDB: {e}")
+            return {}
+        documents = res.get("documents") or []
+        metadatas = res.get("metadatas") or []
+        return {
+            doc_id: {
+                "content": documents[i] if i < len(documents) else "",
+                "metadata": (metadatas[i] if i < len(metadatas) else None) or {},
+            }
+            for i, doc_id in enumerate(res.get("ids") or [])
+        }
 
     def query(self, query_text: str, n_results: int = 5, where: Optional[Dict[str, Any]] = None):
         """
@@ -228,3 +335,75 @@ class VectorTool:
             })
 
         return processed_results
+
+
+def _estimate_tokens(text: str) -> int:
+    # ~1 token per CJK character (3 UTF-8 bytes), ~1 per 3-4 ASCII characters
+    return max(1, len(text.encode("utf-8")) // 3)
+
+
+class UpsertBatcher:
+    """
+    Accumulates chunks across documents and writes them with a single
+    embedding + upsert call once ``max_chunks`` or ``max_tokens`` is reached.
+
+    Short Jira/Confluence documents produce only a handful of chunks each;
+    batching them avoids paying per-call inference overhead for every document.
+    Callers must ``flush()`` at the end of a run.  ``on_commit`` callbacks run
+    only after the batch containing their chunks was upserted successfully; an
+    exception in one is logged and doesn't stop the others.
+    """
+    def __init__(self, vector_tool: VectorTool, max_chunks: Optional[int] = None, max_tokens: Optional[int] = None):
+        settings = config.settings
+        if max_chunks is None:
+            max_chunks = settings.embed_batch_max_chunks if settings and settings.embed_batch_max_chunks else 256
+        if max_tokens is None:
+            max_tokens = settings.embed_batch_max_tokens if settings and settings.embed_batch_max_tokens else 65536
+
+        self.vector_tool = vector_tool
+        self.max_chunks = max_chunks
+        self.max_tokens = max_tokens
+        # id -> (document, metadata); a dict so a re-queued id replaces the pending entry
+        # instead of producing duplicate ids in one upsert (which Chroma rejects).
+        self._pending: Dict[str, tuple] = {}
+        self._pending_tokens = 0
+        self._callbacks: List[Callable[[], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, documents: List[str], metadatas: List[Dict[str, Any]], ids: List[str],
+            on_commit: Optional[Callable[[], None]] = None) -> bool:
+        """Queue chunks; flushes automatically when the batch is full. Returns False if a flush failed."""
+        for doc, meta, chunk_id in zip(documents, metadatas, ids):
+            if chunk_id in self._pending:
+                self._pending_tokens -= _estimate_tokens(self._pending[chunk_id][0])
+            self._pending[chunk_id] = (doc, meta)
+            self._pending_tokens += _estimate_tokens(doc)
+        if on_commit:
+            self._callbacks.append(on_commit)
+
+        if len(self._pending) >= self.max_chunks or self._pending_tokens >= self.max_tokens:
+            return self.flush()
+        return True
+
+    def flush(self) -> bool:
+        """Upsert everything pending. Returns False if the upsert failed (callbacks are dropped)."""
+        callbacks, self._callbacks = self._callbacks, []
+        if self._pending:
+            ids = list(self._pending)
+            documents = [self._pending[i][0] for i in ids]
+            metadatas = [self._pending[i][1] for i in ids]
+            self._pending = {}
+            self._pending_tokens = 0
+            if self.vector_tool.add_documents(documents=documents, metadatas=metadatas, ids=ids) is False:
+                return False
+
+        # The upsert succeeded: one failing callback (e.g. archiving a file) must not
+        # keep the documents after it from being committed
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception as e:
+                logger.warning(f"Post-upsert callback failed: {e}")
+        return True
@@ -19,7 +19,7 @@ from rich.padding import Padding
 from kb_agent.engine import Engine
 from kb_agent.config import load_settings
 from kb_agent import config
-from kb_agent.tools.reranker import reranker_client
+from kb_agent.registry import registry
 from kb_agent.connectors.jira import JiraConnector
 from kb_agent.connectors.confluence import ConfluenceConnector
 from kb_agent.tools.local_file_qa import LocalFileQATool
@@ -1078,7 +1078,7 @@ class KBAgentApp(App):
             try:
                 self.engine = Engine()
                 log.write("[green]● Engine ready[/green]")
-                await reranker_client.initialize()
+                self._warmup_models()
             except Exception as e:
                 log.write(f"[yellow]⚠ Engine init: {e}[/yellow]")
                 log.write("[dim]Use /settings to configure[/dim]")
@@ -1091,6 +1091,11 @@ class KBAgentApp(App):
         ta = self.query_one("#chat-input", ChatInput)
         ta.focus()
 
+    @work(thread=True, group="warmup")
+    def _warmup_models(self):
+        """Load the embedding model, reranker and graph off the UI thread so the first query doesn't wait for them."""
+        registry.warmup()
+
     def _prompt_settings(self):
         self.push_screen(SettingsScreen(), self._on_settings_result)
 
@@ -26,6 +26,8 @@ def test_build_tool_args():
     assert _build_tool_args("confluence_fetch", "Read page 1234567890") == {"page_id": "1234567890"}
     assert _build_tool_args("web_fetch", "Here is https://example.com/spec") == {"url": "https://example.com/spec"}
     assert _build_tool_args("web_fetch", "No URL") == None
+    assert _build_tool_args("graph_related", "How are PROJ-123 and OPS-4567 related?") == {"entity_id": "PROJ-123, OPS-4567"}
+    assert _build_tool_args("graph_related", "design.md") == {"entity_id": "design.md"}
 
 def test_extract_tools_from_text():
     # Test fallback extraction with no white list
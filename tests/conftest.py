@@ -0,0 +1,11 @@
+import pytest
+
+from kb_agent.registry import registry
+
+
+@pytest.fixture(autouse=True)
+def _reset_registry():
+    """Keep cached models/clients/graphs from leaking between tests (and across patches)."""
+    registry.clear()
+    yield
+    registry.clear()
@@ -1,5 +1,5 @@
 import pytest
-from kb_agent.chunking import MarkdownAwareChunker
+from kb_agent.chunking import MarkdownAwareChunker, split_by_markdown_headers, split_by_paragraphs
 
 def test_contextual_prefix_chunking():
     chunker = MarkdownAwareChunker(max_chars=1000, overlap_chars=200)
@@ -39,3 +39,85 @@ def test_contextual_prefix_chunking():
     )
     
     assert chunks2[0].text.startswith(expected_prefix_2)
+
+
+def _word_tokenizer():
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers
+
+    # Every word / CJK character / punctuation mark is one token
+    tokenizer = Tokenizer(models.WordLevel({"[UNK]": 0}, unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.BertNormalizer(handle_chinese_chars=True, lowercase=False)
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    return tokenizer
+
+
+def test_token_budget_chunking_respects_token_limit():
+    pytest.importorskip("tokenizers")
+    tokenizer = _word_tokenizer()
+    chunker = MarkdownAwareChunker(max_tokens=48, overlap_tokens=0, tokenizer=tokenizer)
+
+    paragraphs = ["账户开户需要提供身份证明文件" * 2, "word " * 12, "转账限额每日五万元"]
+    text = "## 开户\n" + "\n\n".join(paragraphs) + "\n\n" + "长" * 100
+    chunks = chunker.chunk(text, {"document_title": "Guide"})
+
+    assert len(chunks) > 1
+    for c in chunks:
+        assert c.text.startswith("Document: Guide\nSection: 开户\n\n")
+        assert len(tokenizer.encode(c.text, add_special_tokens=False).ids) <= 48 - 2
+        assert c.metadata["total_chunks"] == len(chunks)
+    assert [c.metadata["chunk_index"] for c in chunks] == list(range(len(chunks)))
+
+    body = "".join(c.text.split("\n\n", 1)[1] for c in chunks)
+    for para in paragraphs[::2]:
+        assert para in body
+    # The oversized paragraph is cut at token boundaries without losing characters
+    assert body.count("长") == 100
+
+
+def test_token_budget_chunking_keeps_small_sections_whole():
+    pytest.importorskip("tokenizers")
+    chunker = MarkdownAwareChunker(max_tokens=256, tokenizer=_word_tokenizer())
+    text = "# A\nfirst section\n\n# B\nsecond section"
+    chunks = chunker.chunk(text, {})
+    assert [c.text for c in chunks] == ["Section: A\n\n# A\nfirst section", "Section: B\n\n# B\nsecond section"]
+
+
+def test_token_mode_falls_back_to_chars_without_tokenizer(monkeypatch):
+    monkeypatch.setattr("kb_agent.chunking.load_embedding_tokenizer", lambda settings=None: None)
+    chunker = MarkdownAwareChunker(max_chars=1000, max_tokens=128)
+    assert chunker.max_tokens is None
+    assert len(chunker.chunk("## T\nshort", {})) == 1
+
+
+def test_split_by_paragraphs_carries_overlap():
+    a, b, c = "a" * 50, "b" * 50, "c" * 50
+    assert split_by_paragraphs(f"{a}\n\n{b}\n\n\n\n{c}", max_chars=110, overlap_chars=60) == [
+        f"{a}\n\n{b}",
+        f"{b}\n\n{c}",
+    ]
+    # Nothing fits in the overlap budget: the last paragraph is carried anyway
+    assert split_by_paragraphs(f"{a}\n\n{b}", max_chars=60, overlap_chars=10) == [a, f"{a}\n\n{b}"]
+
+
+def test_split_by_markdown_headers_sections():
+    sections = split_by_markdown_headers("intro\n# One\nbody\n#### not a header\n## Two\n## Three\ntail\n")
+    assert [(c.metadata["section_title"], c.text) for c in sections] == [
+        ("Introduction", "intro"),
+        ("One", "# One\nbody\n#### not a header"),
+        ("Two", "## Two"),
+        ("Three", "## Three\ntail"),
+    ]
+
+
+def test_iter_chunks_is_lazy_and_matches_chunk():
+    chunker = MarkdownAwareChunker(max_chars=120, overlap_chars=30, max_tokens=0)
+    text = "\n\n".join(f"## S{i}\n" + "\n\n".join("word " * 8 for _ in range(5)) for i in range(50))
+    meta = {"document_title": "Big"}
+
+    first = next(chunker.iter_chunks(text, meta))
+    assert first.metadata["chunk_index"] == 0 and "total_chunks" not in first.metadata
+
+    chunks = chunker.chunk(text, meta)
+    assert [c.text for c in chunks] == [c.text for c in chunker.iter_chunks(text, meta)]
+    assert all(len(c.text) <= 120 for c in chunks)
+    assert {c.metadata["total_chunks"] for c in chunks} == {len(chunks)}
@@ -0,0 +1,188 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+import kb_agent.tools.csv_qa_tool as csv_tool
+from kb_agent.tools.csv_qa_tool import DataFrameCache
+
+
+def _write_csv(path, rows):
+    path.write_text("account,status,amount\n" + "".join(f"{a},{s},{v}\n" for a, s, v in rows), encoding="utf-8")
+
+
+@pytest.fixture
+def settings(tmp_path):
+    with patch("kb_agent.tools.csv_qa_tool.config.settings", new_callable=MagicMock) as s:
+        s.data_folder = tmp_path
+        s.cache_path = tmp_path / "cache"
+        s.csv_cache_max_mb = 64
+        s.csv_sidecar_enabled = True
+        csv_tool.clear_cache()
+        yield s
+        csv_tool.clear_cache()
+
+
+def test_cache_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "a.csv"
+    _write_csv(path, [("A1", "open", 10)])
+    cache = DataFrameCache(max_bytes=1 << 30, sidecar_dir=tmp_path / "side")
+
+    first = cache.get(str(path))
+    assert cache.get(str(path)) is first
+
+    _write_csv(path, [("A1", "open", 10), ("A2", "closed", 20)])
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000))
+    assert len(cache.get(str(path))) == 2
+    # Only the sidecar of the current version is kept
+    assert len(list((tmp_path / "side").iterdir())) == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    paths = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / f"{name}.csv"
+        _write_csv(path, [(f"{name}{i}", "open", i) for i in range(50)])
+        paths.append(str(path))
+    one = DataFrameCache(max_bytes=1 << 30, sidecar_dir=tmp_path / "side").get(paths[0])
+    size = int(one.memory_usage(deep=True).sum())
+
+    cache = DataFrameCache(max_bytes=int(size * 2.5), sidecar_dir=tmp_path / "side")
+    cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])  # a is now more recent than b
+    cache.get(paths[2])
+
+    assert paths[0] in cache and paths[2] in cache and paths[1] not in cache
+    assert cache.total_bytes <= cache.max_bytes
+
+
+def test_sidecar_skips_csv_parsing_and_keeps_dtypes(tmp_path, monkeypatch):
+    path = tmp_path / "txns.csv"
+    _write_csv(path, [(f"A{i}", ["open", "closed"][i % 2], i) for i in range(200)])
+    first = DataFrameCache(sidecar_dir=tmp_path / "side", max_bytes=1 << 30).get(str(path))
+    pd.testing.assert_frame_equal(first, pd.read_csv(path))
+
+    monkeypatch.setattr(pd, "read_csv", MagicMock(side_effect=AssertionError("CSV re-parsed")))
+    again = DataFrameCache(sidecar_dir=tmp_path / "side", max_bytes=1 << 30).get(str(path))
+    pd.testing.assert_frame_equal(first, again)
+
+
+def test_range_and_str_conditions_on_repetitive_columns(settings, tmp_path):
+    (tmp_path / "archive").mkdir()
+    rows = "".join(f"A{i},2024-01-{i % 28 + 1:02d},{['EUR', 'USD'][i % 2]}\n" for i in range(3 * csv_tool._CATEGORY_MIN_ROWS))
+    (tmp_path / "archive" / "fx.csv").write_text("account,date,currency\n" + rows, encoding="utf-8")
+    queries = [
+        '{"condition": "date >= \'2024-01-27\' and currency == \'USD\'", "columns": ["account", "date"]}',
+        '{"condition": "currency.str.startswith(\'EU\') and date < \'2024-01-02\'", "columns": ["account"]}',
+    ]
+
+    first = [csv_tool.csv_query("fx", q) for q in queries]
+    csv_tool.clear_cache()
+    # Answered again from the sidecar
+    assert [csv_tool.csv_query("fx", q) for q in queries] == first
+
+    assert [line.split("|")[1].strip() for line in first[0].split("\n")[2:5]] == ["A27", "A55", "A83"]
+    assert [line.strip("| ") for line in first[1].split("\n")[2:]][:3] == ["A0", "A28", "A56"]
+    assert "category" not in csv_tool.get_csv_schema_and_sample("fx.csv")
+
+
+def test_csv_query_uses_cache(settings, tmp_path):
+    (tmp_path / "archive").mkdir()
+    _write_csv(tmp_path / "archive" / "ledger.csv", [(f"A{i}", ["open", "closed"][i % 2], i) for i in range(150)])
+
+    result = csv_tool.csv_query("ledger", '{"condition": "status == \'closed\' and amount > 140", "columns": ["account"]}')
+
+    assert [line.strip("| ") for line in result.split("\n")[2:]] == ["A141", "A143", "A145", "A147", "A149"]
+    assert "status (" in csv_tool.get_csv_schema_and_sample("ledger.csv")
+    assert any((tmp_path / "cache" / "csv").iterdir())
+
+
+@pytest.mark.parametrize("query", [
+    '{"condition": "status == \'closed\' and amount > 100", "columns": ["account", "amount"]}',
+    '{"condition": "amount % 7 == 0", "columns": null}',
+    '{"condition": "", "columns": ["status"]}',
+    '{"condition": "amount > 10000", "columns": ["account"]}',
+    '{"condition": "balance > 1", "columns": ["account"]}',
+    '{"condition": "amount > 1", "columns": ["nope"]}',
+])
+def test_streaming_query_matches_in_memory(settings, tmp_path, monkeypatch, query):
+    (tmp_path / "archive").mkdir()
+    _write_csv(tmp_path / "archive" / "big.csv", [(f"A{i}", ["open", "closed"][i % 2], i) for i in range(1000)])
+
+    expected = csv_tool.csv_query("big.csv", query)
+    csv_tool.clear_cache()
+
+    monkeypatch.setattr(csv_tool, "_stream_settings", lambda: (1, 64))
+
+    assert csv_tool.csv_query("big.csv", query) == expected
+    # The large file was never loaded whole
+    assert len(csv_tool._df_cache) == 0
+
+
+def _write_drifting_csv(path, n=400):
+    """Columns whose inferred dtype changes between 64-row chunks."""
+    lines = ["id,code,score,flag"]
+    for i in range(n):
+        code = f"{i:03d}" if i < 150 else f"X{i}"
+        score = str(i) if i < 200 else ("" if i % 3 else f"{i}.5")
+        flag = "" if i > 250 and i % 5 == 0 else ["False", "True"][i % 2]
+        lines.append(f"{i},{code},{score},{flag}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+@pytest.mark.parametrize("query", [
+    '{"condition": "code == \'007\' or code == \'X390\'", "columns": ["id", "code"]}',
+    '{"condition": "code.str.startswith(\'X\') and score > 300", "columns": null}',
+    '{"condition": "score > 198 and score < 215", "columns": ["id", "score"]}',
+    '{"condition": "flag == True and id > 240", "columns": ["id", "flag"]}',
+    '{"condition": "", "columns": ["code", "score"]}',
+])
+def test_streaming_query_matches_in_memory_for_drifting_dtypes(settings, tmp_path, monkeypatch, query):
+    (tmp_path / "archive").mkdir()
+    _write_drifting_csv(tmp_path / "archive" / "mixed.csv")
+
+    expected = csv_tool.csv_query("mixed.csv", query)
+    assert not expected.startswith("Error") and expected != "Query returned no results."
+    csv_tool.clear_cache()
+
+    monkeypatch.setattr(csv_tool, "_stream_settings", lambda: (1, 64))
+    assert csv_tool.csv_query("mixed.csv", query) == expected
+    assert len(csv_tool._df_cache) == 0
+
+
+def test_streaming_query_does_not_read_the_whole_file_up_front(settings, tmp_path, monkeypatch):
+    (tmp_path / "archive").mkdir()
+    _write_drifting_csv(tmp_path / "archive" / "mixed.csv", n=4000)
+    monkeypatch.setattr(csv_tool, "_stream_settings", lambda: (1, 64))
+
+    full_reads = []
+    real_read_csv = pd.read_csv
+
+    def _read_csv(source, *args, **kwargs):
+        if isinstance(source, str) and not kwargs.get("chunksize") and kwargs.get("nrows") is None:
+            full_reads.append(kwargs.get("usecols"))
+        return real_read_csv(source, *args, **kwargs)
+
+    monkeypatch.setattr(csv_tool.pd, "read_csv", _read_csv)
+    result = csv_tool.csv_query("mixed.csv", '{"condition": "code == \'007\'", "columns": ["id", "code"]}')
+
+    assert result.splitlines()[2].split("|")[2].strip() == "007"
+    assert full_reads == []
+    assert csv_tool._stream_text_cols[str(tmp_path / "archive" / "mixed.csv")][1] == {"code"}
+
+
+def test_streaming_query_projects_columns_and_stops_early(settings, tmp_path, monkeypatch):
+    (tmp_path / "archive").mkdir()
+    _write_csv(tmp_path / "archive" / "big.csv", [(f"A{i}", "open", i) for i in range(1000)])
+    monkeypatch.setattr(csv_tool, "_stream_settings", lambda: (1, 64))
+
+    chunks_read = []
+    real_query = pd.DataFrame.query
+    monkeypatch.setattr(pd.DataFrame, "query", lambda self, expr, **kw: chunks_read.append(list(self.columns)) or real_query(self, expr, **kw))
+
+    result = csv_tool.csv_query("big.csv", '{"condition": "amount >= 0", "columns": ["account"]}')
+
+    assert len(result.split("\n")) == 2 + 50
+    assert chunks_read == [["account", "amount"]]
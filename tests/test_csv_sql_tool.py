@@ -0,0 +1,177 @@
+import os
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import kb_agent.tools.csv_sql_tool as sql_tool
+from kb_agent.tools.csv_sql_tool import CsvSqlEngine, condition_columns, table_name
+
+
+def _write_csv(path, rows):
+    path.write_text("account,status,amount\n" + "".join(f"{a},{s},{v}\n" for a, s, v in rows), encoding="utf-8")
+
+
+def _indexes(engine, table):
+    with sqlite3.connect(str(engine.db_path)) as conn:
+        return {row[1] for row in conn.execute(f'PRAGMA index_list("{table}")')}
+
+
+@pytest.fixture
+def settings(tmp_path):
+    (tmp_path / "input").mkdir()
+    (tmp_path / "archive").mkdir()
+    with patch("kb_agent.tools.csv_sql_tool.config.settings", new_callable=MagicMock) as s:
+        s.data_folder = tmp_path
+        s.cache_path = tmp_path / "cache"
+        s.csv_sql_enabled = True
+        s.csv_sql_max_rows = 5
+        s.csv_sql_timeout_seconds = 10
+        yield s
+
+
+def test_table_name():
+    assert table_name("Q3 Transactions.csv") == "q3_transactions"
+    assert table_name("2024-accounts.CSV") == "t_2024_accounts"
+
+
+def test_condition_columns():
+    cols = ["account", "status", "amount"]
+    sql = "SELECT status, SUM(amount) FROM t WHERE account = 'A1' AND \"status\" IN ('open') GROUP BY status"
+    assert condition_columns(sql, cols) == ["account", "status"]
+    assert condition_columns("SELECT account FROM t", cols) == []
+
+
+def test_group_by_and_join_across_files(settings, tmp_path):
+    _write_csv(tmp_path / "archive" / "txns.csv", [("A1", "open", 10), ("A1", "open", 5), ("A2", "closed", 7)])
+    (tmp_path / "input" / "owners.csv").write_text("account,owner\nA1,alice\nA2,bob\n", encoding="utf-8")
+
+    result = sql_tool.run_sql(
+        "SELECT o.owner, SUM(t.amount) AS total FROM txns t JOIN owners o ON o.account = t.account "
+        "GROUP BY o.owner ORDER BY o.owner"
+    )
+    assert "alice" in result and "15" in result
+    assert "bob" in result and "7" in result
+
+
+def test_indexes_columns_used_in_conditions(settings, tmp_path):
+    _write_csv(tmp_path / "archive" / "txns.csv", [(f"A{i}", "open", i) for i in range(20)])
+    assert "A7" in sql_tool.run_sql("SELECT * FROM txns WHERE account = 'A7'")
+
+    engine = sql_tool.get_engine()
+    assert _indexes(engine, "txns") == {"idx_txns_account"}
+
+    with sqlite3.connect(str(engine.db_path)) as conn:
+        plan = " ".join(str(r) for r in conn.execute("EXPLAIN QUERY PLAN SELECT * FROM txns WHERE account = 'A3'"))
+    assert "idx_txns_account" in plan
+
+
+def test_indexes_survive_reload(settings, tmp_path):
+    path = tmp_path / "archive" / "txns.csv"
+    _write_csv(path, [("A1", "open", 1)])
+    sql_tool.run_sql("SELECT * FROM txns WHERE status = 'open'")
+
+    _write_csv(path, [("A1", "open", 1), ("A2", "closed", 2)])
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1_000_000))
+    assert "A2" in sql_tool.run_sql("SELECT * FROM txns")
+    assert _indexes(sql_tool.get_engine(), "txns") == {"idx_txns_status"}
+
+
+def test_csv_query_conditions_are_indexed(settings, tmp_path):
+    _write_csv(tmp_path / "archive" / "txns.csv", [("A1", "open", 1)])
+    engine = sql_tool.get_engine()
+    engine.sync()
+
+    sql_tool.record_condition(str(tmp_path / "archive" / "txns.csv"), ["amount"])
+    assert _indexes(engine, "txns") == {"idx_txns_amount"}
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM txns",
+    "DROP TABLE txns",
+    "INSERT INTO txns VALUES ('A9', 'open', 1)",
+    "PRAGMA table_info(txns)",
+    "SELECT 1; DROP TABLE txns",
+])
+def test_rejects_anything_but_a_select(settings, tmp_path, sql):
+    _write_csv(tmp_path / "archive" / "txns.csv", [("A1", "open", 1)])
+    assert sql_tool.run_sql(sql).startswith("Error")
+    assert "A1" in sql_tool.run_sql("SELECT * FROM txns")
+
+
+def test_caps_result_rows(settings, tmp_path):
+    _write_csv(tmp_path / "archive" / "txns.csv", [(f"A{i}", "open", i) for i in range(20)])
+    result = sql_tool.run_sql("SELECT account FROM txns ORDER BY amount")
+    assert "A4" in result and "A5" not in result
+    assert "first 5 rows" in result
+
+
+def test_times_out_long_queries(settings, tmp_path):
+    _write_csv(tmp_path / "archive" / "txns.csv", [("A1", "open", 1)])
+    settings.csv_sql_timeout_seconds = 0.05
+    result = sql_tool.run_sql(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+    )
+    assert "time limit" in result
+
+
+def test_unknown_table_lists_available_tables(settings, tmp_path):
+    _write_csv(tmp_path / "archive" / "txns.csv", [("A1", "open", 1)])
+    result = sql_tool.run_sql("SELECT * FROM nope")
+    assert "no such table" in result
+    assert "txns(account, status, amount)" in result
+
+
+def test_disabled(settings):
+    settings.csv_sql_enabled = False
+    assert "disabled" in sql_tool.run_sql("SELECT 1")
+
+
+def test_engine_drops_tables_of_removed_files(tmp_path):
+    (tmp_path / "archive").mkdir()
+    path = tmp_path / "archive" / "txns.csv"
+    _write_csv(path, [("A1", "open", 1)])
+    engine = CsvSqlEngine(tmp_path / "db" / "csv_sql.db", [tmp_path / "archive"])
+    assert engine.sync() == ["txns"]
+    assert engine.sync() == []
+
+    path.unlink()
+    engine.sync()
+    assert engine.tables() == []
+    engine.close()
+
+
+def test_unparseable_file_is_skipped_and_not_retried(settings, tmp_path):
+    _write_csv(tmp_path / "archive" / "good.csv", [("A1", "open", 1)])
+    (tmp_path / "archive" / "bad.csv").write_text('account,note\nA1,"unterminated\n', encoding="utf-8")
+    engine = sql_tool.get_engine()
+
+    assert engine.sync() == ["good"]
+    assert engine.tables() == ["good"] and "bad" in engine.failures()
+    assert "A1" in sql_tool.run_sql("SELECT * FROM good")
+
+    with patch("kb_agent.tools.csv_sql_tool.pd.read_csv", side_effect=AssertionError("re-parsed")):
+        assert engine.sync() == []
+    result = sql_tool.run_sql("SELECT * FROM bad")
+    assert "no such table" in result and "bad (could not be loaded" in result
+
+    (tmp_path / "archive" / "bad.csv").write_text("account,note\nA1,fixed\n", encoding="utf-8")
+    assert "fixed" in sql_tool.run_sql("SELECT * FROM bad")
+    assert engine.failures() == {}
+
+
+def test_only_tables_named_by_the_query_are_loaded(settings, tmp_path):
+    _write_csv(tmp_path / "archive" / "txns.csv", [("A1", "open", 1)])
+    (tmp_path / "input" / "owners.csv").write_text("account,owner\nA1,alice\n", encoding="utf-8")
+
+    assert "A1" in sql_tool.run_sql("SELECT * FROM txns")
+    assert sql_tool.get_engine().tables() == ["txns"]
+
+
+def test_csv_query_conditions_wait_for_csv_sql(settings, tmp_path):
+    _write_csv(tmp_path / "archive" / "txns.csv", [("A1", "open", 1)])
+    sql_tool.record_condition(str(tmp_path / "archive" / "txns.csv"), ["amount"])
+    assert not (tmp_path / "cache" / sql_tool.DB_FILENAME).exists()
+
+    sql_tool.run_sql("SELECT * FROM txns")
+    assert _indexes(sql_tool.get_engine(), "txns") == {"idx_txns_amount"}
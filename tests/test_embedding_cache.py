@@ -0,0 +1,71 @@
+import numpy as np
+from kb_agent.tools.embedding_cache import CachedEmbeddingFunction, EmbeddingCache, cache_key
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(list(input))
+        return [[float(len(text)), 0.5, -1.0] for text in input]
+
+
+def test_cached_embedding_function_only_embeds_misses(tmp_path):
+    cache = EmbeddingCache(tmp_path / "emb.db")
+    inner = CountingEmbedder()
+    ef = CachedEmbeddingFunction(inner, cache, "onnx:test")
+
+    first = ef(["alpha", "beta", "alpha"])
+    assert inner.calls == [["alpha", "beta"]]
+    assert np.allclose(first[0], [5.0, 0.5, -1.0])
+    assert np.allclose(first[0], first[2])
+
+    second = ef(["beta", "alpha", "gamma"])
+    assert inner.calls[-1] == ["gamma"]
+    assert np.allclose(second[1], first[0])
+    assert cache.hits == 2
+    assert cache.misses == 4
+
+    # Survives a restart
+    cache.close()
+    reopened = EmbeddingCache(tmp_path / "emb.db")
+    ef2 = CachedEmbeddingFunction(CountingEmbedder(), reopened, "onnx:test")
+    ef2(["alpha"])
+    assert ef2.inner.calls == []
+
+
+def test_cache_key_depends_on_model():
+    assert cache_key("onnx:a", "text") != cache_key("onnx:b", "text")
+    # NFC-equivalent spellings share an entry, whitespace changes the tokens and does not
+    assert cache_key("onnx:a", "caf\u00e9") == cache_key("onnx:a", "cafe\u0301")
+    assert cache_key("onnx:a", "text") != cache_key("onnx:a", "text\n")
+
+
+def test_queries_bypass_the_cache(tmp_path):
+    cache = EmbeddingCache(tmp_path / "emb.db")
+    inner = CountingEmbedder()
+    ef = CachedEmbeddingFunction(inner, cache, "onnx:test")
+
+    assert np.allclose(ef.embed_query(["where is the pool size set?"])[0], [27.0, 0.5, -1.0])
+    ef.embed_query(["where is the pool size set?"])
+    assert len(inner.calls) == 2
+    assert cache.size_bytes == 0 and (cache.hits, cache.misses) == (0, 0)
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path):
+    vec = np.ones(64, dtype=np.float32)  # 128 bytes as float16
+    cache = EmbeddingCache(tmp_path / "emb.db", max_bytes=128 * 4)
+
+    keys = [cache_key("m", f"text {i}") for i in range(4)]
+    for key in keys:
+        cache.put_many({key: vec})
+    cache.get_many([keys[0]])  # touch the oldest entry
+
+    cache.put_many({cache_key("m", "text 4"): vec})
+
+    assert cache.evictions > 0
+    assert cache.size_bytes <= 128 * 4
+    present = cache.get_many(keys)
+    assert keys[0] in present
+    assert keys[1] not in present
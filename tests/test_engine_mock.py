@@ -181,3 +181,32 @@ class TestEngineURLMode:
         mock_web.fetch_data.assert_called_once()
         # Graph should NOT be invoked for URL queries
         MockGraph.return_value.invoke.assert_not_called()
+
+
+class TestEngineLifecycle:
+    """Resources the Engine opens must not outlive their use or the settings they were built from."""
+
+    @patch("kb_agent.engine.compile_graph")
+    @patch("kb_agent.engine.LLMClient")
+    def test_recreating_engine_recompiles_graph(self, MockLLM, MockGraph):
+        from kb_agent.engine import Engine
+        Engine()
+        Engine()
+        assert MockGraph.call_count == 2
+
+    @patch("kb_agent.engine.Processor")
+    @patch("kb_agent.engine.compile_graph")
+    @patch("kb_agent.engine.WebConnector")
+    @patch("kb_agent.engine.LLMClient")
+    def test_index_resource_closes_processor(self, MockLLM, MockWeb, MockGraph, MockProcessor, tmp_path):
+        MockWeb.return_value.fetch_data.return_value = [{
+            "id": "web_test", "title": "Test Page", "content": "Page content", "metadata": {},
+        }]
+        MockProcessor.return_value.flush.side_effect = RuntimeError("upsert failed")
+
+        from kb_agent.engine import Engine
+        with patch("kb_agent.config.settings", MagicMock(index_path=tmp_path)):
+            result = Engine().index_resource("https://example.com/page")
+
+        assert "upsert failed" in result
+        MockProcessor.return_value.close.assert_called_once()
@@ -0,0 +1,293 @@
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+import networkx as nx
+
+from kb_agent.graph.graph_builder import GraphBuilder
+from kb_agent.graph.graph_store import GraphStore
+from kb_agent.tools.graph_tool import GraphTool
+
+
+def _builder(tmp_path):
+    (tmp_path / "source").mkdir(exist_ok=True)
+    (tmp_path / "index").mkdir(exist_ok=True)
+    return GraphBuilder(tmp_path / "source", tmp_path / "index")
+
+
+def _edges(store):
+    return {(s, d, r) for s, d, r in store._conn.execute("SELECT src, dst, relation FROM edges")}
+
+
+def test_store_follows_digraph_semantics(tmp_path):
+    store = GraphStore(tmp_path / "g.db")
+    store.add_node("a.md", type="file", hash="1")
+    store.add_node("a.md", label="a")
+    store.add_edge("a.md", "FSR-1", relation="MENTIONS")
+    store.add_edge("a.md", "FSR-1", relation="CHILD_OF")
+
+    assert store.get_node("a.md") == {"type": "file", "hash": "1", "label": "a"}
+    assert store.get_node("FSR-1") == {}
+    assert store.successors("a.md") == [("FSR-1", "CHILD_OF", None)]
+    assert store.predecessors("FSR-1") == [("a.md", "CHILD_OF", "file")]
+
+    store.remove_nodes(["FSR-1"])
+    assert store.number_of_edges() == 0 and store.number_of_nodes() == 1
+    store.close()
+
+
+def test_build_is_incremental_and_persistent(tmp_path):
+    builder = _builder(tmp_path)
+    (tmp_path / "source" / "docs").mkdir()
+    doc = tmp_path / "source" / "docs" / "a.md"
+    doc.write_text("Parent: [FSR-1]\nSee [FSR-2] and [b](b.md)", encoding="utf-8")
+    (tmp_path / "source" / "docs" / "gone.md").write_text("[FSR-3]", encoding="utf-8")
+    builder.build_graph()
+
+    assert ("docs", "docs/a.md", "CONTAINS") in _edges(builder.store)
+    assert ("FSR-1", "docs/a.md", "PARENT_OF") in _edges(builder.store)
+    assert ("docs/a.md", "FSR-2", "MENTIONS") in _edges(builder.store)
+    assert ("docs/a.md", "b.md", "REFERENCES") in _edges(builder.store)
+
+    doc.write_text("See [FSR-9]", encoding="utf-8")
+    (tmp_path / "source" / "docs" / "gone.md").unlink()
+    _builder(tmp_path).build_graph()
+
+    store = _builder(tmp_path).store
+    edges = _edges(store)
+    assert ("docs/a.md", "FSR-9", "MENTIONS") in edges
+    assert ("docs/a.md", "FSR-2", "MENTIONS") not in edges
+    # The stale incoming PARENT_OF edge is kept, as with the old NetworkX builder
+    assert not store.has_node("docs/gone.md")
+    assert ("docs", "docs/a.md", "CONTAINS") in edges
+
+
+def test_imports_legacy_json_once(tmp_path):
+    (tmp_path / "index").mkdir()
+    legacy = nx.DiGraph()
+    legacy.add_node("a.md", type="file", hash="x")
+    legacy.add_edge("a.md", "FSR-1", relation="MENTIONS")
+    (tmp_path / "index" / "knowledge_graph.json").write_text(json.dumps(nx.node_link_data(legacy)), encoding="utf-8")
+
+    builder = _builder(tmp_path)
+    assert builder.store.get_node("a.md")["hash"] == "x"
+    assert _edges(builder.store) == {("a.md", "FSR-1", "MENTIONS")}
+
+    builder.store.remove_nodes(["FSR-1"])
+    builder.save_graph()
+    assert _builder(tmp_path).store.number_of_edges() == 0
+    assert list(builder.load_graph().nodes(data=True)) == [("a.md", {"type": "file", "hash": "x"})]
+
+
+def test_graph_tool_reads_neighbours_from_store(tmp_path):
+    builder = _builder(tmp_path)
+    (tmp_path / "source" / "a.md").write_text("Parent: [FSR-1]", encoding="utf-8")
+    builder.build_graph()
+
+    settings = MagicMock(index_path=tmp_path / "index")
+    with patch("kb_agent.tools.graph_tool.settings", settings):
+        tool = GraphTool()
+
+    related = tool.get_related_nodes("a")
+    assert {(r["node"], r["relation"], r["direction"]) for r in related} == {
+        # "[FSR-1]" is also a mention, which replaces CHILD_OF as in nx.DiGraph
+        ("FSR-1", "MENTIONS", "out"),
+        ("FSR-1", "PARENT_OF", "in"),
+    }
+    assert related[0]["type"] == "jira_issue"
+    assert tool.find_path("FSR-1", "a.md") == ["FSR-1", "a.md"]
+    assert tool.get_related_nodes("nothing-like-this") == []
+
+
+def test_lookup_ranks_candidates(tmp_path):
+    store = GraphStore(tmp_path / "g.db")
+    for node in ("docs/Payments Overview.md", "docs/payments.md", "archive/old/payments.md",
+                 "FSR-12", "FSR-123", "docs/notes-payments-2023.md"):
+        store.add_node(node, type="file")
+    store.add_edge("docs/payments.md", "FSR-1234", relation="MENTIONS")
+
+    assert store.lookup("fsr-12") == ["FSR-12", "FSR-123", "FSR-1234"]
+    assert store.lookup("PAYMENTS") == [
+        "docs/payments.md", "archive/old/payments.md", "docs/Payments Overview.md", "docs/notes-payments-2023.md",
+    ]
+    assert store.lookup("docs/payments.md", limit=1) == ["docs/payments.md"]
+    assert store.lookup("overview") == ["docs/Payments Overview.md"]
+    assert store.lookup("zz") == [] and store.lookup("nowhere") == []
+
+    store.remove_nodes(["FSR-123"])
+    assert store.lookup("fsr-12") == ["FSR-12", "FSR-1234"]
+    assert store._conn.execute("SELECT COUNT(*) FROM node_keys WHERE node = 'FSR-123'").fetchone()[0] == 0
+    store.close()
+
+
+def test_lookup_skips_substring_pass_once_limit_is_filled(tmp_path):
+    store = GraphStore(tmp_path / "g.db")
+    for i in range(5):
+        store.add_node(f"docs/payments-{i}.md", type="file")
+    store.add_node("docs/old-payments.md", type="file")
+
+    with patch.object(GraphStore, "_substring_candidates", side_effect=AssertionError("not needed")):
+        assert store.lookup("payments", limit=3) == ["docs/payments-0.md", "docs/payments-1.md", "docs/payments-2.md"]
+    assert store.lookup("payments", limit=10)[-1] == "docs/old-payments.md"
+
+    plan = store._conn.execute(
+        "EXPLAIN QUERY PLAN SELECT node FROM node_keys WHERE kind IN (1, 2) AND key > 'p' AND key < 'q'"
+    ).fetchall()
+    assert "idx_node_keys_kind" in str(plan)
+    store.close()
+
+
+def test_lookup_index_is_built_for_existing_stores(tmp_path):
+    store = GraphStore(tmp_path / "g.db")
+    store.add_node("docs/a-guide.md", type="file")
+    store._conn.execute("DELETE FROM node_keys")
+    store._conn.execute("DELETE FROM meta")
+    store.commit()
+    store.close()
+
+    assert GraphStore(tmp_path / "g.db").lookup("guide") == ["docs/a-guide.md"]
+
+
+def test_rebuild_skips_files_with_unchanged_stat(tmp_path, monkeypatch):
+    import kb_agent.graph.graph_builder as gb
+
+    builder = _builder(tmp_path)
+    doc = tmp_path / "source" / "a.md"
+    doc.write_text("See [FSR-1]", encoding="utf-8")
+    builder.build_graph()
+    assert builder.store.get_node("a.md")["size"] == doc.stat().st_size
+
+    parsed = []
+    real_parse = gb.parse_file
+    monkeypatch.setattr(gb, "parse_file", lambda path: parsed.append(path) or real_parse(path))
+    _builder(tmp_path).build_graph()
+    assert parsed == []
+
+    # Touched without changing content: re-hashed once, stat refreshed, edges untouched
+    st = doc.stat()
+    os.utime(doc, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    _builder(tmp_path).build_graph()
+    assert len(parsed) == 1
+    store = _builder(tmp_path).store
+    assert store.get_node("a.md")["mtime_ns"] == st.st_mtime_ns + 1_000_000
+    assert _edges(store) == {("a.md", "FSR-1", "MENTIONS")}
+
+
+def test_parallel_parsing_matches_serial(tmp_path, monkeypatch):
+    import kb_agent.graph.graph_builder as gb
+
+    monkeypatch.setattr(gb, "PARALLEL_MIN_FILES", 1)
+    results = []
+    for workers in (1, 2):
+        root = tmp_path / f"w{workers}"
+        (root / "source" / "sub").mkdir(parents=True)
+        for i in range(20):
+            (root / "source" / "sub" / f"{i}.md").write_text(f"Parent: [FSR-{i}]\n[FSR-{i + 1}] [x]({i + 2}.md)", encoding="utf-8")
+        (root / "index").mkdir()
+        builder = GraphBuilder(root / "source", root / "index", workers=workers)
+        builder.build_graph()
+        results.append((_edges(builder.store), set(builder.store.nodes_of_type("jira_issue"))))
+    assert results[0] == results[1]
+    assert ("FSR-3", "sub/3.md", "PARENT_OF") in results[0][0]
+
+
+def test_parallel_parsing_spawns_and_streams_results(tmp_path, monkeypatch):
+    import concurrent.futures
+    import kb_agent.graph.graph_builder as gb
+
+    paths = []
+    for i in range(10):
+        path = tmp_path / f"{i}.md"
+        path.write_text(f"[FSR-{i}]", encoding="utf-8")
+        paths.append(str(path))
+
+    submitted = []
+
+    class _Pool:
+        def __init__(self, max_workers, mp_context=None):
+            self.start_method = mp_context.get_start_method()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def submit(self, fn, batch):
+            submitted.append((self.start_method, len(batch)))
+            future = concurrent.futures.Future()
+            future.set_result(fn(batch))
+            return future
+
+    monkeypatch.setattr(gb, "PARALLEL_MIN_FILES", 1)
+    monkeypatch.setattr(gb, "PARSE_BATCH_FILES", 2)
+    monkeypatch.setattr(gb.concurrent.futures, "ProcessPoolExecutor", _Pool)
+    builder = GraphBuilder(tmp_path, tmp_path / "index", workers=2)
+
+    results = builder._parse_all(paths)
+    assert next(results)[1] == [("FSR-0", "MENTIONS", True, False)]
+    # Only 2x workers batches are in flight before the first result is handed out
+    assert submitted == [("spawn", 2)] * 4
+    assert [r[1][0][0] for r in results] == [f"FSR-{i}" for i in range(1, 10)]
+    assert len(submitted) == 5
+
+
+def _chain_tool(tmp_path):
+    """FSR-1 <- parent of - FSR-2 <- parent of - FSR-3, plus mentions and a busy hub."""
+    store = GraphStore(tmp_path / "index" / "knowledge_graph.db")
+    for child, parent in (("FSR-2", "FSR-1"), ("FSR-3", "FSR-2")):
+        store.add_node(child, type="jira_issue")
+        store.add_node(parent, type="jira_issue")
+        store.add_edge(parent, child, relation="PARENT_OF")
+        store.add_edge(child, parent, relation="CHILD_OF")
+    store.add_edge("FSR-3", "OPS-9", relation="MENTIONS")
+    for i in range(30):
+        store.add_edge("HUB-1", f"doc{i}.md", relation="REFERENCES")
+    store.commit()
+    with patch("kb_agent.tools.graph_tool.settings", MagicMock(index_path=tmp_path / "index")):
+        return GraphTool()
+
+
+def test_traverse_walks_chains_in_one_call(tmp_path):
+    tool = _chain_tool(tmp_path)
+
+    result = tool.traverse(["fsr-1", "missing-entity"], max_depth=3, relations=["parent_of"], direction="out")
+    assert result["seeds"] == {"fsr-1": "FSR-1", "missing-entity": None}
+    assert [(n["id"], n["depth"]) for n in result["nodes"]] == [("FSR-1", 0), ("FSR-2", 1), ("FSR-3", 2)]
+    assert result["edges"] == [["FSR-1", "PARENT_OF", "FSR-2"], ["FSR-2", "PARENT_OF", "FSR-3"]]
+    assert result["truncated"] is False
+
+    both = tool.traverse(["FSR-3"], max_depth=1)
+    assert {n["id"] for n in both["nodes"]} == {"FSR-3", "FSR-2", "OPS-9"}
+    assert ["FSR-2", "PARENT_OF", "FSR-3"] in both["edges"] and ["FSR-3", "CHILD_OF", "FSR-2"] in both["edges"]
+
+
+def test_traverse_caps_fanout_and_size(tmp_path):
+    tool = _chain_tool(tmp_path)
+
+    capped = tool.traverse(["HUB-1"], max_depth=2, max_fanout=5)
+    assert len(capped["nodes"]) == 6 and capped["truncated"] is True
+    assert len(tool.traverse(["HUB-1", "FSR-1"], max_depth=4, max_nodes=10)["nodes"]) == 10
+
+
+def test_get_related_nodes_honours_max_depth(tmp_path):
+    tool = _chain_tool(tmp_path)
+    assert {r["node"] for r in tool.get_related_nodes("FSR-1")} == {"FSR-2"}
+    deep = {r["node"]: (r["depth"], r["relation"]) for r in tool.get_related_nodes("FSR-1", max_depth=3)}
+    assert deep == {"FSR-2": (1, "PARENT_OF"), "FSR-3": (2, "PARENT_OF"), "OPS-9": (3, "MENTIONS")}
+
+
+def test_graph_related_tool_returns_subgraph(tmp_path):
+    import kb_agent.agent.tools as tools
+
+    tool = _chain_tool(tmp_path)
+    with patch.object(tools, "_get_graph", return_value=tool):
+        result = json.loads(tools.graph_related.invoke(
+            {"entity_id": "FSR-1, FSR-3", "depth": "2", "relations": "PARENT_OF, CHILD_OF"}
+        ))
+        assert result["seeds"] == {"FSR-1": "FSR-1", "FSR-3": "FSR-3"}
+        assert {n["id"] for n in result["nodes"]} == {"FSR-1", "FSR-2", "FSR-3"}
+
+        missing = json.loads(tools.graph_related.invoke({"entity_id": "nothing-like-this"}))
+        assert missing["status"] == "no_results"
+    assert tools.graph_related in tools.ALL_TOOLS
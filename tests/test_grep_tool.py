@@ -0,0 +1,70 @@
+import io
+import json
+from unittest.mock import MagicMock, patch
+
+from kb_agent.tools.grep_tool import GrepTool
+
+
+def _rg_events(files):
+    """Fake `rg --json -C 10` output: {path: [(line, text, is_match), ...]}."""
+    out = []
+    for path, lines in files.items():
+        out.append({"type": "begin", "data": {"path": {"text": path}}})
+        for line, text, is_match in lines:
+            out.append({
+                "type": "match" if is_match else "context",
+                "data": {"path": {"text": path}, "line_number": line, "lines": {"text": text + "\n"}},
+            })
+        out.append({"type": "end", "data": {"path": {"text": path}}})
+    return "".join(json.dumps(e) + "\n" for e in out)
+
+
+class FakePopen:
+    def __init__(self, output):
+        self.output_size = len(output)
+        self.stdout = io.StringIO(output)
+        self.killed = False
+        self.read_at_kill = None
+
+    def poll(self):
+        return None if not self.killed and self.stdout.tell() < self.output_size else 0
+
+    def kill(self):
+        self.killed = True
+        self.read_at_kill = self.stdout.tell()
+
+    def wait(self):
+        return -9 if self.killed else 0
+
+
+def _tool(tmp_path):
+    tool = GrepTool.__new__(GrepTool)
+    tool.docs_path = tmp_path
+    return tool
+
+
+def test_ripgrep_streaming_merges_passages(tmp_path):
+    output = _rg_events({
+        "a.md": [(1, "ctx", False), (2, "account one", True), (3, "ctx", False), (40, "account two", True)],
+        "b.md": [(7, "account three", True)],
+    })
+    fake = FakePopen(output)
+    with patch("kb_agent.tools.grep_tool.subprocess.Popen", return_value=fake) as popen:
+        results = _tool(tmp_path)._ripgrep_search("account", max_per_file=5)
+
+    assert [(r["file_path"], r["line"]) for r in results] == [("a.md", 2), ("a.md", 40), ("b.md", 7)]
+    assert results[0]["content"] == "ctx\naccount one\nctx"
+    assert "--max-count" in popen.call_args.args[0]
+    assert not fake.killed
+
+
+def test_ripgrep_streaming_stops_at_max_results(tmp_path):
+    files = {f"doc{i}.md": [(1, "account", True)] for i in range(100)}
+    fake = FakePopen(_rg_events(files))
+    with patch("kb_agent.tools.grep_tool.subprocess.Popen", return_value=fake):
+        results = _tool(tmp_path)._ripgrep_search("account", max_results=3)
+
+    assert [r["file_path"] for r in results] == ["doc0.md", "doc1.md", "doc2.md"]
+    assert fake.killed
+    # Stopped reading well before the end of rg's output
+    assert fake.read_at_kill < fake.output_size // 10
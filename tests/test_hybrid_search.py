@@ -0,0 +1,107 @@
+from unittest.mock import MagicMock
+
+from kb_agent.tools.hybrid_search import HybridSearchTool, reciprocal_rank_fusion
+from kb_agent.tools.sparse_index import SparseIndex, tokenize
+
+
+def test_tokenize_keeps_identifiers_and_cjk_bigrams():
+    tokens = tokenize("Set db.pool.max_size; see ERR-1042 连接池")
+    assert "db.pool.max_size" in tokens
+    assert "max" in tokens and "pool" in tokens
+    assert "err-1042" in tokens
+    assert "连接" in tokens and "接池" in tokens
+
+
+def test_sparse_index_ranks_exact_identifier_and_replaces_documents(tmp_path):
+    index = SparseIndex(tmp_path / "sparse.db")
+    index.replace_document("cfg", ["cfg-chunk-0", "cfg-chunk-1"], [
+        "The pool size is tuned per service.",
+        "Set db.pool.max_size to 50 for the payments service.",
+    ])
+    index.replace_document("ops", ["ops-chunk-0"], ["Error ERR-1042 means the pool is exhausted."])
+
+    hits = index.search("db.pool.max_size")
+    assert hits[0][0] == "cfg-chunk-1"
+    assert index.search("ERR-1042")[0][0] == "ops-chunk-0"
+
+    # Re-indexing a document drops chunks it no longer produces
+    index.replace_document("cfg", ["cfg-chunk-0"], ["Nothing about pools any more."])
+    assert all(chunk_id != "cfg-chunk-1" for chunk_id, _ in index.search("max_size"))
+    assert index.count() == 2
+
+    # Survives a restart without rebuilding
+    index.close()
+    assert SparseIndex(tmp_path / "sparse.db").search("ERR-1042")[0][0] == "ops-chunk-0"
+
+
+def _bm25(docs, query, k1=1.2, b=0.75):
+    """Reference BM25 over {chunk_id: text}."""
+    import math
+    from collections import Counter
+
+    tokenized = {cid: tokenize(text) for cid, text in docs.items()}
+    avg = sum(map(len, tokenized.values())) / len(tokenized)
+    scores = {}
+    for term in dict.fromkeys(tokenize(query)):
+        having = [cid for cid, toks in tokenized.items() if term in toks]
+        idf = math.log(1 + (len(docs) - len(having) + 0.5) / (len(having) + 0.5))
+        for cid in having:
+            tf = Counter(tokenized[cid])[term]
+            scores[cid] = scores.get(cid, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(tokenized[cid]) / avg))
+    return scores
+
+
+def test_sparse_index_keeps_corpus_stats_and_matches_reference_bm25(tmp_path):
+    index = SparseIndex(tmp_path / "sparse.db")
+    docs = {
+        "a-0": "pool size pool size limit", "a-1": "the connection pool", "b-0": "limit of the rate limiter",
+        "b-1": "unrelated text entirely", "c-0": "pool limit",
+    }
+    index.replace_document("a", ["a-0", "a-1"], [docs["a-0"], docs["a-1"]])
+    index.replace_document("b", ["b-0", "b-1", "x"], [docs["b-0"], docs["b-1"], "gone soon"])
+    # "x" moves to another document, then that document goes away
+    index.replace_document("c", ["c-0", "x"], [docs["c-0"], "moved"])
+    index.remove_document("c")
+    index.replace_document("c", ["c-0"], [docs["c-0"]])
+
+    stored = index._conn.execute("SELECT COUNT(*), SUM(length) FROM chunks").fetchone()
+    assert index._stats_locked() == stored == (5, sum(len(tokenize(t)) for t in docs.values()))
+
+    expected = _bm25(docs, "pool size limit")
+    hits = index.search("pool size limit", n_results=3)
+    assert [cid for cid, _ in hits] == sorted(expected, key=expected.get, reverse=True)[:3]
+    assert all(abs(score - expected[cid]) < 1e-9 for cid, score in hits)
+
+    # An index written before the stats existed gets them on open
+    index._conn.execute("DELETE FROM meta")
+    index._conn.commit()
+    index.close()
+    assert SparseIndex(tmp_path / "sparse.db").count() == 5
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c", "d"], ["d", "b", "e"]], k=60)
+    # Second in both lists beats first in only one
+    assert [doc_id for doc_id, _ in fused][:3] == ["b", "d", "a"]
+    assert fused[0][1] == 1 / 62 + 1 / 62
+
+
+def test_hybrid_search_fuses_dense_and_sparse(tmp_path):
+    sparse = SparseIndex(tmp_path / "sparse.db")
+    sparse.replace_document("ops", ["ops-chunk-0"], ["ERR-1042 pool exhausted"])
+
+    vector = MagicMock()
+    vector.search.return_value = [
+        {"id": "guide-chunk-3", "content": "Troubleshooting connection errors", "metadata": {}, "score": 0.71},
+    ]
+    vector.get_documents.return_value = {
+        "ops-chunk-0": {"content": "ERR-1042 pool exhausted", "metadata": {"file_path": "ops.md"}},
+    }
+
+    results = HybridSearchTool(vector, sparse).search("ERR-1042", n_results=5)
+
+    assert {r["id"] for r in results} == {"guide-chunk-3", "ops-chunk-0"}
+    lexical = next(r for r in results if r["id"] == "ops-chunk-0")
+    assert lexical["retrievers"] == ["sparse"]
+    assert "score" not in lexical
+    vector.get_documents.assert_called_once_with(["ops-chunk-0"])
@@ -0,0 +1,52 @@
+import pytest
+from pathlib import Path
+from kb_agent.connectors.local_file import LocalFileConnector
+from kb_agent.ingest import IngestStats, iter_converted
+
+
+@pytest.fixture
+def source_dir(tmp_path: Path) -> Path:
+    src = tmp_path / "source"
+    src.mkdir()
+    for i in range(5):
+        (src / f"doc{i}.md").write_text(f"# Doc {i}\n\nBody of document {i}.", encoding="utf-8")
+    (src / "ignored.bin").write_bytes(b"\x00\x01")
+    return src
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_iter_converted_yields_every_supported_file(source_dir, workers):
+    connector = LocalFileConnector(source_dir)
+    stats = IngestStats()
+
+    items = list(iter_converted(connector, connector.iter_files(), stats, workers=workers))
+
+    ids = sorted(doc["id"] for _, doc, _ in items)
+    assert ids == [f"doc{i}" for i in range(5)]
+    assert all(error is None for _, _, error in items)
+    assert stats.files_converted == 5
+    assert stats.files_failed == 0
+
+    doc = next(doc for _, doc, _ in items if doc["id"] == "doc3")
+    assert doc["content"] == "# Doc 3\n\nBody of document 3."
+    assert doc["metadata"]["path"] == str(source_dir / "doc3.md")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_spreadsheets_are_streamed_not_converted_in_the_pool(source_dir, workers):
+    (source_dir / "accounts.csv").write_text("account,balance\nA1,10\n", encoding="utf-8")
+    connector = LocalFileConnector(source_dir)
+
+    items = list(iter_converted(connector, connector.iter_files(), IngestStats(), workers=workers))
+
+    doc = next(doc for _, doc, _ in items if doc["id"] == "accounts")
+    assert "content" not in doc
+    assert "| A1 | 10 |" in "".join(doc["sections"])
+
+
+def test_ingest_stats_report():
+    stats = IngestStats(files_converted=10, convert_seconds=2.0, docs_embedded=10,
+                        chunks_embedded=40, embed_seconds=4.0, wall_seconds=5.0)
+    report = stats.report()
+    assert "5.0 files/s" in report
+    assert "10.0 chunks/s" in report
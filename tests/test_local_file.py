@@ -1,4 +1,5 @@
 import pytest
+from unittest.mock import MagicMock
 from pathlib import Path
 from kb_agent.connectors.local_file import LocalFileConnector
 
@@ -51,3 +52,152 @@ def test_pdf_extraction_structural_boundaries(tmp_path: Path):
     
     # Ensure they are separated cleanly
     assert content.count("## Page") == 2
+
+
+def _write_pdf(path: Path, texts):
+    import fitz
+
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page().insert_text(fitz.Point(50, 50), text)
+    doc.save(path)
+    doc.close()
+
+
+def test_pdf_page_cache_only_reextracts_changed_pages(tmp_path: Path):
+    from kb_agent.connectors.pdf_pages import PageTextCache, read_pdf_pages
+
+    cache = PageTextCache(tmp_path / "pages.db")
+    pdf_path = tmp_path / "report.pdf"
+    _write_pdf(pdf_path, ["Page one text.", "Page two text.", "Page three text."])
+
+    assert read_pdf_pages(pdf_path, cache=cache) == ["Page one text.", "Page two text.", "Page three text."]
+    assert (cache.hits, cache.misses) == (0, 3)
+
+    # Re-exported with one page edited
+    _write_pdf(pdf_path, ["Page one text.", "Page two, revised.", "Page three text."])
+    assert read_pdf_pages(pdf_path, cache=cache) == ["Page one text.", "Page two, revised.", "Page three text."]
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def _write_stamped_pdf(path: Path, text: str):
+    """One page whose text lives in a Form XObject; the page's own content stream only invokes it."""
+    import fitz
+
+    src = fitz.open()
+    src.new_page().insert_text(fitz.Point(50, 50), text)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.show_pdf_page(page.rect, src, 0)
+    doc.save(path)
+    doc.close()
+
+
+def test_pdf_page_digest_covers_form_xobjects_and_fonts(tmp_path: Path):
+    import fitz
+    from kb_agent.connectors.pdf_pages import PageTextCache, page_digest, read_pdf_pages
+
+    cache = PageTextCache(tmp_path / "pages.db")
+    pdf_path = tmp_path / "stamped.pdf"
+    _write_stamped_pdf(pdf_path, "Approved by finance.")
+    assert read_pdf_pages(pdf_path, cache=cache) == ["Approved by finance."]
+    _write_stamped_pdf(pdf_path, "Rejected by finance.")
+    assert read_pdf_pages(pdf_path, cache=cache) == ["Rejected by finance."]
+
+    _write_pdf(pdf_path, ["Page one text."])
+    with fitz.open(pdf_path) as doc:
+        before = page_digest(doc, 0)
+        font_xref = doc[0].get_fonts()[0][0]
+        cmap = doc.get_new_xref()
+        doc.update_object(cmap, "<<>>")
+        doc.update_stream(cmap, b"/CIDInit /ProcSet findresource begin 12 dict begin begincmap endcmap end end")
+        doc.xref_set_key(font_xref, "ToUnicode", f"{cmap} 0 R")
+        assert page_digest(doc, 0) != before
+
+
+def test_pdf_page_cache_evicts_least_recently_used(tmp_path: Path):
+    from kb_agent.connectors.pdf_pages import PageTextCache
+
+    cache = PageTextCache(tmp_path / "pages.db", max_bytes=3000)
+    cache.put_many({b"a": "x" * 1000, b"b": "y" * 1000})
+    cache.get_many([b"a"])  # a is now more recent than b
+    cache.put_many({b"c": "z" * 1500})
+
+    assert set(cache.get_many([b"a", b"b", b"c"])) == {b"a", b"c"}
+    assert cache.evictions == 1 and cache.size_bytes == 2500
+    cache.close()
+    assert PageTextCache(tmp_path / "pages.db", max_bytes=3000).size_bytes == 2500
+
+
+def test_pdf_parallel_extraction_keeps_page_order(tmp_path: Path, monkeypatch):
+    from kb_agent.connectors import pdf_pages
+
+    pdf_path = tmp_path / "big.pdf"
+    texts = [f"Content of page {i}." for i in range(9)]
+    _write_pdf(pdf_path, texts)
+
+    monkeypatch.setattr(pdf_pages, "PARALLEL_MIN_PAGES", 2)
+    assert pdf_pages.read_pdf_pages(pdf_path, workers=3) == texts
+
+
+def test_pdf_pool_is_spawned_and_not_nested(monkeypatch):
+    import multiprocessing
+    from kb_agent.connectors import pdf_pages
+
+    settings = MagicMock(pdf_extract_workers=4)
+    assert pdf_pages.default_workers(settings) == 4
+    monkeypatch.setattr(multiprocessing, "parent_process", lambda: object())
+    assert pdf_pages.default_workers(settings) == 1
+
+    contexts = []
+
+    class _Pool:
+        def __init__(self, max_workers, mp_context=None):
+            contexts.append(mp_context.get_start_method())
+            raise RuntimeError("no pool in this test")
+
+    monkeypatch.setattr(pdf_pages.concurrent.futures, "ProcessPoolExecutor", _Pool)
+    monkeypatch.setattr(pdf_pages, "extract_pages", lambda path, nums: [(n, f"page {n}") for n in nums])
+    assert pdf_pages.extract_pages_parallel("x.pdf", list(range(80)), workers=2)[79] == "page 79"
+    assert contexts == ["spawn"]
+
+
+def test_csv_is_fully_indexed_in_row_groups(tmp_path: Path):
+    from kb_agent.connectors.spreadsheet import iter_csv_markdown
+
+    csv_path = tmp_path / "accounts.csv"
+    lines = ["account,balance,note"] + [f"A{i:04d},{i}.50,ok" for i in range(120)]
+    lines[6] = "A0005,5.50,has | pipe"
+    csv_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    groups = list(iter_csv_markdown(csv_path, max_chars=10_000, max_rows=50))
+
+    assert [g.split("\n", 1)[0] for g in groups] == ["## Rows (rows 1-50)", "## Rows (rows 51-100)", "## Rows (rows 101-120)"]
+    for g in groups:
+        assert "| account | balance | note |\n| --- | --- | --- |" in g
+    body = "\n".join(groups)
+    assert "| A0119 | 119.50 | ok |" in body
+    assert "has \\| pipe" in body
+
+
+def test_xlsx_sheets_stream_with_char_budget(tmp_path: Path):
+    openpyxl = pytest.importorskip("openpyxl")
+    xlsx_path = tmp_path / "book.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Limits"
+    ws.append(["product", "daily_limit"])
+    for i in range(30):
+        ws.append([f"product-{i}", 1000.0 * i])
+    wb.create_sheet("Empty").append(["only", "header"])
+    wb.save(xlsx_path)
+
+    connector = LocalFileConnector(tmp_path)
+    content = connector.read_document(xlsx_path)["content"]
+    sections = content.split("\n\n## ")
+
+    assert "| product-29 | 29000 |" in content
+    limit_sections = [s for s in sections if "Sheet: Limits" in s]
+    assert len(limit_sections) > 1
+    assert all(len(s) <= 800 for s in limit_sections)
+    assert "Sheet: Empty (no rows)" in content
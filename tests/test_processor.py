@@ -35,6 +35,7 @@ def test_processor_process(MockChunker, MockVectorTool, tmp_path):
     }
     
     processor.process(data_short)
+    processor.flush()
     
     # Verify file was NOT written (assuming processor doesn't write anymore)
     assert not (tmp_path / "DOC-1.md").exists()
@@ -66,6 +67,7 @@ def test_processor_process(MockChunker, MockVectorTool, tmp_path):
     }
     
     processor.process(data_long)
+    processor.flush()
     
     # Verify file was NOT written
     assert not (tmp_path / "DOC-2.md").exists()
@@ -86,5 +88,189 @@ def test_processor_process(MockChunker, MockVectorTool, tmp_path):
     # Since we no longer add {doc_id}-summary independently, check the ids
     kwargs = mock_vector.add_documents.call_args.kwargs
     ids = kwargs.get("ids", [])
-    assert "DOC-2-chunk-0" in ids
+    assert len(ids) == 1 and ids[0].startswith("DOC-2-chunk-")
     assert "DOC-2-summary" not in ids
+
+
+@patch('kb_agent.processor.VectorTool')
+def test_processor_skips_unchanged_and_deletes_orphans(MockVectorTool, tmp_path):
+    mock_vector = MagicMock()
+    MockVectorTool.return_value = mock_vector
+
+    processor = Processor(docs_path=tmp_path)
+    processor.chunker.max_chars = 60
+    processor.chunker.overlap_chars = 0
+
+    long_doc = {
+        "id": "DOC-3",
+        "title": "Doc",
+        "content": "\n\n".join(f"## Section {i}\nParagraph number {i}." for i in range(4)),
+        "metadata": {"path": "/fake/DOC-3.md"},
+    }
+    assert processor.process(long_doc) > 1
+    processor.flush()
+    first_ids = mock_vector.add_documents.call_args.kwargs["ids"]
+    mock_vector.reset_mock()
+
+    # Unchanged content: nothing re-embedded, nothing deleted
+    assert processor.process(dict(long_doc)) == 0
+    processor.flush()
+    mock_vector.add_documents.assert_not_called()
+    mock_vector.delete_documents.assert_not_called()
+
+    # Shrunk document: the surviving chunk keeps its id (metadata refreshed, not
+    # re-embedded) and the chunks that disappeared are deleted as orphans
+    short_doc = dict(long_doc, content="## Section 0\nParagraph number 0.")
+    assert processor.process(short_doc) == 0
+    processor.flush()
+    mock_vector.add_documents.assert_not_called()
+    kept_ids, kept_metas = mock_vector.update_metadatas.call_args.args
+    assert kept_ids == [first_ids[0]] and kept_metas[0]["total_chunks"] == 1
+    mock_vector.delete_documents.assert_called_once_with(sorted(first_ids[1:]))
+
+    # The manifest survives a restart
+    restarted = Processor(docs_path=tmp_path)
+    restarted.chunker.max_chars = 60
+    restarted.chunker.overlap_chars = 0
+    assert restarted.process(dict(short_doc)) == 0
+
+
+@patch('kb_agent.processor.VectorTool')
+def test_processor_batches_chunks_across_documents(MockVectorTool, tmp_path):
+    mock_vector = MagicMock()
+    MockVectorTool.return_value = mock_vector
+
+    processor = Processor(docs_path=tmp_path)
+    processor.batcher.max_chunks = 3
+
+    for i in range(2):
+        processor.process({"id": f"JIRA-{i}", "title": f"Issue {i}", "content": "Short body.", "metadata": {}})
+    # Two one-chunk documents stay buffered below the batch limit
+    mock_vector.add_documents.assert_not_called()
+    assert processor.manifest.get("JIRA-0") is None
+
+    processor.process({"id": "JIRA-2", "title": "Issue 2", "content": "Short body.", "metadata": {}})
+    mock_vector.add_documents.assert_called_once()
+    ids = mock_vector.add_documents.call_args.kwargs["ids"]
+    assert [chunk_id.split("-chunk-")[0] for chunk_id in ids] == ["JIRA-0", "JIRA-1", "JIRA-2"]
+    assert processor.manifest.get("JIRA-0") is not None
+
+    processor.process({"id": "JIRA-3", "title": "Issue 3", "content": "Short body.", "metadata": {}})
+    assert processor.flush()
+    assert mock_vector.add_documents.call_count == 2
+
+
+
+@patch('kb_agent.processor.VectorTool')
+def test_failing_on_commit_does_not_skip_later_documents(MockVectorTool, tmp_path):
+    MockVectorTool.return_value = MagicMock()
+    processor = Processor(docs_path=tmp_path)
+
+    def _archive_fails():
+        raise OSError("archive is read-only")
+
+    processor.process({"id": "JIRA-0", "title": "Issue 0", "content": "Short body.", "metadata": {}}, on_commit=_archive_fails)
+    processor.process({"id": "JIRA-1", "title": "Issue 1", "content": "Short body.", "metadata": {}})
+    assert processor.flush()
+    assert processor.manifest.get("JIRA-0") is not None
+    assert processor.manifest.get("JIRA-1") is not None
+    assert processor.sparse_index.has_document("JIRA-1")
+
+
+@patch('kb_agent.processor.VectorTool')
+def test_processor_only_embeds_edited_chunks(MockVectorTool, tmp_path):
+    mock_vector = MagicMock()
+    MockVectorTool.return_value = mock_vector
+
+    processor = Processor(docs_path=tmp_path)
+    processor.chunker.max_chars = 80
+    processor.chunker.overlap_chars = 0
+
+    sections = [f"## Section {i}\nParagraph number {i}." for i in range(6)]
+    doc = {"id": "PAGE-1", "title": "Page", "content": "\n\n".join(sections), "metadata": {}}
+    assert processor.process(doc) == 6
+    processor.flush()
+    first_ids = mock_vector.add_documents.call_args.kwargs["ids"]
+    mock_vector.reset_mock()
+
+    # A new section near the top shifts every chunk index but only adds one chunk
+    edited = dict(doc, content="\n\n".join(sections[:1] + ["## Inserted\nA brand new paragraph."] + sections[1:]))
+    assert processor.process(edited) == 1
+    processor.flush()
+    added_ids = mock_vector.add_documents.call_args.kwargs["ids"]
+    assert len(added_ids) == 1 and added_ids[0] not in first_ids
+    assert "A brand new paragraph." in mock_vector.add_documents.call_args.kwargs["documents"][0]
+    kept_ids, kept_metas = mock_vector.update_metadatas.call_args.args
+    assert kept_ids == first_ids
+    assert [m["chunk_index"] for m in kept_metas] == [0, 2, 3, 4, 5, 6]
+    mock_vector.delete_documents.assert_not_called()
+
+
+@patch('kb_agent.processor.VectorTool')
+def test_streamed_sections_index_like_the_joined_document(MockVectorTool, tmp_path):
+    groups = [f"## Rows (rows {i * 3 + 1}-{i * 3 + 3})\n\n| a | b |\n| --- | --- |\n" +
+              "\n".join(f"| r{i * 3 + j} | {j} |" for j in range(3)) for i in range(4)]
+
+    def _index(docs_path, doc):
+        vector = MagicMock()
+        MockVectorTool.return_value = vector
+        processor = Processor(docs_path=docs_path)
+        processor.chunker.max_chars = 80
+        processor.chunker.overlap_chars = 0
+        count = processor.process(doc)
+        processor.flush()
+        return processor, vector, count
+
+    joined, joined_vector, joined_count = _index(tmp_path / "joined", {"id": "SHEET", "title": "Sheet", "content": "\n\n".join(groups), "metadata": {"path": "/fake/SHEET.md"}})
+    consumed = []
+    streamed, vector, count = _index(tmp_path / "streamed", {"id": "SHEET", "title": "Sheet", "sections": (consumed.append(g) or g for g in groups), "metadata": {"path": "/fake/SHEET.md"}})
+
+    assert consumed == groups and count == joined_count > 1
+    assert vector.add_documents.call_args.kwargs["ids"] == joined_vector.add_documents.call_args.kwargs["ids"]
+    assert streamed.manifest.get("SHEET").content_hash == joined.manifest.get("SHEET").content_hash
+    assert streamed.manifest.get("SHEET").chunk_ids == joined.manifest.get("SHEET").chunk_ids
+    assert streamed.sparse_index.count() == len(streamed.manifest.get("SHEET").chunk_ids)
+    assert [hit for hit, _ in streamed.sparse_index.search("r7")] == [hit for hit, _ in joined.sparse_index.search("r7")]
+
+    # Unchanged: nothing re-embedded; one group edited: only its chunks are
+    vector.reset_mock()
+    assert streamed.process({"id": "SHEET", "title": "Sheet", "sections": iter(groups), "metadata": {"path": "/fake/SHEET.md"}}) == 0
+    edited = groups[:2] + [groups[2].replace("| r7 |", "| r7-edited |")] + groups[3:]
+    assert 0 < streamed.process({"id": "SHEET", "title": "Sheet", "sections": iter(edited), "metadata": {"path": "/fake/SHEET.md"}}) < count
+    streamed.flush()
+    assert any("r7-edited" in d for d in vector.add_documents.call_args.kwargs["documents"])
+    assert streamed.sparse_index.search("r7-edited") and streamed.sparse_index.count() == len(streamed.manifest.get("SHEET").chunk_ids)
+    assert streamed.sparse_index.has_document("SHEET") and not streamed.sparse_index.has_document("SHEET\x00staging")
+
+
+def test_content_chunk_ids_are_stable_and_unique():
+    from kb_agent.chunking import Chunk, content_chunk_ids
+
+    a = Chunk("Same text", {"section_title": "A"})
+    b = Chunk("Same text", {"section_title": "A"})
+    c = Chunk("Same text", {"section_title": "B"})
+    d = Chunk("Same  text", {"section_title": "A"})
+    ids = content_chunk_ids("DOC", [a, b, c, d])
+    # Duplicates get an ordinal; another section or a whitespace change is another chunk
+    assert ids[1] == ids[0] + "-1"
+    assert ids[2] != ids[0]
+    assert ids[3] not in (ids[0], ids[1])
+    assert content_chunk_ids("DOC", [c]) == [ids[2]]
+
+
+@patch('kb_agent.processor.VectorTool')
+def test_whitespace_only_edit_replaces_the_stored_chunk(MockVectorTool, tmp_path):
+    mock_vector = MagicMock()
+    MockVectorTool.return_value = mock_vector
+    processor = Processor(docs_path=tmp_path)
+
+    doc = {"id": "CFG", "title": "Config", "content": "## Pool\n\n    max_size: 10", "metadata": {}}
+    processor.process(doc)
+    processor.flush()
+    first_ids = mock_vector.add_documents.call_args.kwargs["ids"]
+    mock_vector.reset_mock()
+
+    processor.process(dict(doc, content="## Pool\n\n        max_size: 10"))
+    processor.flush()
+    assert "        max_size: 10" in mock_vector.add_documents.call_args.kwargs["documents"][0]
+    mock_vector.delete_documents.assert_called_once_with(first_ids)
@@ -0,0 +1,89 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from kb_agent.registry import ResourceRegistry
+
+
+def test_get_or_create_builds_each_key_once_under_concurrency():
+    reg = ResourceRegistry()
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(reg.get_or_create("model", factory))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_shutdown_closes_resources_and_reloads_on_next_use():
+    reg = ResourceRegistry()
+    first = MagicMock()
+    assert reg.get_or_create("x", lambda: first) is first
+
+    reg.shutdown()
+    first.close.assert_called_once()
+
+    second = MagicMock()
+    assert reg.get_or_create("x", lambda: second) is second
+
+
+def test_vector_tools_share_client_embedding_function_and_collection(tmp_path, monkeypatch):
+    from kb_agent.tools.vector_tool import VectorTool
+
+    monkeypatch.chdir(tmp_path)
+
+    with patch("kb_agent.tools.vector_tool.config.settings", None), \
+         patch("kb_agent.tools.vector_tool.chromadb.PersistentClient") as client_cls, \
+         patch("kb_agent.tools.vector_tool._create_embedding_function") as create_ef:
+        create_ef.return_value = MagicMock()
+        a = VectorTool()
+        b = VectorTool()
+
+    assert client_cls.call_count == 1
+    assert create_ef.call_count == 1
+    assert a.collection is b.collection
+
+
+def test_warmup_runs_the_model_past_the_embedding_cache(tmp_path):
+    from kb_agent.tools.embedding_cache import CachedEmbeddingFunction, EmbeddingCache, cache_key
+
+    inner = MagicMock(return_value=[[0.5, 0.5]])
+    cache = EmbeddingCache(tmp_path / "emb.db")
+    cache.put_many({cache_key("m", "warmup"): [0.5, 0.5]})
+    vector = MagicMock(embedding_function=CachedEmbeddingFunction(inner, cache, "m"))
+
+    with patch("kb_agent.agent.tools._get_vector", return_value=vector):
+        ResourceRegistry().warmup(reranker=False, graph=False)
+
+    inner.assert_called_once_with(["warmup"])
+    cache.close()
+
+
+def test_reranker_reloads_when_model_settings_change():
+    from kb_agent.tools.reranker import reranker_client
+
+    reg = ResourceRegistry()
+    settings = MagicMock(use_reranker=True, reranker_backend="llama_cpp", reranker_model_path="/models/a.gguf")
+    models = iter([MagicMock(name="a"), MagicMock(name="b")])
+    with patch("kb_agent.tools.reranker.config.settings", settings), \
+         patch.object(reranker_client, "_create_llama", side_effect=lambda: next(models)):
+        try:
+            first = reg.reranker().llm
+            assert reg.reranker().llm is first
+
+            settings.reranker_model_path = "/models/b.gguf"
+            second = reg.reranker().llm
+            assert second is not first
+            first.close.assert_called_once()
+        finally:
+            reranker_client.close()
@@ -0,0 +1,192 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from kb_agent.tools.reranker import RerankClient, first_stage_scores
+
+
+class FakeLlama:
+    """Scores a pair by the length of its chunk text."""
+
+    def __init__(self, supports_batches=True):
+        self.supports_batches = supports_batches
+        self.calls = []
+
+    def create_embedding(self, prompt):
+        self.calls.append(prompt)
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        if isinstance(prompt, list) and not self.supports_batches:
+            raise RuntimeError("invalid seq_id")
+        data = [{"index": i, "embedding": [float(len(p))]} for i, p in enumerate(prompts)]
+        # llama.cpp doesn't promise output order
+        return {"data": list(reversed(data))}
+
+
+@pytest.fixture
+def settings():
+    with patch("kb_agent.tools.reranker.config.settings", new_callable=MagicMock) as s:
+        s.use_reranker = True
+        s.rerank_batch_size = 4
+        yield s
+
+
+def _chunks(n):
+    return [{"id": i, "content": "x" * (i + 1)} for i in range(n)]
+
+
+def test_rerank_sync_scores_in_batches(settings):
+    client = RerankClient()
+    client.llm = FakeLlama()
+
+    top = client.rerank_sync("q", _chunks(10), top_n=3)
+
+    assert [c["id"] for c in top] == [9, 8, 7]
+    assert [len(call) for call in client.llm.calls] == [4, 4, 2]
+
+
+def test_rerank_sync_falls_back_to_per_chunk_loop(settings):
+    client = RerankClient()
+    client.llm = FakeLlama(supports_batches=False)
+
+    top = client.rerank_sync("q", _chunks(5), top_n=2)
+
+    assert [c["id"] for c in top] == [4, 3]
+    assert not client._batching
+    assert sum(isinstance(call, str) for call in client.llm.calls) == 5
+
+
+def test_batch_size_one_keeps_per_chunk_scoring(settings):
+    settings.rerank_batch_size = 1
+    client = RerankClient()
+    client.llm = FakeLlama()
+
+    client.rerank_sync("q", _chunks(3))
+
+    assert all(isinstance(call, str) for call in client.llm.calls)
+
+
+def test_onnx_cross_encoder_batches_pairs_and_keeps_order():
+    import numpy as np
+    from types import SimpleNamespace
+    from kb_agent.tools.reranker import ONNXCrossEncoder
+
+    encoder = ONNXCrossEncoder.__new__(ONNXCrossEncoder)
+    encoder.valid_input_names = ["input_ids", "attention_mask"]
+    encoder.tokenizer = MagicMock()
+    encoder.tokenizer.encode_batch.side_effect = lambda pairs: [
+        SimpleNamespace(ids=[len(text)] * len(text), attention_mask=[1] * len(text), type_ids=[])
+        for _, text in pairs
+    ]
+    shapes = []
+
+    def run(_, inputs):
+        shapes.append(inputs["input_ids"].shape)
+        return [inputs["input_ids"][:, :1].astype(np.float32)]
+
+    encoder.session = MagicMock()
+    encoder.session.run.side_effect = run
+
+    texts = ["aaaa", "a", "aaa", "aa", "aaaaa"]
+    assert encoder.score("q", texts, batch_size=2) == [4.0, 1.0, 3.0, 2.0, 5.0]
+    assert shapes == [(2, 2), (2, 4), (1, 5)]
+
+
+def test_onnx_backend_is_selected_by_config(settings):
+    settings.reranker_backend = "onnx"
+    settings.reranker_onnx_path = "/models/reranker-onnx"
+    fake_encoder = MagicMock()
+    fake_encoder.score.return_value = [0.1, 0.9]
+
+    with patch("kb_agent.tools.reranker.ONNXCrossEncoder", return_value=fake_encoder) as cls:
+        client = RerankClient()
+        client.load_sync()
+        top = client.rerank_sync("q", _chunks(2), top_n=1)
+
+    cls.assert_called_once_with("/models/reranker-onnx")
+    assert client.llm is None
+    assert [c["id"] for c in top] == [1]
+    fake_encoder.score.assert_called_once_with("q", ["x", "xx"], 4)
+
+
+def test_score_cache_only_scores_new_chunks(settings):
+    client = RerankClient()
+    client.llm = FakeLlama()
+    chunks = _chunks(4)
+
+    client.rerank_sync("What is  the Pool size?", chunks, top_n=2)
+    assert client.last_call_stats == (0, 4)
+
+    client.llm.calls.clear()
+    # Same query modulo case/whitespace, two chunks seen before, one new
+    top = client.rerank_sync("what is the pool size?", chunks[2:] + [{"id": 9, "content": "y" * 20}], top_n=2)
+
+    assert [c["id"] for c in top] == [9, 3]
+    assert client.last_call_stats == (2, 1)
+    assert client.llm.calls == ["<s>what is the pool size?</s></s>" + "y" * 20 + "</s>"]
+    assert client.score_cache.stats()["hits"] == 2
+
+
+def test_score_cache_is_bounded_and_skips_failures(settings):
+    settings.rerank_cache_size = 2
+    client = RerankClient()
+    client.llm = FakeLlama()
+
+    client.score("q", _chunks(3))
+    assert len(client.score_cache) == 2
+
+    client.llm = MagicMock()
+    client.llm.create_embedding.side_effect = RuntimeError("boom")
+    settings.rerank_batch_size = 1
+    assert client.score("other", _chunks(1)) == [-999.0]
+    assert len(client.score_cache) == 2
+
+
+def test_first_stage_scores_combine_similarity_and_overlap():
+    scores = first_stage_scores("pool size limit", [
+        {"content": "the pool size limit is 50", "score": 0.8},
+        {"content": "unrelated text", "score": 0.8},
+        {"content": "pool size"},  # no retriever similarity
+    ])
+    assert scores[0] == pytest.approx(0.9)
+    assert scores[1] == pytest.approx(0.4)
+    assert scores[2] == pytest.approx(2 / 3)
+
+
+def test_cascade_only_cross_encodes_first_stage_survivors(settings):
+    client = RerankClient()
+    client.llm = FakeLlama()
+    chunks = [{"id": i, "content": f"pool size {'x' * i}" if i < 3 else f"noise {i}", "score": 0.5} for i in range(10)]
+
+    top, stats = client.rerank_cascade_sync("pool size", chunks, top_n=2, first_stage_k=4)
+
+    scored = sum(len(call) if isinstance(call, list) else 1 for call in client.llm.calls)
+    assert scored == 4
+    assert stats["candidates"] == 10 and stats["first_stage_kept"] == 4
+    assert "first_stage_ms" in stats and "cross_encoder_ms" in stats
+    assert [c["id"] for c in top] == [2, 1]
+
+
+def test_cascade_early_exit_skips_cross_encoder(settings):
+    client = RerankClient()
+    client.llm = FakeLlama()
+    chunks = [{"id": 0, "content": "pool size", "score": 0.9}] + [
+        {"id": i, "content": f"noise {i}", "score": 0.1} for i in range(1, 6)
+    ]
+
+    top, stats = client.rerank_cascade_sync("pool size", chunks, top_n=1, first_stage_k=3, early_exit_margin=0.3)
+
+    assert stats["early_exit"]
+    assert [c["id"] for c in top] == [0]
+    assert client.llm.calls == []
+
+
+def test_cascade_does_not_report_stats_of_a_previous_call(settings):
+    client = RerankClient()
+    client.llm = FakeLlama()
+    client.rerank_cascade_sync("pool size", _chunks(3), top_n=2)
+    assert client.last_call_stats == (0, 3)
+
+    client.llm = None
+    _, stats = client.rerank_cascade_sync("pool size", _chunks(3), top_n=2)
+    assert client.last_call_stats == (0, 0)
+    assert (stats["cache_hits"], stats["cache_misses"]) == (0, 0)
@@ -0,0 +1,82 @@
+import shutil
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import kb_agent.config as config
+from kb_agent.cli import run_indexing
+
+
+@pytest.fixture
+def index_env(tmp_path):
+    settings = config.Settings(data_folder=tmp_path, grep_index_enabled=False)
+    settings.source_docs_path.mkdir(parents=True)
+    vector = MagicMock()
+    vector.embedding_cache = None
+    vector.add_documents.return_value = True
+    with patch("kb_agent.cli.load_settings", lambda: settings), \
+         patch.object(config, "settings", settings), \
+         patch("kb_agent.processor.VectorTool", return_value=vector):
+        yield settings, vector
+
+
+def test_second_run_skips_unchanged_sources_by_stat(index_env, capsys):
+    settings, vector = index_env
+    (settings.source_docs_path / "guide.md").write_text("# Guide\n\nHow to deploy.", encoding="utf-8")
+
+    run_indexing()
+    assert (settings.archive_path / "guide.md").exists()
+    assert not (settings.source_docs_path / "guide.md").exists()
+    assert vector.add_documents.call_count == 1
+
+    # Dropping the archived file back in (rename keeps size and mtime) must not even convert it
+    shutil.move(str(settings.archive_path / "guide.md"), str(settings.source_docs_path / "guide.md"))
+    capsys.readouterr()
+    with patch("kb_agent.connectors.local_file.LocalFileConnector.read_document") as read_document:
+        run_indexing()
+    read_document.assert_not_called()
+    assert "Skipping unchanged guide" in capsys.readouterr().out
+    assert vector.add_documents.call_count == 1
+
+
+def test_failed_upsert_keeps_source_for_retry(index_env):
+    settings, vector = index_env
+    (settings.source_docs_path / "guide.md").write_text("# Guide\n\nHow to deploy.", encoding="utf-8")
+    vector.add_documents.return_value = False
+
+    run_indexing()
+    assert (settings.source_docs_path / "guide.md").exists()
+    assert not (settings.archive_path / "guide.md").exists()
+
+    vector.add_documents.return_value = True
+    run_indexing()
+    assert (settings.archive_path / "guide.md").exists()
+
+
+def test_final_flush_failure_does_not_abort_the_run(index_env, capsys):
+    settings, vector = index_env
+    (settings.source_docs_path / "guide.md").write_text("# Guide\n\nHow to deploy.", encoding="utf-8")
+    vector.add_documents.side_effect = RuntimeError("chroma went away")
+
+    with patch("kb_agent.graph.graph_builder.GraphBuilder") as builder:
+        run_indexing()
+    builder.return_value.build_graph.assert_called_once()
+    out = capsys.readouterr().out
+    assert "Final vector store upsert failed: chroma went away" in out
+    assert "Indexing complete." in out
+    assert (settings.source_docs_path / "guide.md").exists()
+
+
+def test_spreadsheets_are_streamed_into_the_index(index_env):
+    from kb_agent.connectors.local_file import LocalFileConnector
+
+    settings, vector = index_env
+    csv_path = settings.source_docs_path / "accounts.csv"
+    csv_path.write_text("account,balance\n" + "".join(f"A{i},{i}\n" for i in range(200)), encoding="utf-8")
+    expected = LocalFileConnector(settings.source_docs_path).read_document(csv_path)["content"]
+
+    with patch("kb_agent.connectors.local_file.LocalFileConnector._read_spreadsheet", side_effect=AssertionError("joined")):
+        run_indexing()
+    assert (settings.index_path / "accounts.md").read_text(encoding="utf-8") == expected
+    assert any("| A199 | 199 |" in d for call in vector.add_documents.call_args_list for d in call.kwargs["documents"])
+    assert (settings.archive_path / "accounts.csv").exists()
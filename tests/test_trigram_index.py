@@ -0,0 +1,105 @@
+import os
+from unittest.mock import MagicMock, patch
+
+from kb_agent.tools.grep_tool import GrepTool
+from kb_agent.tools.trigram_index import TrigramIndex, required_literals
+
+
+def test_required_literals():
+    assert required_literals("max_pool_size") == ["max_pool_size"]
+    assert required_literals(r"ERR-\d+ timeout") == ["ERR-", " timeout"]
+    assert required_literals(r"colou?r\.yml") == ["colo", "r.yml"]
+    assert required_literals("foo|bar") is None
+    assert required_literals("(ab)+c") is None
+
+
+def _write_doc(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_trigram_search_builds_rg_style_passages(tmp_path):
+    lines = [f"line {i}" for i in range(1, 81)]
+    lines[4] = "Set DB.POOL.MAX_SIZE to 50"
+    lines[19] = "db.pool.max_size is also read by the worker"
+    lines[74] = "later: db.pool.max_size default"
+    _write_doc(tmp_path / "config.md", lines)
+    _write_doc(tmp_path / "other.md", ["nothing relevant here"])
+
+    index = TrigramIndex(tmp_path, refresh_interval=0)
+    results = index.search(r"db\.pool\.max_size")
+
+    # ±10 lines of context; matches 5 and 20 share a passage, 75 is more than 20 lines away
+    assert [r["line"] for r in results] == [5, 75]
+    assert all(r["file_path"] == str(tmp_path / "config.md") for r in results)
+    assert results[0]["content"].splitlines() == lines[0:30]
+    assert results[1]["content"].splitlines() == lines[64:80]
+
+
+def test_grep_tool_uses_index_and_falls_back_for_alternation(tmp_path):
+    _write_doc(tmp_path / "a.md", ["ERR-1042 pool exhausted"])
+    settings = MagicMock(index_path=tmp_path, grep_index_enabled=True)
+    with patch("kb_agent.tools.grep_tool.config.settings", settings):
+        tool = GrepTool()
+        with patch.object(GrepTool, "_ripgrep_search", side_effect=AssertionError("rg should not run")):
+            assert [r["line"] for r in tool.search("err-1042")] == [1]
+        with patch("kb_agent.tools.grep_tool.shutil.which", return_value=None):
+            assert [r["line"] for r in tool.search("ERR-1042|nothing")] == [1]
+
+
+def test_trigram_index_refreshes_changed_and_deleted_files(tmp_path):
+    doc = tmp_path / "a.md"
+    _write_doc(doc, ["alpha beta"])
+    # In-place rewrites leave the directory mtime alone: only a full rescan sees them
+    index = TrigramIndex(tmp_path, refresh_interval=0, full_rescan_interval=0)
+    assert index.search("gamma delta") == []
+
+    _write_doc(doc, ["gamma delta", "more text"])
+    assert [r["line"] for r in index.search("gamma delta")] == [1]
+
+    doc.unlink()
+    assert index.search("gamma delta") == []
+    assert index.search("a|b") is None
+
+
+def test_trigram_index_folds_case_like_re_ignorecase(tmp_path):
+    _write_doc(tmp_path / "a.md", ["\u0130STANBUL office", "\u017ftatus page"])
+    index = TrigramIndex(tmp_path, refresh_interval=0)
+
+    assert [r["line"] for r in index.search("istanbul office")] == [1]
+    assert [r["line"] for r in index.search("STATUS")] == [2]
+    # Non-ASCII literals are left to rg
+    assert index.search("\u0130stanbul") is None
+
+
+def test_quick_refresh_only_rescans_changed_directories(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        _write_doc(tmp_path / name / "doc.md", [f"{name} original text"])
+    index = TrigramIndex(tmp_path, refresh_interval=0, full_rescan_interval=3600)
+    assert index.search("original text") is not None
+
+    scanned = []
+    real_scandir = os.scandir
+
+    def _scandir(path):
+        scanned.append(os.fspath(path))
+        return real_scandir(path)
+
+    with patch("kb_agent.tools.trigram_index.os.scandir", _scandir):
+        index.refresh()
+        assert scanned == []
+
+        (tmp_path / "b" / "doc.md").unlink()
+        (tmp_path / "b" / "new").mkdir()
+        _write_doc(tmp_path / "b" / "new" / "added.md", ["freshly added text"])
+        assert [r["file_path"] for r in index.search("original text")] == [str(tmp_path / "a" / "doc.md")]
+        assert [r["file_path"] for r in index.search("freshly added")] == [str(tmp_path / "b" / "new" / "added.md")]
+        assert str(tmp_path / "a") not in scanned
+
+        scanned.clear()
+        _write_doc(tmp_path / "a" / "doc.md", ["a rewritten in place"])
+        assert index.search("rewritten in place") == []
+        assert scanned == []
+
+        index.refresh(force=True)
+        assert [r["line"] for r in index.search("rewritten in place")] == [1]
@@ -65,3 +65,54 @@ def test_vector_tool_similarity_threshold_filtering(mock_config, mock_chroma):
     assert len(results) == 1
     assert results[0]["id"] == "doc1"
     assert round(results[0]["score"], 2) == 0.9
+
+def test_vector_tool_add_documents_splits_under_max_batch_size(mock_config, mock_chroma):
+    """Upserts larger than Chroma's max batch size are split into several calls."""
+    tool = VectorTool()
+    tool.client.get_max_batch_size.return_value = 2
+
+    assert tool.add_documents(["a", "b", "c"], [{}, {}, {}], ["1", "2", "3"])
+    assert [c.kwargs["ids"] for c in mock_chroma.upsert.call_args_list] == [["1", "2"], ["3"]]
+
+def test_onnx_embedding_buckets_by_length_and_restores_order():
+    """Inputs are batched by token length under the budget and returned in input order."""
+    import numpy as np
+    from types import SimpleNamespace
+    from kb_agent.tools.vector_tool import ONNXEmbeddingFunction
+
+    ef = ONNXEmbeddingFunction.__new__(ONNXEmbeddingFunction)
+    ef.max_batch_tokens = 12
+    ef.valid_input_names = ["input_ids", "attention_mask"]
+    ef.tokenizer = MagicMock()
+    ef.tokenizer.encode_batch.side_effect = lambda texts: [
+        SimpleNamespace(ids=[len(t)] * len(t), attention_mask=[1] * len(t), type_ids=[0] * len(t))
+        for t in texts
+    ]
+
+    shapes = []
+
+    def run(_, inputs):
+        ids = inputs["input_ids"]
+        shapes.append(ids.shape)
+        assert ids.dtype == np.int64
+        # CLS embedding = [text length, 1] (the fake tokenizer puts the length in every id)
+        cls = ids[:, :1].astype(np.float32)
+        return [np.concatenate([cls, np.ones_like(cls)], axis=1)[:, None, :]]
+
+    ef.session = MagicMock()
+    ef.session.run.side_effect = run
+
+    texts = ["aaaaaaaa", "a", "aaa", "aa", "aaaaaaa"]
+    result = ef(texts)
+
+    assert shapes == [(3, 3), (1, 7), (1, 8)]
+    ratios = [round(vec[0] / vec[1]) for vec in result]
+    assert ratios == [len(t) for t in texts]
+
+def test_length_buckets_respect_token_and_row_limits():
+    from kb_agent.tools.onnx_batching import length_buckets
+
+    lengths = [8, 1, 3, 2, 7]
+    assert length_buckets(lengths) == [[1, 3, 2, 4, 0]]
+    assert length_buckets(lengths, max_tokens=12) == [[1, 3, 2], [4], [0]]
+    assert length_buckets(lengths, max_rows=2) == [[1, 3], [2, 4], [0]]